@@ -5,6 +5,23 @@ const FILTER_CACHE_TTL_MS = 10 * 60 * 1000;
 
 const countCache = new Map();
 const COUNT_CACHE_TTL_MS = 5 * 60 * 1000;
+
+// Longest language/subject kept in filter_cube (MAX_CUBE_VALUE in scrap/filter_cube.py)
+const MAX_CUBE_VALUE = 255;
+
+const ITEM_COLUMNS = `
+      identifier,
+      title,
+      description,
+      language,
+      item_size,
+      downloads,
+      btih,
+      mediatype,
+      subject,
+      publicdate,
+      url`;
+
 export async function getFilteredContent(mediatype, filters) {
     const {
         language,
@@ -86,7 +103,7 @@ export async function getFilteredContent(mediatype, filters) {
         params.push(likeTerm, likeTerm);
 
         conditions.push(`(
-            search_tsv @@ websearch_to_tsquery('simple', ${tsParam})
+            search_tsv @@ websearch_to_tsquery(search_tsv_config(), ${tsParam})
             OR LOWER(title) LIKE LOWER(${likeParamTitle})
             OR LOWER(description) LIKE LOWER(${likeParamDesc})
         )`);
@@ -98,27 +115,26 @@ export async function getFilteredContent(mediatype, filters) {
     const limitNum = parseInt(limit);
     const offset = (pageNum - 1) * limitNum;
 
+    // Unfiltered category pages read the precomputed rank: any page is a
+    // range seek on (mediatype, rank) instead of an OFFSET scan. The rank
+    // freshness check rides along in the same query and everything below
+    // starts without waiting for it; only a stale rank falls back to OFFSET.
+    const rankedPromise = conditions.length === 1
+        ? fetchRankedPage(mediatype, offset, limitNum)
+        : Promise.resolve(null);
+
     const dataQuery = `
-    SELECT 
-      identifier,
-      title,
-      description,
-      language,
-      item_size,
-      downloads,
-      btih,
-      mediatype,
-      subject,
-      publicdate,
-      url
+    SELECT ${ITEM_COLUMNS}
     FROM archive_items
     ${whereClause}
     ORDER BY downloads DESC, publicdate DESC, identifier
     LIMIT $${paramIndex++} OFFSET $${paramIndex++}
   `;
-
     const dataParams = [...params, limitNum, offset];
-    const dataPromise = query(dataQuery, dataParams);
+
+    const dataPromise = rankedPromise.then(ranked =>
+        ranked !== null ? ranked : query(dataQuery, dataParams)
+    );
 
     const countKey = JSON.stringify({
         mediatype,
@@ -133,11 +149,25 @@ export async function getFilteredContent(mediatype, filters) {
     });
 
     const countPromise = (async () => {
+        const ranked = await rankedPromise;
+        if (ranked !== null) {
+            return ranked.total;
+        }
+
         const cachedCount = countCache.get(countKey);
         if (cachedCount && cachedCount.expires > Date.now()) {
             return cachedCount.value;
         }
 
+        const cubeCount = await fetchCubeCount(mediatype, filters);
+        if (cubeCount !== null) {
+            countCache.set(countKey, {
+                value: cubeCount,
+                expires: Date.now() + COUNT_CACHE_TTL_MS
+            });
+            return cubeCount;
+        }
+
         const countQuery = `SELECT COUNT(*) as total FROM archive_items ${whereClause}`;
         const countResult = await query(countQuery, [...params]);
         const totalVal = parseInt(countResult.rows[0].total);
@@ -187,6 +217,100 @@ export async function getFilteredContent(mediatype, filters) {
     };
 }
 
+/**
+ * One page of an unfiltered category read by rank (see refresh_ranks in
+ * scrap/import_to_db.py) as { rows, total }, or null while its ranks are out
+ * of date: rows changed since the last refresh (rank_dirty) or ranks freed by
+ * deleted rows (rank_gaps). The check and the page share one snapshot; a fresh
+ * rank past the last page comes back as a single row without an item.
+ */
+async function fetchRankedPage(mediatype, offset, limit) {
+    try {
+        const result = await query(
+            `
+            WITH state AS (
+              SELECT ranked_rows
+              FROM rank_state
+              WHERE mediatype = $1
+                AND NOT EXISTS (SELECT 1 FROM archive_items WHERE mediatype = $1 AND rank_dirty)
+                AND NOT EXISTS (SELECT 1 FROM rank_gaps WHERE mediatype = $1)
+            )
+            SELECT state.ranked_rows, page.*
+            FROM state
+            LEFT JOIN LATERAL (
+              SELECT rank, ${ITEM_COLUMNS}
+              FROM archive_items
+              WHERE mediatype = $1 AND rank > $2 AND rank <= $3
+            ) page ON true
+            ORDER BY page.rank
+          `,
+            [mediatype, offset, offset + limit]
+        );
+        if (!result.rows.length) {
+            return null;
+        }
+        return {
+            rows: result.rows.filter(row => row.rank !== null),
+            total: parseInt(result.rows[0].ranked_rows)
+        };
+    } catch (err) {
+        console.warn('Rank lookup failed, falling back to OFFSET paging:', err.message);
+        return null;
+    }
+}
+
+/**
+ * Exact count for a language/year/single-subject filter combination from
+ * filter_cube (built by scrap/filter_cube.py after every import), or null when
+ * the combination is outside the cube and has to be counted live.
+ */
+async function fetchCubeCount(mediatype, filters) {
+    const { language, subject, year, downloadsMin, downloadsMax, sizeMin, sizeMax, search } = filters;
+    if (downloadsMin || downloadsMax || sizeMin || sizeMax || search) {
+        return null;
+    }
+
+    const subjects = subject ? (Array.isArray(subject) ? subject : [subject]) : [];
+    if (subjects.length > 1) {
+        return null;
+    }
+    const cubeSubject = subjects.length ? subjects[0] : '';
+    const cubeLanguage = language || '';
+    if (cubeSubject.length > MAX_CUBE_VALUE || cubeLanguage.length > MAX_CUBE_VALUE) {
+        return null;
+    }
+
+    // Same rule as the year condition above; 0 is the cube's "any year"
+    const yearNum = year ? parseInt(year) : NaN;
+    if (yearNum === 0) {
+        return null;
+    }
+    const cubeYear = isNaN(yearNum) ? 0 : yearNum;
+
+    try {
+        // No row for the subject alone: the subject is not among the cube's top
+        // subjects, or the cube was never built. Otherwise a missing row means 0.
+        const result = await query(
+            `
+            SELECT
+              (SELECT item_count FROM filter_cube
+               WHERE mediatype = $1 AND language = '' AND year = 0 AND subject = $4) AS subject_total,
+              (SELECT item_count FROM filter_cube
+               WHERE mediatype = $1 AND language = LOWER($2) AND year = $3 AND subject = $4) AS total
+          `,
+            [mediatype, cubeLanguage, cubeYear, cubeSubject]
+        );
+        const { subject_total, total } = result.rows[0];
+        if (subject_total === null) {
+            return null;
+        }
+        return total === null ? 0 : parseInt(total);
+    } catch (err) {
+        console.warn('filter_cube lookup failed, counting live:', err.message);
+        return null;
+    }
+}
+
 /**
  * Get filter options (languages, subjects, years) using lightweight lookup tables when available.
  * Falls back to live queries filtered by mediatype.
@@ -39,29 +39,108 @@ CREATE INDEX IF NOT EXISTS idx_archive_items_media_downloads_date_id
 ALTER TABLE archive_items 
     ADD COLUMN IF NOT EXISTS search_tsv tsvector;
 
+-- Text search configuration of search_tsv, the one setting shared by the
+-- trigger, the importer's bulk load, scrap/search_tsv.py and the site's
+-- websearch_to_tsquery (lib/content-query.js). Created once here and only
+-- changed by `python scrap/search_tsv.py --config <name>`, which also
+-- rewrites the stored vectors.
+DO $$
+BEGIN
+    IF to_regprocedure('search_tsv_config()') IS NULL THEN
+        CREATE FUNCTION search_tsv_config() RETURNS regconfig
+            LANGUAGE sql IMMUTABLE AS 'SELECT ''simple''::regconfig';
+    END IF;
+END $$;
+
 CREATE OR REPLACE FUNCTION archive_items_tsv_trigger()
 RETURNS TRIGGER AS $$
 BEGIN
-    NEW.search_tsv := to_tsvector('simple', coalesce(NEW.title, '') || ' ' || coalesce(NEW.description, ''));
+    NEW.search_tsv := to_tsvector(search_tsv_config(), coalesce(NEW.title, '') || ' ' || coalesce(NEW.description, ''));
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
 
+-- Fires only for the columns the vector is built from, so writing search_tsv
+-- itself (scrap/search_tsv.py) or the page ranks does not recompute it
+DROP TRIGGER IF EXISTS trg_archive_items_tsv ON archive_items;
 CREATE TRIGGER trg_archive_items_tsv
-    BEFORE INSERT OR UPDATE ON archive_items
+    BEFORE INSERT OR UPDATE OF title, description ON archive_items
     FOR EACH ROW
     EXECUTE FUNCTION archive_items_tsv_trigger();
 
--- Backfill search_tsv for existing rows (run once after adding the column)
--- UPDATE archive_items SET search_tsv = to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''));
+-- Backfill search_tsv for existing rows (run once after adding the column) in
+-- small throttled, resumable transactions rather than one table-wide UPDATE:
+--   python scrap/search_tsv.py --rows-per-sec 20000
 
 CREATE INDEX IF NOT EXISTS idx_archive_items_search_tsv ON archive_items USING GIN (search_tsv);
 
+-- md5 of the imported fields (see import_to_db.content_hashes); re-imports
+-- skip the UPDATE, and its trigger/index work, when the hash is unchanged
+ALTER TABLE archive_items
+    ADD COLUMN IF NOT EXISTS content_hash BYTEA;
+
 -- Create GIN index for JSONB subject field for better search
 CREATE INDEX IF NOT EXISTS idx_archive_items_subject ON archive_items USING GIN(subject);
 -- Faster contains lookups when using @>
 CREATE INDEX IF NOT EXISTS idx_archive_items_subject_path ON archive_items USING GIN(subject jsonb_path_ops);
 
+-- Page ranks: rank numbers each mediatype's rows 1..n in page order
+-- (downloads DESC, publicdate DESC, identifier), so any category page is a
+-- range seek on (mediatype, rank) instead of an OFFSET scan. The importer
+-- renumbers them after every run (see import_to_db.refresh_ranks), starting
+-- at the first position that changed; the trigger below tracks what changed.
+ALTER TABLE archive_items
+    ADD COLUMN IF NOT EXISTS rank INTEGER,
+    ADD COLUMN IF NOT EXISTS rank_dirty BOOLEAN NOT NULL DEFAULT true;
+
+CREATE INDEX IF NOT EXISTS idx_archive_items_media_rank ON archive_items(mediatype, rank);
+CREATE INDEX IF NOT EXISTS idx_archive_items_rank_dirty ON archive_items(mediatype, rank) WHERE rank_dirty;
+
+-- Ranks freed by deleted rows and rows that moved to another mediatype
+CREATE TABLE IF NOT EXISTS rank_gaps (
+    mediatype VARCHAR(50),
+    rank INTEGER NOT NULL
+);
+
+-- Rows ranked per mediatype at the last refresh; the site serves unfiltered
+-- pages from rank only while the mediatype has no dirty rows and no gaps
+CREATE TABLE IF NOT EXISTS rank_state (
+    mediatype VARCHAR(50) PRIMARY KEY,
+    ranked_rows INTEGER NOT NULL,
+    ranked_at TIMESTAMP NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION archive_items_rank_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' OR NEW.mediatype IS DISTINCT FROM OLD.mediatype THEN
+        IF OLD.rank IS NOT NULL THEN
+            INSERT INTO rank_gaps (mediatype, rank) VALUES (OLD.mediatype, OLD.rank);
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            RETURN OLD;
+        END IF;
+        NEW.rank := NULL;
+    END IF;
+    NEW.rank_dirty := true;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_archive_items_rank ON archive_items;
+CREATE TRIGGER trg_archive_items_rank
+    BEFORE UPDATE OF downloads, publicdate, mediatype ON archive_items
+    FOR EACH ROW
+    WHEN ((OLD.downloads, OLD.publicdate, OLD.mediatype) IS DISTINCT FROM (NEW.downloads, NEW.publicdate, NEW.mediatype))
+    EXECUTE FUNCTION archive_items_rank_trigger();
+
+DROP TRIGGER IF EXISTS trg_archive_items_rank_delete ON archive_items;
+CREATE TRIGGER trg_archive_items_rank_delete
+    AFTER DELETE ON archive_items
+    FOR EACH ROW
+    WHEN (OLD.rank IS NOT NULL)
+    EXECUTE FUNCTION archive_items_rank_trigger();
+
 -- Track item click counts (open/download interactions)
 CREATE TABLE IF NOT EXISTS item_clicks (
     id SERIAL PRIMARY KEY,
@@ -82,9 +161,13 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
--- Trigger to automatically update updated_at
-CREATE TRIGGER update_archive_items_updated_at 
-    BEFORE UPDATE ON archive_items
+-- Trigger to automatically update updated_at. Only edits of the item's own
+-- fields count: the derived search_tsv, rank and rank_dirty columns are
+-- rewritten by maintenance jobs that must leave updated_at alone.
+DROP TRIGGER IF EXISTS update_archive_items_updated_at ON archive_items;
+CREATE TRIGGER update_archive_items_updated_at
+    BEFORE UPDATE OF identifier, title, description, language, item_size, downloads, btih,
+                     mediatype, subject, publicdate, url ON archive_items
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
@@ -93,4 +176,8 @@ SELECT count(*) from archive_items;
 SELECT identifier, title, description, language, item_size, downloads, btih, mediatype, subject, publicdate, url 
 FROM archive_items WHERE mediatype = 'movies' ORDER BY downloads DESC, publicdate DESC LIMIT 20 OFFSET 30000
 
+-- The same page through the precomputed rank
+SELECT identifier, title, description, language, item_size, downloads, btih, mediatype, subject, publicdate, url 
+FROM archive_items WHERE mediatype = 'movies' AND rank > 30000 AND rank <= 30020 ORDER BY rank
+
 TRUNCATE TABLE archive_items;
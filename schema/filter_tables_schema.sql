@@ -22,6 +22,41 @@ CREATE TABLE IF NOT EXISTS years (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Number of archive items carrying each value (maintained by import_to_db.py)
+ALTER TABLE languages ADD COLUMN IF NOT EXISTS item_count BIGINT;
+ALTER TABLE subjects ADD COLUMN IF NOT EXISTS item_count BIGINT;
+ALTER TABLE years ADD COLUMN IF NOT EXISTS item_count BIGINT;
+
+-- Per-mediatype counts of every language, subject and year value
+CREATE TABLE IF NOT EXISTS filter_counts (
+    kind VARCHAR(16) NOT NULL,             -- 'language', 'subject' or 'year'
+    mediatype VARCHAR(50) NOT NULL DEFAULT '',
+    value TEXT NOT NULL,
+    item_count BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (kind, mediatype, value)
+);
+
+-- Changes to filter_counts committed by import_to_db.py together with the rows
+-- that caused them, folded into filter_counts at the end of each import
+CREATE TABLE IF NOT EXISTS filter_count_deltas (
+    kind VARCHAR(16) NOT NULL,
+    mediatype VARCHAR(50) NOT NULL DEFAULT '',
+    value TEXT NOT NULL,
+    delta BIGINT NOT NULL
+);
+
+-- Exact item counts per mediatype x lowercased language x year x top subject,
+-- with every roll-up; '' and 0 mean "any" (maintained by scrap/filter_cube.py)
+CREATE TABLE IF NOT EXISTS filter_cube (
+    mediatype VARCHAR(50) NOT NULL,
+    language VARCHAR(255) NOT NULL DEFAULT '',
+    year INTEGER NOT NULL DEFAULT 0,
+    subject VARCHAR(255) NOT NULL DEFAULT '',
+    item_count BIGINT NOT NULL,
+    PRIMARY KEY (mediatype, language, year, subject)
+);
+
 -- Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_languages_name ON languages(name);
 CREATE INDEX IF NOT EXISTS idx_subjects_name ON subjects(name);
@@ -31,39 +66,67 @@ CREATE INDEX IF NOT EXISTS idx_years_year ON years(year DESC);
 COMMENT ON TABLE languages IS 'Stores all unique languages found in archive items';
 COMMENT ON TABLE subjects IS 'Stores all unique subjects found in archive items';
 COMMENT ON TABLE years IS 'Stores all unique years found in archive items publicdate field';
+COMMENT ON TABLE filter_cube IS 'Item counts of language/year/subject filter combinations per mediatype, rebuilt by filter_cube.py after every import';
+COMMENT ON TABLE filter_counts IS 'Language/subject/year item counts per mediatype, computed by import_to_db.py during import';
+COMMENT ON TABLE filter_count_deltas IS 'Per-transaction filter_counts changes written by import_to_db.py, not yet folded into filter_counts';
 
--- Refresh helper to repopulate filter tables from archive_items
-CREATE OR REPLACE FUNCTION refresh_filter_tables()
+-- Refresh helper to repopulate filter tables from archive_items. Counts match
+-- what import_to_db.py maintains while importing; run it once to initialize
+-- them for an existing archive_items, or after rows were changed outside
+-- import_to_db.py (or with --skip-facets). Pending deltas are discarded.
+DROP FUNCTION IF EXISTS refresh_filter_tables();
+CREATE OR REPLACE FUNCTION refresh_filter_tables(min_count BIGINT DEFAULT 1000)
 RETURNS void AS $$
 BEGIN
-    TRUNCATE languages, subjects, years;
+    DELETE FROM filter_count_deltas;
+    DELETE FROM filter_counts;
 
-    INSERT INTO languages(name)
-    SELECT DISTINCT LOWER(language)
+    INSERT INTO filter_counts(kind, mediatype, value, item_count)
+    SELECT 'language', COALESCE(mediatype, ''), LEFT(BTRIM(language), 500), count(*)
     FROM archive_items
-    WHERE language IS NOT NULL AND language <> ''
-    ON CONFLICT (name) DO NOTHING;
+    WHERE language IS NOT NULL AND BTRIM(language) <> ''
+    GROUP BY 1, 2, 3;
 
-    INSERT INTO subjects(name)
-    SELECT DISTINCT subject_text
+    INSERT INTO filter_counts(kind, mediatype, value, item_count)
+    SELECT 'subject', COALESCE(mediatype, ''), LEFT(BTRIM(subject_text), 500), count(*)
     FROM (
-        SELECT jsonb_array_elements_text(subject) AS subject_text
-        FROM archive_items
+        SELECT mediatype, element #>> '{}' AS subject_text
+        FROM archive_items, jsonb_array_elements(subject) AS element
         WHERE subject IS NOT NULL AND jsonb_typeof(subject) = 'array'
-        UNION
-        SELECT subject::text AS subject_text
+          AND jsonb_typeof(element) = 'string'
+        UNION ALL
+        SELECT mediatype, subject #>> '{}' AS subject_text
         FROM archive_items
         WHERE subject IS NOT NULL AND jsonb_typeof(subject) = 'string'
     ) sub
-    WHERE subject_text IS NOT NULL AND subject_text <> ''
-    ON CONFLICT (name) DO NOTHING;
+    WHERE subject_text IS NOT NULL AND BTRIM(subject_text) <> '' AND subject_text <> 'Unknown'
+    GROUP BY 1, 2, 3;
 
-    INSERT INTO years(year)
-    SELECT DISTINCT EXTRACT(YEAR FROM publicdate)::int
+    INSERT INTO filter_counts(kind, mediatype, value, item_count)
+    SELECT 'year', COALESCE(mediatype, ''), EXTRACT(YEAR FROM publicdate)::int::text, count(*)
     FROM archive_items
     WHERE publicdate IS NOT NULL
-    ON CONFLICT (year) DO NOTHING;
+    GROUP BY 1, 2, 3;
+
+    DELETE FROM languages;
+    DELETE FROM subjects;
+    DELETE FROM years;
+
+    INSERT INTO languages(name, item_count)
+    SELECT value, sum(item_count) FROM filter_counts
+    WHERE kind = 'language' AND length(value) <= 255
+    GROUP BY value HAVING sum(item_count) >= min_count;
+
+    INSERT INTO subjects(name, item_count)
+    SELECT value, sum(item_count) FROM filter_counts
+    WHERE kind = 'subject'
+    GROUP BY value HAVING sum(item_count) >= min_count;
+
+    INSERT INTO years(year, item_count)
+    SELECT value::int, sum(item_count) FROM filter_counts
+    WHERE kind = 'year' AND value ~ '^[1-9][0-9]{3}$'
+    GROUP BY value HAVING sum(item_count) >= min_count;
 END;
 $$ LANGUAGE plpgsql;
 
-COMMENT ON FUNCTION refresh_filter_tables() IS 'Rebuilds languages/subjects/years lookup tables from archive_items. Run during off-peak hours.';
+COMMENT ON FUNCTION refresh_filter_tables(BIGINT) IS 'Rebuilds filter_counts and the languages/subjects/years lookup tables (values with >= min_count items) from archive_items. Run during off-peak hours.';
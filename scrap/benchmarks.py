@@ -0,0 +1,128 @@
+"""
+Micro-benchmarks for the importer's hot paths, run against real scraped data.
+
+Usage:
+    python benchmarks.py publicdate [--sample 200000] [files ...]
+    python benchmarks.py codec [--sample 200000] [files ...]
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+
+import import_to_db
+import jsoncodec
+from import_to_db import read_ndjson, find_ndjson_files
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def sample_lines(files, sample, seed=0):
+    """Reservoir sample of up to `sample` raw NDJSON lines (bytes) across files."""
+    rng = random.Random(seed)
+    records = []
+    seen = 0
+    for file_path in files:
+        with read_ndjson(file_path) as (lines, _):
+            for _, raw in lines:
+                line = bytes(raw).strip()
+                if not line:
+                    continue
+                seen += 1
+                if len(records) < sample:
+                    records.append(line)
+                else:
+                    j = rng.randrange(seen)
+                    if j < sample:
+                        records[j] = line
+    return records
+
+
+def decode_all(lines):
+    decoded = []
+    for line in lines:
+        try:
+            decoded.append(json.loads(line))
+        except ValueError:
+            continue
+    return decoded
+
+
+def timed(fn, values, repeat=3):
+    """Best wall time of `repeat` runs of fn over values."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for v in values:
+            fn(v)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_publicdate(lines):
+    values = [r.get('publicdate') for r in decode_all(lines)]
+    print(f"publicdate: {len(values)} values, {len(set(map(str, values)))} distinct")
+
+    fallback = timed(import_to_db.parse_publicdate_fallback, values)
+
+    import_to_db._parse_publicdate_str.cache_clear()
+    import_to_db.publicdate_hits.clear()
+    cold = timed(import_to_db.parse_publicdate, values, repeat=1)
+    stats = import_to_db.publicdate_stats()
+    warm = timed(import_to_db.parse_publicdate, values)
+
+    mismatches = sum(1 for v in values
+                     if import_to_db.parse_publicdate(v) != import_to_db.parse_publicdate_fallback(v))
+    for label, seconds in (('fallback', fallback), ('dispatch (cold cache)', cold),
+                           ('dispatch (warm cache)', warm)):
+        print(f"  {label:<22} {seconds * 1e3:9.1f} ms  {len(values) / max(seconds, 1e-9):12.0f} values/s  "
+              f"x{fallback / max(seconds, 1e-9):.1f}")
+    print("  formats: " + ', '.join(f"{k}={v}" for k, v in sorted(stats.items(), key=lambda kv: -kv[1])))
+    print(f"  mismatches vs fallback: {mismatches}")
+
+
+def bench_codec(lines):
+    records = decode_all(lines)
+    size = sum(len(line) for line in lines)
+    print(f"codec: {len(lines)} lines, {size / 1e6:.1f} MB")
+    results = []
+    for codec in jsoncodec.available_codecs():
+        # Decoded values must match the stdlib exactly, and so must a round trip
+        # through this backend's encoder.
+        identical = (all(codec.loads(line) == json.loads(line) for line in lines) and
+                     all(json.loads(codec.dumps_line(r)) == r for r in records))
+        results.append((codec.name, timed(codec.loads, lines), timed(codec.dumps_line, records), identical))
+    base_decode, base_encode = next((d, e) for name, d, e, _ in results if name == 'json')
+    for name, decode, encode, identical in results:
+        print(f"  {name:<7} loads {size / decode / 1e6:7.1f} MB/s x{base_decode / decode:.1f}  "
+              f"dumps_line {len(records) / encode:9.0f} rec/s x{base_encode / encode:.1f}  "
+              f"identical={identical}")
+    print(f"  default backend: {jsoncodec.codec.name}")
+
+
+BENCHMARKS = {
+    'publicdate': bench_publicdate,
+    'codec': bench_codec,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark importer hot paths on scraped data.")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('files', nargs='*',
+                        help="NDJSON files to sample (default: every scraped file below this directory)")
+    parser.add_argument('--sample', type=int, default=200000,
+                        help="records to sample across the files (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    files = args.files or find_ndjson_files(BASE_DIR)
+    if not files:
+        parser.error("no NDJSON files found; pass some explicitly")
+    lines = sample_lines(files, args.sample)
+    BENCHMARKS[args.benchmark](lines)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+Columnar (Parquet/Arrow) copies of the scraped items.
+
+Rows are sanitized exactly like the importer does (see import_to_db.sanitize_item)
+and written with real types: int64 item_size/downloads and a naive timestamp in
+UTC for publicdate (like archive_items.publicdate). subject is the JSON text of
+the normalized subject (see import_to_db.subject_json), so a dataset loads into
+the same JSONB value and content_hash as the NDJSON it came from. Files are
+laid out hive style,
+
+    <out>/mediatype=<mediatype>/year=<publicdate year>/part-<run>.parquet
+
+so notebooks can read a slice with pyarrow.dataset / pandas / DuckDB and the
+importer can load whole record batches without touching per-row dicts.
+
+Usage:
+    python columnar.py [--out parquet] [files ...]   # default: every scraped NDJSON file
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from urllib.parse import quote
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for the columnar export/loader
+    pa = None
+
+import jsoncodec
+from import_to_db import (ARCHIVE_COLUMNS, sanitize_item, subject_json, content_hashes,
+                          read_ndjson, is_blank, find_ndjson_files)
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUT = os.path.join(BASE_DIR, 'parquet')
+ROW_GROUP_ROWS = 50000
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for columnar export (pip install pyarrow)")
+
+
+def arrow_schema():
+    """Arrow schema of the exported files, in ARCHIVE_COLUMNS order."""
+    require_pyarrow()
+    return pa.schema([
+        ('identifier', pa.string()),
+        ('title', pa.string()),
+        ('description', pa.string()),
+        ('language', pa.string()),
+        ('item_size', pa.int64()),
+        ('downloads', pa.int64()),
+        ('btih', pa.string()),
+        ('mediatype', pa.string()),
+        ('subject', pa.string()),
+        ('publicdate', pa.timestamp('us')),
+        ('url', pa.string()),
+    ])
+
+
+def rows_to_batch(rows):
+    """Build one RecordBatch from sanitized row tuples, one column at a time."""
+    schema = arrow_schema()
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    subject_idx = ARCHIVE_COLUMNS.index('subject')
+    arrays = []
+    for i, (column, field) in enumerate(zip(columns, schema)):
+        if i == subject_idx:
+            column = [subject_json(s) for s in column]
+        arrays.append(pa.array(column, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def partition_key(row):
+    """(mediatype, year) partition of a sanitized row; None parts go to the null partition."""
+    publicdate = row[ARCHIVE_COLUMNS.index('publicdate')]
+    return row[ARCHIVE_COLUMNS.index('mediatype')], publicdate.year if publicdate else None
+
+
+class ColumnarSink:
+    """
+    Partitioned Parquet writer. Rows are buffered per (mediatype, year) and
+    flushed as one row group every row_group_rows rows. Each partition file is
+    written under a hidden temp name and renamed into place by close(), so
+    dataset readers never pick up a file without its footer. Safe to call from
+    several threads.
+    """
+
+    def __init__(self, out_dir=DEFAULT_OUT, row_group_rows=ROW_GROUP_ROWS, run_id=None):
+        require_pyarrow()
+        self.out_dir = out_dir
+        self.row_group_rows = row_group_rows
+        self.run_id = run_id or time.strftime('%Y%m%dT%H%M%S') + f"-{os.getpid()}"
+        self.schema = arrow_schema()
+        self.buffers = {}
+        self.writers = {}
+        self.rows = 0
+        self.lock = threading.Lock()
+
+    def partition_path(self, key):
+        mediatype, year = key
+        mediatype = quote(mediatype, safe='') if mediatype else NULL_PARTITION
+        year = str(year) if year is not None else NULL_PARTITION
+        return os.path.join(self.out_dir, f"mediatype={mediatype}", f"year={year}",
+                            f"part-{self.run_id}.parquet")
+
+    def add_row(self, row):
+        """Buffer one sanitized row (see sanitize_item)."""
+        key = partition_key(row)
+        with self.lock:
+            buffer = self.buffers.setdefault(key, [])
+            buffer.append(row)
+            self.rows += 1
+            if len(buffer) >= self.row_group_rows:
+                self._flush(key)
+
+    def add_item(self, item):
+        """Sanitize and buffer one scraped record; records without an identifier are dropped."""
+        row = sanitize_item(item)
+        if row is not None:
+            self.add_row(row)
+
+    def _flush(self, key):
+        rows = self.buffers.pop(key, None)
+        if not rows:
+            return
+        writer = self.writers.get(key)
+        if writer is None:
+            path = self.partition_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+            writer = self.writers[key] = (pq.ParquetWriter(tmp, self.schema, compression='zstd'), tmp, path)
+        writer[0].write_batch(rows_to_batch(rows))
+
+    def close(self):
+        with self.lock:
+            for key in list(self.buffers):
+                self._flush(key)
+            for writer, tmp, path in self.writers.values():
+                writer.close()
+                os.replace(tmp, path)
+            self.writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert(ndjson_files, out_dir=DEFAULT_OUT, row_group_rows=ROW_GROUP_ROWS):
+    """Convert NDJSON files (plain, .gz or .zst) into a partitioned Parquet dataset."""
+    stats = {'rows': 0, 'skipped': 0, 'errors': 0}
+    with ColumnarSink(out_dir, row_group_rows) as sink:
+        for file_path in ndjson_files:
+            logger.info("Converting %s", file_path)
+            with read_ndjson(file_path) as (lines, _):
+                for offset, raw in lines:
+                    if is_blank(raw):
+                        continue
+                    try:
+                        item = jsoncodec.loads(raw)
+                    except ValueError as e:
+                        logger.warning("JSON decode error in %s at byte %d: %s", file_path, offset, e)
+                        stats['errors'] += 1
+                        continue
+                    if not isinstance(item, dict):
+                        logger.warning("Not a JSON object in %s at byte %d", file_path, offset)
+                        stats['errors'] += 1
+                        continue
+                    row = sanitize_item(item)
+                    if row is None:
+                        stats['skipped'] += 1
+                        continue
+                    sink.add_row(row)
+        stats['rows'] = sink.rows
+    return stats
+
+
+def read_batches(path, batch_size):
+    """Yield RecordBatches of ARCHIVE_COLUMNS from a Parquet file or dataset directory."""
+    require_pyarrow()
+    dataset = ds.dataset(path, format='parquet', schema=arrow_schema())
+    yield from dataset.to_batches(columns=list(ARCHIVE_COLUMNS), batch_size=batch_size)
+
+
+def batch_to_csv(batch, seq_start):
+    """
+    Render a batch as headerless CSV for COPY ... (FORMAT csv), prefixed by a
+    seq column and followed by the rows' content_hash (bytea hex). Columns,
+    subject's JSON text included, are converted by Arrow's CSV writer. Nulls are
+    written unquoted and empty strings quoted, which is how COPY tells them
+    apart.
+    """
+    seq = pa.array(range(seq_start, seq_start + batch.num_rows), type=pa.int64())
+    content_hash = pa.array(['\\x' + h.hex() for h in content_hashes(batch_columns(batch))],
+                            type=pa.string())
+    table = pa.Table.from_arrays([seq] + list(batch.columns) + [content_hash],
+                                 names=['seq'] + list(ARCHIVE_COLUMNS) + ['content_hash'])
+    out = pa.BufferOutputStream()
+    pa_csv.write_csv(table, out, pa_csv.WriteOptions(include_header=False))
+    return out.getvalue().to_pybytes()
+
+
+def batch_columns(batch):
+    """
+    Sanitized column lists of a batch (see sanitize_batch), for content hashes
+    and the importer's row-level fallback. subject is decoded with the stdlib,
+    which reads back exactly what subject_json wrote.
+    """
+    columns = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+    subject_idx = ARCHIVE_COLUMNS.index('subject')
+    columns[subject_idx] = [json.loads(s) if s is not None else None for s in columns[subject_idx]]
+    return columns
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert scraped NDJSON into a partitioned Parquet dataset.")
+    parser.add_argument('files', nargs='*',
+                        help="NDJSON files to convert (default: every scraped file below this directory)")
+    parser.add_argument('--out', default=DEFAULT_OUT,
+                        help="dataset directory (default: %(default)s)")
+    parser.add_argument('--row-group-rows', type=int, default=ROW_GROUP_ROWS,
+                        help="rows per Parquet row group (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        require_pyarrow()
+    except RuntimeError as e:
+        logger.error("%s", e)
+        sys.exit(1)
+    files = args.files or find_ndjson_files(BASE_DIR)
+    if not files:
+        logger.info("No NDJSON files found.")
+        return
+    stats = convert(files, args.out, args.row_group_rows)
+    logger.info("Wrote %d rows to %s (%d without identifier, %d decode errors)",
+                stats['rows'], args.out, stats['skipped'], stats['errors'])
+
+
+if __name__ == '__main__':
+    main()
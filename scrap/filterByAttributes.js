@@ -4,7 +4,11 @@
  * High-performance NDJSON processor:
  * - Uses regex to extract fields (no JSON.parse in the hot-path)
  * - Uses Map for counters (low GC pressure)
- * - Streaming + checkpointing by line number (resumable)
+ * - Plain files are split into newline-aligned byte-range shards, read with large
+ *   positioned reads and split into lines straight from the read buffer
+ *   (checkpointed by byte offset per shard, resumable)
+ * - Reads .ndjson.gz / .ndjson.zst scraper output directly, decompressing on the fly
+ *   (streamed, checkpointed by line number)
  * - Skips files with basename starting "scrape_audio_v1"
  * - Writes languages.json, subjects.json, years.json with entries having count >= MIN_COUNT
  *
@@ -18,8 +22,9 @@
 
 const fs = require('fs');
 const path = require('path');
-const readline = require('readline');
 const os = require('os');
+const zlib = require('zlib');
+const { spawn } = require('child_process');
 const process = require('process');
 
 const DEFAULT_CONCURRENCY = 5;
@@ -27,6 +32,8 @@ const DEFAULT_CHECKPOINT_FILE = path.join(__dirname, '.ndjson_regex_checkpoints.
 const DEFAULT_CHECKPOINT_INTERVAL = 50000; // lines
 const DEFAULT_LOG_INTERVAL_MS = 15000;
 const DEFAULT_MIN_COUNT = 1000;
+const DEFAULT_SHARD_BYTES = 256 * 1024 * 1024;
+const DEFAULT_READ_CHUNK_BYTES = 4 * 1024 * 1024;
 
 // === CLI args ===
 const argv = process.argv.slice(2);
@@ -41,15 +48,25 @@ const CHECKPOINT_FILE = args.checkpointFile || DEFAULT_CHECKPOINT_FILE;
 const checkpointInterval = parseInt(args.checkpointInterval || DEFAULT_CHECKPOINT_INTERVAL, 10);
 const logIntervalMs = parseInt(args.logIntervalMs || DEFAULT_LOG_INTERVAL_MS, 10);
 const MIN_COUNT = parseInt(args.min || DEFAULT_MIN_COUNT, 10);
+const shardBytes = parseInt(args.shardBytes || DEFAULT_SHARD_BYTES, 10);
+const readChunkBytes = parseInt(args.readChunkBytes || DEFAULT_READ_CHUNK_BYTES, 10);
 
 // === Files to process (edit or pass via --files) ===
-let inputFiles = [
-    path.join(__dirname, 'scrape_audio_v1.ndjson'),
-    path.join(__dirname, 'scrape_image_v1.ndjson'),
-    path.join(__dirname, 'scrape_movies_v1.ndjson'),
-    path.join(__dirname, 'scrape_software_v1.ndjson'),
-    path.join(__dirname, 'scrape_text_v1.ndjson'),
-];
+// Default: every scraper output (<type>/scrape_<type>_v1.<partition>.ndjson[.gz|.zst]) below this directory
+function discoverInputFiles(dir) {
+    const found = [];
+    for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+        const full = path.join(dir, entry.name);
+        if (entry.isDirectory() && !entry.name.startsWith('.') && entry.name !== 'node_modules') {
+            found.push(...discoverInputFiles(full));
+        } else if (entry.isFile() && /^scrape_.*\.ndjson(\.gz|\.zst)?$/.test(entry.name) && !entry.name.includes('backup')) {
+            found.push(full);
+        }
+    }
+    return found.sort();
+}
+
+let inputFiles = discoverInputFiles(__dirname);
 
 if (args.files) {
     inputFiles = args.files.split(',').map(f => (path.isAbsolute(f) ? f : path.join(__dirname, f)));
@@ -65,7 +82,9 @@ const languageCounts = new Map();
 const subjectCounts = new Map();
 const yearCounts = new Map();
 
-// checkpoint structure: { files: { "<filePath>": { lastProcessedLine: N, processed: bool } }, global: { totalItems: N } }
+// checkpoint structure: { files: { "<filePath>": <entry> }, global: { totalItems: N } } where <entry> is
+//   plain files:      { shards: { "<start>": { end, offset, processed } } }
+//   compressed files: { lastProcessedLine: N, processed: bool }
 let checkpoint = { files: {}, global: { totalItems: 0 } };
 
 // === fast regexes (precompiled) ===
@@ -174,95 +193,203 @@ function mem() {
 }
 
 // === file processing ===
-function processFile(filePath) {
-    return new Promise((resolve, reject) => {
-        const base = path.basename(filePath);
+// Decompress by extension. zstd uses zlib when this Node has it, else the zstd CLI.
+function openNdjsonStream(filePath, rs) {
+    if (filePath.endsWith('.gz')) return rs.pipe(zlib.createGunzip());
+    if (filePath.endsWith('.zst')) {
+        if (typeof zlib.createZstdDecompress === 'function') return rs.pipe(zlib.createZstdDecompress());
+        const child = spawn('zstd', ['-dc'], { stdio: ['pipe', 'pipe', 'inherit'] });
+        rs.pipe(child.stdin);
+        return child.stdout;
+    }
+    return rs;
+}
 
-        // skip any scrape_audio_v1*
-        // if (base.startsWith('scrape_audio_v1')) {
-        //     console.log(`⏭️ Skipping file (per rule): ${base}`);
-        //     return resolve({ skipped: true });
-        // }
+// === line counting (hot path) ===
+function countLine(line) {
+    if (!line || !line.trim()) return;
+
+    // hot-path: extract with regex (no JSON.parse)
+    // Extract language
+    const langMatch = reLanguage.exec(line);
+    if (langMatch && langMatch[1]) {
+        const rawLang = langMatch[1];
+        // fast unescape using JSON (safe for short substrings)
+        let lang;
+        try {
+            lang = JSON.parse('"' + rawLang.replace(/"/g, '\\"') + '"');
+        } catch (e) {
+            lang = rawLang;
+        }
+        if (lang && lang !== 'Unknown') {
+            languageCounts.set(lang, (languageCounts.get(lang) || 0) + 1);
+        }
+    }
 
-        if (!fs.existsSync(filePath)) {
-            console.warn(`⚠️ Missing: ${filePath}`);
-            return resolve({ missing: true });
+    // Extract subject token
+    const subjMatch = reSubject.exec(line);
+    if (subjMatch && subjMatch[1]) {
+        const token = subjMatch[1];
+        const arr = parseSubjectToken(token);
+        if (Array.isArray(arr)) {
+            for (const s of arr) {
+                if (!s) continue;
+                if (s === 'Unknown') continue;
+                subjectCounts.set(s, (subjectCounts.get(s) || 0) + 1);
+            }
         }
+    }
 
-        console.log(`📄 Starting: ${base}`);
+    // Extract publicdate -> year
+    const pdMatch = rePublicdate.exec(line);
+    if (pdMatch && pdMatch[1]) {
+        const rawDate = pdMatch[1].trim();
+        // Fast year-only extract for ISO-like strings: starts with YYYY
+        const yearMatch = /^(\d{4})/.exec(rawDate);
+        if (yearMatch) {
+            const y = parseInt(yearMatch[1], 10);
+            if (!Number.isNaN(y)) {
+                yearCounts.set(y, (yearCounts.get(y) || 0) + 1);
+            }
+        } else {
+            // fallback: attempt Date parse but rarely happens
+            const dt = new Date(rawDate);
+            if (!isNaN(dt.getTime())) {
+                const y = dt.getFullYear();
+                yearCounts.set(y, (yearCounts.get(y) || 0) + 1);
+            }
+        }
+    }
+}
 
-        const stat = fs.statSync(filePath);
-        const totalBytes = stat.size;
+// Split a chunk (prefixed by the previous chunk's unfinished line) into lines.
+// Returns the unfinished tail, copied because read buffers are reused.
+function splitLines(carry, chunk, onLine) {
+    const buf = carry ? Buffer.concat([carry, chunk]) : chunk;
+    let lineStart = 0;
+    let nl;
+    while ((nl = buf.indexOf(10, lineStart)) !== -1) {
+        onLine(buf.toString('utf8', lineStart, nl));
+        lineStart = nl + 1;
+    }
+    return lineStart < buf.length ? Buffer.from(buf.subarray(lineStart)) : null;
+}
+
+// Newline-aligned [start, end) byte ranges of roughly `bytes` each, like
+// import_to_db.shard_boundaries: one small read per cut, nothing else is read
+function shardBoundaries(filePath, bytes) {
+    const size = fs.statSync(filePath).size;
+    const cuts = [0];
+    const probe = Buffer.allocUnsafe(64 * 1024);
+    const fd = fs.openSync(filePath, 'r');
+    try {
+        let target = bytes;
+        while (target < size) {
+            let pos = target - 1;
+            let next = -1;
+            while (pos < size) {
+                const n = fs.readSync(fd, probe, 0, probe.length, pos);
+                if (n === 0) break;
+                const i = probe.indexOf(10);
+                if (i !== -1 && i < n) {
+                    next = pos + i + 1;
+                    break;
+                }
+                pos += n;
+            }
+            if (next === -1 || next >= size) break;
+            if (next > cuts[cuts.length - 1]) cuts.push(next);
+            target = Math.max(next, target) + bytes;
+        }
+    } finally {
+        fs.closeSync(fd);
+    }
+    cuts.push(size);
+    const ranges = [];
+    for (let i = 0; i + 1 < cuts.length; i++) {
+        if (cuts[i] < cuts[i + 1]) ranges.push([cuts[i], cuts[i + 1]]);
+    }
+    return ranges;
+}
 
+// Plain files: positioned reads of one newline-aligned byte range, split into
+// lines straight from the read buffer. Checkpointed by byte offset.
+async function processShard(filePath, start, end) {
+    const base = path.basename(filePath);
+    const shards = checkpoint.files[filePath].shards;
+    const cp = shards[start];
+    let offset = cp.offset || start;
+    if (cp.processed || offset >= end) return { file: filePath, start, skipped: true };
+
+    console.log(`📄 Starting: ${base} [${start}, ${end})`);
+    const fh = await fs.promises.open(filePath, 'r');
+    const buf = Buffer.allocUnsafe(readChunkBytes);
+    let carry = null;
+    let pos = offset;
+    let lines = 0;
+    let sinceCheckpoint = 0;
+    let lastLog = Date.now();
+    const onLine = (line) => {
+        countLine(line);
+        lines++;
+        sinceCheckpoint++;
+        checkpoint.global.totalItems = (checkpoint.global.totalItems || 0) + 1;
+    };
+    try {
+        while (pos < end) {
+            const { bytesRead } = await fh.read(buf, 0, Math.min(buf.length, end - pos), pos);
+            if (bytesRead === 0) break;
+            pos += bytesRead;
+            carry = splitLines(carry, buf.subarray(0, bytesRead), onLine);
+
+            // offset of the first line not yet counted
+            cp.offset = pos - (carry ? carry.length : 0);
+            if (sinceCheckpoint >= checkpointInterval) {
+                sinceCheckpoint = 0;
+                saveCheckpointAsync();
+            }
+            const now = Date.now();
+            if (now - lastLog > logIntervalMs) {
+                lastLog = now;
+                const pct = (((pos - start) / (end - start)) * 100).toFixed(2);
+                console.log(`   ${base} [${start}, ${end}): ${lines} lines — ${pct}% — ${mem()}`);
+            }
+        }
+        if (carry && carry.length) onLine(carry.toString('utf8'));
+    } catch (err) {
+        saveCheckpointSync();
+        console.error('❌ Read error:', err);
+        throw err;
+    } finally {
+        await fh.close();
+    }
+    shards[start] = { end, offset: end, processed: true, processedAt: new Date().toISOString() };
+    saveCheckpointSync();
+    console.log(`   ✅ Finished: ${base} [${start}, ${end}) (${lines} lines)`);
+    return { file: filePath, start, lines };
+}
+
+// Compressed files cannot be read by byte range: decompress as a stream and
+// split its chunks into lines the same way. Checkpointed by line number.
+function processCompressedFile(filePath) {
+    return new Promise((resolve, reject) => {
+        const base = path.basename(filePath);
+        console.log(`📄 Starting: ${base}`);
+
+        const totalBytes = fs.statSync(filePath).size;
         const cpEntry = checkpoint.files[filePath] || { lastProcessedLine: 0, processed: false };
+        if (cpEntry.processed) return resolve({ file: filePath, skipped: true });
         const resumeLine = cpEntry.lastProcessedLine || 0;
 
         let currentLine = 0;
         let processedThisRun = 0;
         let lastLog = Date.now();
+        let carry = null;
 
-        const rs = fs.createReadStream(filePath, { encoding: 'utf8' });
-        const rl = readline.createInterface({ input: rs, crlfDelay: Infinity });
-
-        rl.on('line', (line) => {
+        const onLine = (line) => {
             currentLine++;
             if (currentLine <= resumeLine) return; // skip already processed lines quickly
-
-            if (!line || !line.trim()) {
-                // nothing
-            } else {
-                // hot-path: extract with regex (no JSON.parse)
-                // Extract language
-                const langMatch = reLanguage.exec(line);
-                if (langMatch && langMatch[1]) {
-                    const rawLang = langMatch[1];
-                    // fast unescape using JSON (safe for short substrings)
-                    let lang;
-                    try {
-                        lang = JSON.parse('"' + rawLang.replace(/"/g, '\\"') + '"');
-                    } catch (e) {
-                        lang = rawLang;
-                    }
-                    if (lang && lang !== 'Unknown') {
-                        languageCounts.set(lang, (languageCounts.get(lang) || 0) + 1);
-                    }
-                }
-
-                // Extract subject token
-                const subjMatch = reSubject.exec(line);
-                if (subjMatch && subjMatch[1]) {
-                    const token = subjMatch[1];
-                    const arr = parseSubjectToken(token);
-                    if (Array.isArray(arr)) {
-                        for (const s of arr) {
-                            if (!s) continue;
-                            if (s === 'Unknown') continue;
-                            subjectCounts.set(s, (subjectCounts.get(s) || 0) + 1);
-                        }
-                    }
-                }
-
-                // Extract publicdate -> year
-                const pdMatch = rePublicdate.exec(line);
-                if (pdMatch && pdMatch[1]) {
-                    const rawDate = pdMatch[1].trim();
-                    // Fast year-only extract for ISO-like strings: starts with YYYY
-                    const yearMatch = /^(\d{4})/.exec(rawDate);
-                    if (yearMatch) {
-                        const y = parseInt(yearMatch[1], 10);
-                        if (!Number.isNaN(y)) {
-                            yearCounts.set(y, (yearCounts.get(y) || 0) + 1);
-                        }
-                    } else {
-                        // fallback: attempt Date parse but rarely happens
-                        const dt = new Date(rawDate);
-                        if (!isNaN(dt.getTime())) {
-                            const y = dt.getFullYear();
-                            yearCounts.set(y, (yearCounts.get(y) || 0) + 1);
-                        }
-                    }
-                }
-            }
+            countLine(line);
 
             processedThisRun++;
             checkpoint.global.totalItems = (checkpoint.global.totalItems || 0) + 1;
@@ -272,7 +399,14 @@ function processFile(filePath) {
             if (processedThisRun % checkpointInterval === 0) {
                 saveCheckpointAsync();
             }
+        };
+
+        // rs.bytesRead counts compressed bytes, so the percentage stays meaningful
+        const rs = fs.createReadStream(filePath, { highWaterMark: readChunkBytes });
+        const input = openNdjsonStream(filePath, rs);
 
+        input.on('data', (chunk) => {
+            carry = splitLines(carry, chunk, onLine);
             const now = Date.now();
             if (now - lastLog > logIntervalMs) {
                 lastLog = now;
@@ -281,16 +415,17 @@ function processFile(filePath) {
             }
         });
 
-        rl.on('close', () => {
+        input.on('end', () => {
+            if (carry && carry.length) onLine(carry.toString('utf8'));
             checkpoint.files[filePath] = { lastProcessedLine: currentLine, processed: true, processedAt: new Date().toISOString() };
             saveCheckpointSync();
             console.log(`   ✅ Finished: ${base} (${currentLine} lines)`);
             resolve({ file: filePath, lines: currentLine });
         });
 
-        rl.on('error', (err) => {
+        input.on('error', (err) => {
             saveCheckpointSync();
-            console.error('❌ Readline error:', err);
+            console.error('❌ Decompression error:', err);
             reject(err);
         });
 
@@ -302,6 +437,43 @@ function processFile(filePath) {
     });
 }
 
+// One task per compressed file, one per byte-range shard of a plain file
+function fileTasks(filePath) {
+    const base = path.basename(filePath);
+
+    // skip any scrape_audio_v1*
+    // if (base.startsWith('scrape_audio_v1')) {
+    //     console.log(`⏭️ Skipping file (per rule): ${base}`);
+    //     return [];
+    // }
+
+    if (!fs.existsSync(filePath)) {
+        console.warn(`⚠️ Missing: ${filePath}`);
+        return [];
+    }
+    if (/\.(gz|zst)$/.test(filePath)) {
+        return [() => processCompressedFile(filePath)];
+    }
+
+    // Reuse the shards a resumed run was cut into; line-numbered entries from
+    // older checkpoints are only honoured once the whole file was processed.
+    let entry = checkpoint.files[filePath];
+    if (entry && !entry.shards) {
+        if (entry.processed) return [];
+        entry = null;
+    }
+    if (!entry) {
+        entry = { shards: {} };
+        for (const [start, end] of shardBoundaries(filePath, shardBytes)) {
+            entry.shards[start] = { end, offset: start, processed: false };
+        }
+        checkpoint.files[filePath] = entry;
+    }
+    return Object.entries(entry.shards)
+        .filter(([, shard]) => !shard.processed)
+        .map(([start, shard]) => () => processShard(filePath, Number(start), shard.end));
+}
+
 // Simple promise pool
 function promisePool(tasks, limit) {
     let i = 0;
@@ -329,7 +501,7 @@ function atomicWrite(file, data) {
 // === MAIN ===
 (async () => {
     console.log('🟢 NDJSON regex processor starting');
-    console.log(`   Concurrency: ${concurrency} | Checkpoint interval: ${checkpointInterval} lines | Min count: ${MIN_COUNT}`);
+    console.log(`   Concurrency: ${concurrency} | Shard: ${(shardBytes / 1024 / 1024).toFixed(0)}MB | Checkpoint interval: ${checkpointInterval} lines | Min count: ${MIN_COUNT}`);
     console.log('');
 
     loadCheckpoint();
@@ -337,7 +509,7 @@ function atomicWrite(file, data) {
     // build tasks skipping missing files
     const tasks = [];
     for (const f of inputFiles) {
-        tasks.push(() => processFile(f));
+        tasks.push(...fileTasks(f));
     }
 
     await promisePool(tasks, concurrency);
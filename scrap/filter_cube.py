@@ -0,0 +1,126 @@
+"""
+Materialize exact item counts of the common filter combinations into filter_cube.
+
+For every mediatype the cube holds the number of items per lowercased
+language x publicdate year x subject, plus every roll-up of those (any
+language, any year, any subject), computed with GROUP BY CUBE. Languages and
+years are complete: a combination without a row has no items. Subjects are
+limited to the TOP_SUBJECTS most common ones of each mediatype; the rows for
+the other subjects would outnumber the rest of the cube. '' (language,
+subject) and 0 (year) stand for "any", so lib/content-query.js finds a
+count with one primary key lookup, and counts live whatever the cube does not
+cover (other subjects, several subjects, downloads/size ranges, search).
+
+The counts are only as fresh as the last run: import_to_db.py rebuilds the
+cube after every import.
+
+Usage:
+    python filter_cube.py [--top-subjects 200]
+"""
+
+import time
+import logging
+import argparse
+
+from import_to_db import connect_db
+
+logger = logging.getLogger(__name__)
+
+TOP_SUBJECTS = 200
+# Longer languages and subjects stay out of the cube (primary key size)
+MAX_CUBE_VALUE = 255
+
+# The TOP_SUBJECTS most common subjects per mediatype. Like the API's
+# `subject @> '["..."]'` filter, an item counts once per distinct string element.
+CUBE_SUBJECTS_SQL = """
+CREATE TEMP TABLE cube_subjects ON COMMIT DROP AS
+SELECT mediatype, subject FROM (
+    SELECT a.mediatype, s.subject,
+           row_number() OVER (PARTITION BY a.mediatype ORDER BY count(*) DESC, s.subject) AS n
+    FROM archive_items a
+    CROSS JOIN LATERAL (
+        SELECT DISTINCT e #>> '{}' AS subject
+        FROM jsonb_array_elements(CASE WHEN jsonb_typeof(a.subject) = 'array' THEN a.subject END) e
+        WHERE jsonb_typeof(e) = 'string'
+    ) s
+    WHERE a.mediatype IS NOT NULL AND s.subject <> '' AND length(s.subject) <= %(max_value)s
+    GROUP BY a.mediatype, s.subject
+) ranked
+WHERE n <= %(top_subjects)s
+"""
+
+# A rolled-up language or year is '' / 0; rows whose own value is missing (or
+# too long to key on) are left out of the groups on that dimension
+CUBE_HAVING = """
+HAVING (GROUPING(lower(a.language)) = 1
+        OR (lower(a.language) <> '' AND length(lower(a.language)) <= %(max_value)s))
+   AND (GROUPING(EXTRACT(YEAR FROM a.publicdate)::int) = 1 OR EXTRACT(YEAR FROM a.publicdate)::int IS NOT NULL)
+"""
+
+CUBE_TOTALS_SQL = """
+INSERT INTO filter_cube (mediatype, language, year, subject, item_count)
+SELECT a.mediatype, coalesce(lower(a.language), ''), coalesce(EXTRACT(YEAR FROM a.publicdate)::int, 0), '',
+       count(*)
+FROM archive_items a
+WHERE a.mediatype IS NOT NULL
+GROUP BY a.mediatype, CUBE (lower(a.language), EXTRACT(YEAR FROM a.publicdate)::int)
+""" + CUBE_HAVING
+
+CUBE_SUBJECT_SQL = """
+INSERT INTO filter_cube (mediatype, language, year, subject, item_count)
+SELECT a.mediatype, coalesce(lower(a.language), ''), coalesce(EXTRACT(YEAR FROM a.publicdate)::int, 0), s.subject,
+       count(*)
+FROM archive_items a
+CROSS JOIN LATERAL (
+    SELECT DISTINCT e #>> '{}' AS subject
+    FROM jsonb_array_elements(CASE WHEN jsonb_typeof(a.subject) = 'array' THEN a.subject END) e
+    WHERE jsonb_typeof(e) = 'string'
+) s
+JOIN cube_subjects c ON c.mediatype = a.mediatype AND c.subject = s.subject
+GROUP BY a.mediatype, s.subject, CUBE (lower(a.language), EXTRACT(YEAR FROM a.publicdate)::int)
+""" + CUBE_HAVING
+
+def build_cube(conn, top_subjects=TOP_SUBJECTS):
+    """
+    Replace the contents of filter_cube in one transaction, so the API reads
+    either the old cube or the new one. Returns the number of rows written.
+    """
+    params = {'top_subjects': top_subjects, 'max_value': MAX_CUBE_VALUE}
+    cursor = conn.cursor()
+    try:
+        cursor.execute(CUBE_SUBJECTS_SQL, params)
+        cursor.execute("DELETE FROM filter_cube")
+        cursor.execute(CUBE_TOTALS_SQL, params)
+        rows = cursor.rowcount
+        cursor.execute(CUBE_SUBJECT_SQL, params)
+        rows += cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return rows
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Materialize filter combination counts into filter_cube.")
+    parser.add_argument('--top-subjects', type=int, default=TOP_SUBJECTS,
+                        help="subjects per mediatype included in the cube (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.top_subjects < 0:
+        parser.error("--top-subjects cannot be negative")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.monotonic()
+    conn = connect_db()
+    try:
+        rows = build_cube(conn, args.top_subjects)
+    finally:
+        conn.close()
+    logger.info("filter_cube: %d row(s) in %.1fs", rows, time.monotonic() - started)
+
+
+if __name__ == '__main__':
+    main()
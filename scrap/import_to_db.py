@@ -2,22 +2,53 @@
 """
 Robust NDJSON -> Postgres importer.
 
-Fixes:
- - Uses SAVEPOINT per row so a single bad row doesn't abort the whole transaction.
- - Sanitizes inputs and truncates fields to column limits.
- - Uses psycopg2.extras.Json for JSONB binding.
- - Improved publicdate parsing with several fallbacks.
- - Periodic commits and clear logging.
+Load path:
+ - COPY (--mode=copy, and every --workers or --columnar run): items are
+   sanitized a batch at a time (sanitize_batch), COPYed into a staging table
+   and merged into archive_items with one set-based upsert that leaves rows
+   with an unchanged content hash alone. A rejected batch is bisected, so only
+   its bad rows are dropped.
+ - Row by row (--mode=row, the default of a serial run): one upsert per item
+   (insert_item), each in its own SAVEPOINT so a bad row doesn't abort the
+   transaction.
+ - Every commit checkpoints the shard it belongs to; a failed commit stops
+   the run instead of skipping rows, and --resume continues after it.
+ - Sanitizes inputs and truncates fields to column limits; publicdate is
+   parsed by shape and stored as UTC.
+ - After the load, facet counts, page ranks and the filter cube are brought
+   up to date.
 """
 
+import io
 import os
+import re
 import sys
+import gzip
 import json
+import mmap
+import time
+import hashlib
+import contextlib
+import functools
+import random
+import sqlite3
 import logging
-from datetime import datetime
+import argparse
+import multiprocessing
+import concurrent.futures
+from collections import Counter
+from datetime import datetime, timezone
 from tqdm import tqdm
 import psycopg2
 import psycopg2.extras
+import psycopg2.sql
+
+import jsoncodec
+
+try:
+    import zstandard
+except ImportError:  # only needed for .ndjson.zst inputs
+    zstandard = None
 
 # ---------- CONFIG ----------
 DB_CONFIG = {
@@ -31,11 +62,47 @@ DB_CONFIG = {
 # commit after this many successful rows
 COMMIT_BATCH = 500
 
+# rows per COPY + merge round trip in --mode=copy
+COPY_BATCH = 10000
+
+# --workers: files are cut into newline-aligned shards of roughly this size
+SHARD_BYTES = 64 * 1024 * 1024
+# retries for a batch that lost a deadlock / serialization race to another worker
+DEADLOCK_RETRIES = 5
+
+# Plain and compressed NDJSON inputs. Compressed files are decompressed on the fly
+# and always imported as a single shard, with offsets in decompressed bytes.
+NDJSON_SUFFIXES = ('.ndjson', '.ndjson.gz', '.ndjson.zst')
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+# scrape_<name>_v1.delta-<UTC time>.ndjson, written by `script.py --incremental`
+DELTA_FILE = re.compile(r'\.delta-[0-9TZ]+\.ndjson')
+
+# Committed byte offsets, one small JSON file per shard so that parallel
+# workers never write the same checkpoint file.
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.import_checkpoints')
+
+# --dedupe-files: identifier -> last occurrence across all input files
+WINNER_INDEX = os.path.join(CHECKPOINT_DIR, 'identifiers.sqlite')
+
+# --bulk-rebuild: definitions of the dropped indexes and the disabled triggers,
+# kept until the rebuild finishes so an interrupted run can still restore them
+BULK_STATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.bulk_rebuild.json')
+# concurrent CREATE INDEX sessions, and the maintenance_work_mem of each
+INDEX_JOBS = 4
+MAINTENANCE_WORK_MEM = '1GB'
+
 # Column size limits (match your SQL schema)
 MAX_IDENTIFIER = 10000
 MAX_LANGUAGE = 1000
 MAX_BTIH = 128
 MAX_MEDIATYPE = 50
+# Filter tables: subjects.name is VARCHAR(500); like filterByAttributes.js, only
+# values seen at least FACET_MIN_COUNT times become languages/subjects/years rows
+MAX_FACET_VALUE = 500
+FACET_MIN_COUNT = 1000
+
+# distinct publicdate strings remembered by parse_publicdate
+PUBLICDATE_CACHE_SIZE = 65536
 
 # Logging
 logging.basicConfig(
@@ -54,7 +121,7 @@ def safe_truncate(val, max_len):
         return s[:max_len]
     return s
 
-def parse_publicdate(date_str):
+def parse_publicdate_fallback(date_str):
     """Attempt to parse many common date formats; return datetime or None."""
     if not date_str or date_str == 'Unknown':
         return None
@@ -97,6 +164,90 @@ def parse_publicdate(date_str):
     logger.debug(f"parse_publicdate: could not parse '{date_str}'")
     return None
 
+def _ymd(m):
+    return datetime(int(m['y']), int(m['m']), int(m['d']))
+
+def _ymd_hms(m, tzinfo=None):
+    return datetime(int(m['y']), int(m['m']), int(m['d']),
+                    int(m['H']), int(m['M']), int(m['S']), tzinfo=tzinfo)
+
+def _month_name(m):
+    s = m.string
+    try:
+        return datetime.strptime(s, "%d %b %Y")
+    except ValueError:
+        return datetime.strptime(s, "%d %B %Y")
+
+# Shape -> constructor, tried in order. Each entry returns exactly what
+# parse_publicdate_fallback returns for the strings it matches; anything that
+# matches no shape, or whose constructor raises (e.g. month 13), goes to the
+# fallback so results never differ.
+PUBLICDATE_FORMATS = (
+    ('iso_z', re.compile(r'(?P<y>[0-9]{4})-(?P<m>[0-9]{2})-(?P<d>[0-9]{2})T'
+                         r'(?P<H>[0-9]{2}):(?P<M>[0-9]{2}):(?P<S>[0-9]{2})Z'),
+     lambda m: _ymd_hms(m, timezone.utc)),
+    ('iso_t', re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}T.*'),
+     lambda m: datetime.fromisoformat(m.string.replace('Z', '+00:00'))),
+    ('ymd_hms', re.compile(r'(?P<y>[0-9]{4})-(?P<m>[0-9]{2})-(?P<d>[0-9]{2}) '
+                           r'(?P<H>[0-9]{2}):(?P<M>[0-9]{2}):(?P<S>[0-9]{2})'), _ymd_hms),
+    ('ymd', re.compile(r'(?P<y>[0-9]{4})-(?P<m>[0-9]{2})-(?P<d>[0-9]{2})'), _ymd),
+    ('dmy', re.compile(r'(?P<d>[0-9]{1,2})-(?P<m>[0-9]{1,2})-(?P<y>[0-9]{4})'), _ymd),
+    ('mdy', re.compile(r'(?P<m>[0-9]{1,2})/(?P<d>[0-9]{1,2})/(?P<y>[0-9]{4})'), _ymd),
+    ('y/m/d', re.compile(r'(?P<y>[0-9]{4})/(?P<m>[0-9]{1,2})/(?P<d>[0-9]{1,2})'), _ymd),
+    ('d_month_y', re.compile(r'[0-9]{1,2} [A-Za-z]+ [0-9]{4}'), _month_name),
+    ('year', re.compile(r'(?P<y>[0-9]{4})'), lambda m: datetime(int(m['y']), 1, 1)),
+)
+
+# Strings parsed per format (cache misses only; see publicdate_stats)
+publicdate_hits = Counter()
+
+@functools.lru_cache(maxsize=PUBLICDATE_CACHE_SIZE)
+def _parse_publicdate_str(s):
+    for name, pattern, build in PUBLICDATE_FORMATS:
+        m = pattern.fullmatch(s)
+        if m is None:
+            continue
+        try:
+            value = build(m)
+        except ValueError:
+            break
+        publicdate_hits[name] += 1
+        return value
+    publicdate_hits['fallback'] += 1
+    return parse_publicdate_fallback(s)
+
+def parse_publicdate(date_str):
+    """
+    Same result as parse_publicdate_fallback, but the format is picked from the
+    string's shape instead of by trial and error, and repeated strings are
+    answered from a bounded LRU cache.
+    """
+    if type(date_str) is not str:
+        return parse_publicdate_fallback(date_str)
+    if not date_str or date_str == 'Unknown':
+        return None
+    s = date_str.strip()
+    if not s:
+        return None
+    return _parse_publicdate_str(s)
+
+def publicdate_utc(value):
+    """
+    archive_items.publicdate is a naive TIMESTAMP holding UTC: convert an
+    aware datetime to that (None if it falls outside datetime's range).
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    try:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    except OverflowError:
+        return None
+
+def publicdate_stats():
+    """Per-format parse counts plus LRU cache hits/misses for this process."""
+    info = _parse_publicdate_str.cache_info()
+    return dict(publicdate_hits, cache_hits=info.hits, cache_misses=info.misses)
+
 def normalize_subject(subject):
     """Return a Python object suitable for JSONB (list or None)."""
     if subject is None or subject == 'Unknown':
@@ -117,6 +268,24 @@ def normalize_subject(subject):
     # Other types: coerce to string inside an array
     return [str(subject)]
 
+def subject_json(subject):
+    """
+    The canonical JSON text of a normalized subject (see normalize_subject),
+    or None. Rendered with the stdlib encoder, so content hashes and Parquet
+    files do not depend on which jsoncodec backend is installed.
+    """
+    if subject is None:
+        return None
+    return json.dumps(subject, ensure_ascii=False, separators=(',', ':'))
+
+def subject_strings(subject):
+    """The string subjects of a normalized subject (see normalize_subject); dicts and numbers carry none."""
+    if isinstance(subject, str):
+        return [subject]
+    if isinstance(subject, list):
+        return [s for s in subject if isinstance(s, str)]
+    return []
+
 def extract_identifier(item):
     """Try to extract identifier; also handle archive.org URLs."""
     identifier = item.get('identifier')
@@ -139,12 +308,42 @@ def connect_db():
         logger.error(f"Error connecting to database: {e}")
         sys.exit(1)
 
-INSERT_SQL = """
-INSERT INTO archive_items 
-(identifier, title, description, language, item_size, downloads, btih, 
- mediatype, subject, publicdate, url)
-VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-ON CONFLICT (identifier) 
+# ---------- Partition migration lock ----------
+# partition_archive_items.py holds this advisory lock exclusively while it
+# runs; every tool that writes archive_items (imports, rank refreshes,
+# search_tsv.py) holds it shared for its whole run. The migration only catches
+# up with changes it can see by updated_at and its delete log, so the two must
+# not overlap.
+MIGRATION_LOCK = 7130519
+# The migration's new table; while it exists a migration is unfinished
+MIGRATION_TABLE = 'archive_items_part'
+
+def lock_out_migration(conn):
+    """
+    Hold MIGRATION_LOCK shared for the rest of conn's session. Exits if a
+    partition migration is running, or was interrupted and left its new
+    table behind.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_try_advisory_lock_shared(%s), to_regclass(%s) IS NOT NULL",
+                   (MIGRATION_LOCK, MIGRATION_TABLE))
+    locked, unfinished = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    if not locked:
+        logger.error("partition_archive_items.py is migrating archive_items; run this once it has finished")
+        sys.exit(1)
+    if unfinished:
+        logger.error("An interrupted partition migration left %s behind; finish it with "
+                     "'partition_archive_items.py migrate --resume' (or drop the table) first", MIGRATION_TABLE)
+        sys.exit(1)
+
+ARCHIVE_COLUMNS = (
+    'identifier', 'title', 'description', 'language', 'item_size', 'downloads',
+    'btih', 'mediatype', 'subject', 'publicdate', 'url'
+)
+
+UPSERT_SET = """
 DO UPDATE SET
     title = EXCLUDED.title,
     description = EXCLUDED.description,
@@ -156,64 +355,361 @@ DO UPDATE SET
     subject = EXCLUDED.subject,
     publicdate = EXCLUDED.publicdate,
     url = EXCLUDED.url,
+    content_hash = EXCLUDED.content_hash,
     updated_at = CURRENT_TIMESTAMP
+WHERE archive_items.content_hash IS DISTINCT FROM EXCLUDED.content_hash
 """
+UPSERT_CLAUSE = "\nON CONFLICT (identifier)" + UPSERT_SET
+# A table partitioned by mediatype is unique on (mediatype, identifier)
+PARTITION_UPSERT_CLAUSE = "\nON CONFLICT (mediatype, identifier)" + UPSERT_SET
+
+# Facet columns of a row (see count_facets), as written and as they were
+FACET_COLUMNS = ('mediatype', 'language', 'subject', 'publicdate')
+OLD_FACETS = ', '.join('old.' + c for c in FACET_COLUMNS)
+
+# Takes the identifier first, then the row. Returns one row for an insert or
+# an update: (xmax = 0), true for an insert, then the facet columns the row
+# had before (NULLs for a new row); no row when the stored content_hash
+# already matched.
+INSERT_SQL = """
+WITH old AS (
+    SELECT %s FROM archive_items WHERE identifier = %%s
+), merged AS (
+INSERT INTO archive_items 
+(identifier, title, description, language, item_size, downloads, btih, 
+ mediatype, subject, publicdate, url, content_hash)
+VALUES (%%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s)
+""" % ', '.join(FACET_COLUMNS) + UPSERT_CLAUSE + """RETURNING (xmax = 0) AS inserted
+)
+SELECT merged.inserted, %s FROM merged LEFT JOIN old ON true
+""" % OLD_FACETS
+
+# Session-private staging table for --mode=copy. Temporary tables are never
+# WAL-logged, so they behave like an UNLOGGED table that each connection owns.
+# Loose column types let bad values through COPY so the merge can reject them.
+STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS import_staging (
+    seq BIGINT,
+    identifier TEXT,
+    title TEXT,
+    description TEXT,
+    language TEXT,
+    item_size BIGINT,
+    downloads BIGINT,
+    btih TEXT,
+    mediatype TEXT,
+    subject JSONB,
+    publicdate TIMESTAMP,
+    url TEXT,
+    content_hash BYTEA
+)
+"""
+
+COPY_SQL = "COPY import_staging (seq, %s, content_hash) FROM STDIN" % ', '.join(ARCHIVE_COLUMNS)
+# Same columns as CSV, as rendered by Arrow for --columnar (see columnar.batch_to_csv)
+COPY_CSV_SQL = COPY_SQL + " WITH (FORMAT csv)"
+
+# DISTINCT ON keeps the last occurrence of an identifier within the batch;
+# ON CONFLICT DO UPDATE cannot touch the same row twice in one statement.
+# Rows whose content_hash is unchanged are left alone (see UPSERT_CLAUSE).
+# The statement returns one row per row written: (xmax = 0), the facet
+# columns as written, then as they were before (every CTE reads the table as
+# it was when the statement started; NULLs for a new row).
+MERGE_SQL = """
+WITH staged AS (
+    SELECT DISTINCT ON (identifier) %(cols)s, content_hash
+    FROM import_staging
+    ORDER BY identifier, seq DESC
+), old AS (
+    SELECT a.identifier, %(facets)s FROM archive_items a JOIN staged USING (identifier)
+), merged AS (
+INSERT INTO archive_items (%(cols)s, content_hash)
+SELECT %(cols)s, content_hash FROM staged
+ORDER BY identifier
+""" % {'cols': ', '.join(ARCHIVE_COLUMNS),
+       'facets': ', '.join('a.' + c for c in FACET_COLUMNS)} + UPSERT_CLAUSE + """
+RETURNING identifier, (xmax = 0) AS inserted, %(facets)s
+)
+SELECT merged.inserted, %(merged)s, %(old)s
+FROM merged LEFT JOIN old USING (identifier)
+""" % {'facets': ', '.join(FACET_COLUMNS), 'old': OLD_FACETS,
+       'merged': ', '.join('merged.' + c for c in FACET_COLUMNS)}
+
+# ---------- Partitioned archive_items ----------
+# partition_archive_items.py turns archive_items into a table LIST-partitioned
+# by mediatype. Rows are then written straight into their leaf partition: each
+# batch is merged one partition at a time, so only that partition's (smaller)
+# indexes are touched, and RETURNING (xmax = 0), which Postgres refuses on a
+# partitioned parent, keeps working on the leaf. A row whose mediatype changed
+# is deleted from its old partition in the same statement.
+PARTITIONS_SQL = """
+SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'archive_items'::regclass
+"""
+
+# Same parameters and result as INSERT_SQL
+PARTITION_INSERT_SQL = """
+WITH old AS (
+    SELECT %s FROM archive_items WHERE identifier = %%s
+), merged AS (
+INSERT INTO {leaf} AS archive_items
+(identifier, title, description, language, item_size, downloads, btih,
+ mediatype, subject, publicdate, url, content_hash)
+VALUES (%%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s)
+""" % ', '.join(FACET_COLUMNS) + PARTITION_UPSERT_CLAUSE + """RETURNING (xmax = 0) AS inserted
+)
+SELECT merged.inserted, %s FROM merged LEFT JOIN old ON true
+""" % OLD_FACETS
+
+# Returns the facet columns of the row it deleted, if any
+MOVE_ROW_SQL = ("DELETE FROM archive_items WHERE identifier = %s AND mediatype IS DISTINCT FROM %s RETURNING "
+                + ', '.join(FACET_COLUMNS))
+
+# MERGE_SQL for the staged rows that belong to one leaf: the winner of each
+# identifier is picked across the whole batch, then filtered to this leaf's
+# mediatypes (%(nulls)s: whether it also takes NULL, i.e. is the default).
+PARTITION_MERGE_SQL = """
+WITH staged AS (
+    SELECT DISTINCT ON (identifier) %(cols)s, content_hash
+    FROM import_staging
+    ORDER BY identifier, seq DESC
+), routed AS (
+    SELECT * FROM staged
+    WHERE mediatype = ANY(%%(mediatypes)s) OR (mediatype IS NULL AND %%(nulls)s)
+), old AS (
+    SELECT a.identifier, %(facets)s FROM archive_items a JOIN routed USING (identifier)
+), moved AS (
+    DELETE FROM archive_items a USING routed
+    WHERE a.identifier = routed.identifier AND a.mediatype IS DISTINCT FROM routed.mediatype
+), merged AS (
+INSERT INTO {leaf} AS archive_items (%(cols)s, content_hash)
+SELECT %(cols)s, content_hash FROM routed
+ORDER BY identifier
+""" % {'cols': ', '.join(ARCHIVE_COLUMNS),
+       'facets': ', '.join('a.' + c for c in FACET_COLUMNS)} + PARTITION_UPSERT_CLAUSE + """
+RETURNING identifier, (xmax = 0) AS inserted, %(facets)s
+)
+SELECT merged.inserted, %(merged)s, %(old)s
+FROM merged LEFT JOIN old USING (identifier)
+""" % {'facets': ', '.join(FACET_COLUMNS), 'old': OLD_FACETS,
+       'merged': ', '.join('merged.' + c for c in FACET_COLUMNS)}
+
+# {mediatype: leaf} of this process's database, with the default partition
+# under None; {} while archive_items is a plain table. Read once per process.
+_partitions = None
+
+def archive_partitions(cursor):
+    global _partitions
+    if _partitions is None:
+        cursor.execute(PARTITIONS_SQL)
+        partitions = {}
+        for leaf, bound in cursor.fetchall():
+            if bound == 'DEFAULT':
+                partitions[None] = leaf
+            else:
+                for value in re.findall(r"'((?:[^']|'')*)'", bound):
+                    partitions[value.replace("''", "'")] = leaf
+        _partitions = partitions
+    return _partitions
+
+def partition_for(partitions, mediatype):
+    """The leaf partition a row with this mediatype is stored in."""
+    leaf = partitions.get(mediatype) if mediatype is not None else None
+    if leaf is None:
+        leaf = partitions.get(None)
+    if leaf is None:
+        raise ValueError(f"archive_items has no partition for mediatype {mediatype!r} and no default")
+    return leaf
+
+def sanitize_item(item):
+    """
+    Normalize a decoded NDJSON record into a tuple ordered like ARCHIVE_COLUMNS.
+    Returns None when no identifier can be extracted, or when the line decoded
+    to something other than a JSON object. subject is returned as a plain
+    Python object; callers wrap it for the driver they use.
+    """
+    if not isinstance(item, dict):
+        return None
+    identifier = extract_identifier(item)
+    if not identifier:
+        return None
+
+    # sanitize/truncate fields
+    identifier = safe_truncate(identifier, MAX_IDENTIFIER)
+    title = item.get('title')
+    title = None if title in (None, 'Unknown') else str(title)
+    description = item.get('description')
+    description = None if description in (None, 'Unknown') else str(description)
+    language = item.get('language')
+    language = None if language in (None, 'Unknown') else safe_truncate(language, MAX_LANGUAGE)
+    # item_size: coerce to int (or 0)
+    try:
+        item_size = item.get('item_size', 0) or 0
+        item_size = int(item_size)
+    except Exception:
+        item_size = 0
+    # downloads
+    try:
+        downloads = item.get('downloads', 0) or 0
+        downloads = int(downloads)
+    except Exception:
+        downloads = 0
+    btih = item.get('btih')
+    btih = None if btih in (None, 'Unknown') else safe_truncate(btih, MAX_BTIH)
+    mediatype = item.get('mediatype')
+    mediatype = None if mediatype in (None, 'Unknown') else safe_truncate(mediatype, MAX_MEDIATYPE)
+    subject_obj = normalize_subject(item.get('subject'))
+    publicdate = publicdate_utc(parse_publicdate(item.get('publicdate')))
+    url = item.get('url')
+    url = None if url in (None, 'Unknown') else str(url)
+
+    return (identifier, title, description, language, item_size, downloads,
+            btih, mediatype, subject_obj, publicdate, url)
+
+def _is_unknown(v):
+    return v is None or v == 'Unknown'
+
+def _text_column(values, max_len=None):
+    """Column-wise counterpart of the `None if v in (None, 'Unknown') else str(v)` fields."""
+    if max_len is None:
+        return [None if _is_unknown(v) else (v if type(v) is str else str(v)) for v in values]
+    return [None if _is_unknown(v) else (v if type(v) is str else str(v))[:max_len] for v in values]
+
+def _int_column(values):
+    """Column-wise counterpart of the int coercion in sanitize_item (bad values become 0)."""
+    out = []
+    for v in values:
+        if type(v) is int:
+            out.append(v)
+            continue
+        try:
+            out.append(int(v or 0))
+        except Exception:
+            out.append(0)
+    return out
+
+def sanitize_batch(items):
+    """
+    Batch counterpart of sanitize_item: normalize decoded records one column at
+    a time instead of one row at a time. Returns (keep, columns) where keep lists
+    the indexes of items that have an identifier and columns holds one list per
+    ARCHIVE_COLUMNS entry, aligned with keep. Values are identical to what
+    sanitize_item returns for each kept item; non-objects are never kept.
+    """
+    identifiers = []
+    for item in items:
+        if not isinstance(item, dict):
+            identifiers.append(None)
+            continue
+        v = item.get('identifier')
+        identifiers.append(str(v) if v and v != 'Unknown' else extract_identifier(item))
+    keep = [i for i, identifier in enumerate(identifiers) if identifier]
+    if len(keep) != len(items):
+        items = [items[i] for i in keep]
+        identifiers = [identifiers[i] for i in keep]
 
-def insert_item(conn, cursor, item):
+    columns = [
+        [identifier[:MAX_IDENTIFIER] for identifier in identifiers],
+        _text_column([item.get('title') for item in items]),
+        _text_column([item.get('description') for item in items]),
+        _text_column([item.get('language') for item in items], MAX_LANGUAGE),
+        _int_column([item.get('item_size', 0) for item in items]),
+        _int_column([item.get('downloads', 0) for item in items]),
+        _text_column([item.get('btih') for item in items], MAX_BTIH),
+        _text_column([item.get('mediatype') for item in items], MAX_MEDIATYPE),
+        [v if type(v) is list else normalize_subject(v) for v in (item.get('subject') for item in items)],
+        [publicdate_utc(parse_publicdate(item.get('publicdate'))) for item in items],
+        _text_column([item.get('url') for item in items]),
+    ]
+    return keep, columns
+
+def _hash_text(v):
+    return '\\N' if v is None else copy_escape(v)
+
+def _hash_publicdate(v):
+    # Stored as TIMESTAMP: aware and naive spellings of the same UTC instant hash alike
+    v = publicdate_utc(v)
+    return '\\N' if v is None else v.isoformat()
+
+def content_hashes(columns):
+    """
+    16-byte md5 of each row's normalized fields (columns as built by
+    sanitize_batch), stored in archive_items.content_hash so re-imports can
+    skip rows that did not change. Subject is hashed as its subject_json.
+    """
+    rendered = []
+    for name, column in zip(ARCHIVE_COLUMNS, columns):
+        if name == 'subject':
+            rendered.append(['\\N' if v is None else subject_json(v) for v in column])
+        elif name == 'publicdate':
+            rendered.append([_hash_publicdate(v) for v in column])
+        else:
+            rendered.append([_hash_text(v) for v in column])
+    return [hashlib.md5('\t'.join(fields).encode('utf-8')).digest() for fields in zip(*rendered)]
+
+def count_facets(facets, mediatype, language, subject, publicdate, sign=1):
+    """
+    Add sign to facets, a Counter keyed by (kind, mediatype, value), for the
+    language, each subject and the publicdate year of one row (its
+    FACET_COLUMNS), derived the way refresh_filter_tables() derives them;
+    rows without a mediatype count under ''. A written row adds its new
+    values and takes away the ones it replaced, so the counts follow the
+    table exactly.
+    """
+    mediatype = mediatype or ''
+    if language and language.strip(' '):
+        facets['language', mediatype, language.strip(' ')[:MAX_FACET_VALUE]] += sign
+    if publicdate is not None:
+        facets['year', mediatype, str(publicdate.year)] += sign
+    for value in subject_strings(subject):
+        if value.strip(' ') and value != 'Unknown':
+            facets['subject', mediatype, value.strip(' ')[:MAX_FACET_VALUE]] += sign
+
+def insert_item(conn, cursor, item, facets=None):
     """
     Insert a single item using a SAVEPOINT so that a failure here won't abort the
-    whole transaction. Returns True if inserted/updated, False if skipped due to
-    missing identifier, or raises for unexpected errors.
+    whole transaction. Returns 'inserted', 'updated' or 'unchanged' (content_hash
+    matched, row left alone), None if skipped due to missing identifier or a
+    DB error, or raises for unexpected errors. With a facets Counter, the
+    facet changes of a written row are added to it (see count_facets).
     """
     # create a local savepoint for this row
     cursor.execute("SAVEPOINT before_row;")
     try:
-        identifier = extract_identifier(item)
-        if not identifier:
+        row = sanitize_item(item)
+        if row is None:
             # Nothing to do
             cursor.execute("ROLLBACK TO SAVEPOINT before_row;")
             cursor.execute("RELEASE SAVEPOINT before_row;")
-            return False
-
-        # sanitize/truncate fields
-        identifier = safe_truncate(identifier, MAX_IDENTIFIER)
-        title = item.get('title')
-        title = None if title in (None, 'Unknown') else str(title)
-        description = item.get('description')
-        description = None if description in (None, 'Unknown') else str(description)
-        language = item.get('language')
-        language = None if language in (None, 'Unknown') else safe_truncate(language, MAX_LANGUAGE)
-        # item_size: coerce to int (or 0)
-        try:
-            item_size = item.get('item_size', 0) or 0
-            item_size = int(item_size)
-        except Exception:
-            item_size = 0
-        # downloads
-        try:
-            downloads = item.get('downloads', 0) or 0
-            downloads = int(downloads)
-        except Exception:
-            downloads = 0
-        btih = item.get('btih')
-        btih = None if btih in (None, 'Unknown') else safe_truncate(btih, MAX_BTIH)
-        mediatype = item.get('mediatype')
-        mediatype = None if mediatype in (None, 'Unknown') else safe_truncate(mediatype, MAX_MEDIATYPE)
-        subject_obj = normalize_subject(item.get('subject'))
-        publicdate = parse_publicdate(item.get('publicdate'))
-        url = item.get('url')
-        url = None if url in (None, 'Unknown') else str(url)
+            return None
 
         # Use psycopg2.extras.Json for JSONB column
+        subject_obj = row[8]
         subject_param = psycopg2.extras.Json(subject_obj) if subject_obj is not None else None
+        content_hash = content_hashes([[v] for v in row])[0]
 
-        cursor.execute(INSERT_SQL, (
-            identifier, title, description, language, item_size, downloads,
-            btih, mediatype, subject_param, publicdate, url
-        ))
+        params = (row[0],) + row[:8] + (subject_param,) + row[9:] + (content_hash,)
+        partitions = archive_partitions(cursor)
+        moved = None
+        if partitions:
+            leaf = partition_for(partitions, row[7])
+            cursor.execute(MOVE_ROW_SQL, (row[0], row[7]))
+            moved = cursor.fetchone()
+            cursor.execute(psycopg2.sql.SQL(PARTITION_INSERT_SQL).format(
+                leaf=psycopg2.sql.Identifier(leaf)), params)
+        else:
+            cursor.execute(INSERT_SQL, params)
+        result = cursor.fetchone()
         # release savepoint on success
         cursor.execute("RELEASE SAVEPOINT before_row;")
-        return True
+        if result is None:
+            return 'unchanged'
+        if facets is not None:
+            count_facets(facets, *(row[ARCHIVE_COLUMNS.index(c)] for c in FACET_COLUMNS))
+            count_facets(facets, *(moved or result[1:]), sign=-1)
+        return 'inserted' if result[0] else 'updated'
 
     except psycopg2.Error as e:
         # Roll back only to this savepoint, not whole transaction
@@ -221,123 +717,1343 @@ def insert_item(conn, cursor, item):
             cursor.execute("ROLLBACK TO SAVEPOINT before_row;")
             cursor.execute("RELEASE SAVEPOINT before_row;")
         except Exception:
-            # If release fails, attempt full rollback to keep connection usable
-            conn.rollback()
+            # The whole transaction is lost; the caller has to stop rather
+            # than commit (and checkpoint) past the rows it held
+            raise e
         # Log detailed diagnostics
         logger.warning("DB error inserting identifier=%s: %s", item.get('identifier', '<missing>'), e.pgerror or str(e))
         # Optionally, log the row data for offline inspection (avoid huge logs)
         logger.debug("Failed row (truncated): %s", json.dumps(item)[:1000])
-        return False
+        return None
+
+# ---------- COPY bulk path ----------
+def copy_escape(val):
+    """Render a value for COPY text format (tab separated, \\N for NULL)."""
+    if val is None:
+        return '\\N'
+    return (str(val).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+# A COPY batch is (seqs, columns): the sequence numbers of its rows and the
+# column lists produced by sanitize_batch, aligned with them.
+def copy_text(batch):
+    """Render a COPY batch as COPY text format, one column at a time."""
+    seqs, columns = batch
+    rendered = [[str(seq) for seq in seqs]]
+    for name, column in zip(ARCHIVE_COLUMNS, columns):
+        if name == 'subject':
+            column = [jsoncodec.dumps(v) if v is not None else None for v in column]
+        elif name == 'publicdate':
+            column = [v.isoformat() if v is not None else None for v in column]
+        rendered.append([copy_escape(v) for v in column])
+    # bytea hex input, with the backslash escaped for COPY text format
+    rendered.append(['\\\\x' + h.hex() for h in content_hashes(columns)])
+    return ''.join('\t'.join(fields) + '\n' for fields in zip(*rendered))
+
+def slice_batch(batch, lo, hi):
+    seqs, columns = batch
+    return seqs[lo:hi], [column[lo:hi] for column in columns]
+
+def merge_counts(cursor, facets=None):
+    """
+    Run MERGE_SQL over the staged rows, or PARTITION_MERGE_SQL once per leaf
+    partition they belong to; returns a Counter of inserted/updated/unchanged.
+    The facet changes of the written rows are added to facets when given.
+    """
+    cursor.execute("SELECT count(DISTINCT identifier) FROM import_staging")
+    counts = Counter(unchanged=cursor.fetchone()[0])
+    partitions = archive_partitions(cursor)
+    if not partitions:
+        statements = [(MERGE_SQL, None)]
+    else:
+        cursor.execute("SELECT DISTINCT mediatype FROM import_staging")
+        leaves = {}
+        for mediatype, in cursor.fetchall():
+            leaves.setdefault(partition_for(partitions, mediatype), []).append(mediatype)
+        statements = [(psycopg2.sql.SQL(PARTITION_MERGE_SQL).format(leaf=psycopg2.sql.Identifier(leaf)),
+                       {'mediatypes': [m for m in mediatypes if m is not None],
+                        'nulls': None in mediatypes})
+                      for leaf, mediatypes in sorted(leaves.items())]
+    width = len(FACET_COLUMNS)
+    for sql, params in statements:
+        cursor.execute(sql, params)
+        for inserted, *values in cursor:
+            counts['inserted' if inserted else 'updated'] += 1
+            counts['unchanged'] -= 1
+            if facets is not None:
+                count_facets(facets, *values[:width])
+                count_facets(facets, *values[width:], sign=-1)
+    return counts
+
+def copy_and_merge(cursor, batch, facets=None):
+    """Load a COPY batch into the staging table and merge it into archive_items."""
+    cursor.execute("TRUNCATE import_staging;")
+    cursor.copy_expert(COPY_SQL, io.StringIO(copy_text(batch)))
+    return merge_counts(cursor, facets)
+
+def flush_copy_batch(cursor, batch, attempt=0, facets=None):
+    """
+    COPY + merge a (seqs, columns) batch inside a SAVEPOINT. If the batch is
+    rejected, bisect it so only the offending rows are dropped: a batch with k bad
+    rows costs O(k log n) extra round trips instead of one savepoint per row.
+    Deadlocks and serialization failures are not the rows' fault, so the whole
+    batch is retried with jittered backoff instead. Returns a Counter of
+    inserted/updated/unchanged/errors rows; the facet changes of the rows that
+    were merged, and not rolled back, are added to facets when given.
+    """
+    rows = len(batch[0])
+    delta = Counter()
+    cursor.execute("SAVEPOINT copy_batch;")
+    try:
+        counts = copy_and_merge(cursor, batch, delta)
+    except psycopg2.extensions.TransactionRollbackError as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT copy_batch;")
+        cursor.execute("RELEASE SAVEPOINT copy_batch;")
+        if attempt >= DEADLOCK_RETRIES:
+            raise
+        logger.info("Batch lost a lock race (%s); retrying", e.pgcode)
+        time.sleep(0.1 * (2 ** attempt) * (1 + random.random()))
+        return flush_copy_batch(cursor, batch, attempt + 1, facets)
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT copy_batch;")
+        cursor.execute("RELEASE SAVEPOINT copy_batch;")
+        if rows == 1:
+            logger.warning("DB error merging identifier=%s: %s", batch[1][0][0], e.pgerror or str(e))
+            return Counter(errors=1)
+        mid = rows // 2
+        return (flush_copy_batch(cursor, slice_batch(batch, 0, mid), facets=facets) +
+                flush_copy_batch(cursor, slice_batch(batch, mid, rows), facets=facets))
+    cursor.execute("RELEASE SAVEPOINT copy_batch;")
+    if facets is not None:
+        facets.update(delta)
+    return counts
+
+def flush_arrow_batch(cursor, batch, seq_start, facets=None):
+    """
+    COPY + merge one Arrow RecordBatch of sanitized columns in a single round
+    trip. If it is rejected, fall back to flush_copy_batch on the batch's
+    columns, which bisects down to the offending rows. Returns a Counter like
+    flush_copy_batch, and adds to facets like it.
+    """
+    import columnar
+    delta = Counter()
+    cursor.execute("SAVEPOINT arrow_batch;")
+    try:
+        cursor.execute("TRUNCATE import_staging;")
+        cursor.copy_expert(COPY_CSV_SQL, io.BytesIO(columnar.batch_to_csv(batch, seq_start)))
+        counts = merge_counts(cursor, delta)
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT arrow_batch;")
+        cursor.execute("RELEASE SAVEPOINT arrow_batch;")
+        logger.info("Arrow batch rejected (%s); retrying row by row", e.pgcode)
+        seqs = list(range(seq_start, seq_start + batch.num_rows))
+        return flush_copy_batch(cursor, (seqs, columnar.batch_columns(batch)), facets=facets)
+    cursor.execute("RELEASE SAVEPOINT arrow_batch;")
+    if facets is not None:
+        facets.update(delta)
+    return counts
 
 # ---------- File import logic ----------
-def import_ndjson_file(file_path, conn):
+def dedupe_batch(batch, winners=None, file_path=None):
+    """
+    Drop superseded rows from a (seqs, columns) batch before it is sent: keep
+    only the last row of each identifier (rows are in seq order), and with a
+    WinnerIndex also drop rows that a later line in some input file overrides.
+    Returns (batch, rows dropped).
+    """
+    seqs, columns = batch
+    last = {identifier: i for i, identifier in enumerate(columns[0])}
+    survivors = sorted(last.values())
+    if winners is not None:
+        survivors = winners.filter(file_path, survivors, columns[0], seqs)
+    dropped = len(seqs) - len(survivors)
+    if not dropped:
+        return batch, 0
+    return ([seqs[i] for i in survivors], [[column[i] for i in survivors] for column in columns]), dropped
+
+def commit_copy_batch(conn, cursor, seqs, items, winners=None, file_path=None, facets=None):
+    """
+    Sanitize decoded items (sanitize_batch), drop duplicate identifiers
+    (dedupe_batch), flush the rest as one COPY batch and commit it together
+    with its facet deltas (see write_facet_deltas); once committed, they are
+    also added to facets. Returns a Counter of
+    inserted/updated/unchanged/skipped/duplicates/errors. A failed commit
+    raises, leaving the caller to roll back.
+    """
+    if not items:
+        return Counter()
+    keep, columns = sanitize_batch(items)
+    skipped = len(items) - len(keep)
+    if skipped:
+        seqs = [seqs[i] for i in keep]
+    batch, duplicates = dedupe_batch((seqs, columns), winners, file_path)
+    delta = Counter() if facets is not None else None
+    counts = flush_copy_batch(cursor, batch, facets=delta) if batch[0] else Counter()
+    counts.update(skipped=skipped, duplicates=duplicates)
+    if delta:
+        write_facet_deltas(cursor, delta)
+    conn.commit()
+    logger.info("Committed COPY batch: %d inserted, %d updated, %d unchanged, "
+                "%d duplicates dropped, %d rejected", counts['inserted'], counts['updated'],
+                counts['unchanged'], duplicates, counts['errors'])
+    if facets is not None:
+        facets.update(delta)
+    return counts
+
+# ---------- Cross-file dedup ----------
+class WinnerIndex:
+    """
+    On-disk map of identifier -> (file, byte offset) of its last occurrence
+    across an ordered list of input files. A reload that only writes those
+    rows writes every identifier once, and ends in the same state as a serial
+    import of the files in that order. Kept in SQLite so memory stays flat
+    however many identifiers there are.
+    """
+
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, path=WINNER_INDEX):
+        self.db = sqlite3.connect(path)
+        self.file_ids = dict(self.db.execute("SELECT path, id FROM files"))
+
+    @classmethod
+    def build(cls, ndjson_files, path=WINNER_INDEX):
+        """Scan every file once, in order, recording where each identifier occurs last."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute("CREATE TABLE files (path TEXT PRIMARY KEY, id INTEGER)")
+        db.execute("CREATE TABLE winners (identifier TEXT PRIMARY KEY, file INTEGER, "
+                   "offset INTEGER) WITHOUT ROWID")
+        lines = 0
+        with tqdm(desc="Indexing identifiers", unit="lines") as pbar:
+            for file_id, file_path in enumerate(ndjson_files):
+                db.execute("INSERT INTO files VALUES (?, ?)", (os.path.abspath(file_path), file_id))
+                pending = []
+                with read_ndjson(file_path) as (file_lines, _):
+                    for offset, raw in file_lines:
+                        lines += 1
+                        if is_blank(raw):
+                            continue
+                        try:
+                            item = jsoncodec.loads(raw)
+                            identifier = extract_identifier(item)
+                        except (ValueError, AttributeError):
+                            continue
+                        if identifier:
+                            pending.append((identifier[:MAX_IDENTIFIER], file_id, offset))
+                        if len(pending) >= COPY_BATCH:
+                            # Files and lines are scanned in order, so the latest write wins
+                            db.executemany("INSERT OR REPLACE INTO winners VALUES (?, ?, ?)", pending)
+                            pbar.update(len(pending))
+                            pending = []
+                db.executemany("INSERT OR REPLACE INTO winners VALUES (?, ?, ?)", pending)
+                pbar.update(len(pending))
+        db.commit()
+        count = db.execute("SELECT count(*) FROM winners").fetchone()[0]
+        db.close()
+        logger.info("Indexed %d distinct identifiers in %d lines of %d file(s)",
+                    count, lines, len(ndjson_files))
+        return cls(path)
+
+    def filter(self, file_path, indexes, identifiers, seqs):
+        """The subset of indexes whose row (identifiers[i] at byte seqs[i] of file_path) is the last occurrence."""
+        file_id = self.file_ids.get(os.path.abspath(file_path))
+        if file_id is None:
+            return indexes
+        last = {}
+        for lo in range(0, len(indexes), self.LOOKUP_CHUNK):
+            chunk = [identifiers[i] for i in indexes[lo:lo + self.LOOKUP_CHUNK]]
+            query = ("SELECT identifier, offset FROM winners WHERE file = ? AND identifier IN (%s)"
+                     % ','.join('?' * len(chunk)))
+            last.update(self.db.execute(query, [file_id] + chunk))
+        return [i for i in indexes if last.get(identifiers[i]) == seqs[i]]
+
+    def is_last(self, file_path, identifier, offset):
+        return self.filter(file_path, [0], [identifier[:MAX_IDENTIFIER]], [offset]) == [0]
+
+    def close(self):
+        self.db.close()
+
+# ---------- Checkpoints ----------
+def checkpoint_path(file_path, shard_start):
+    digest = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CHECKPOINT_DIR, f"{digest}-{shard_start}.json")
+
+def save_checkpoint(file_path, shard_start, end, offset, done=False):
+    """
+    Durably record that every line of the shard before `offset` is committed.
+    Written to a temp file, fsynced and renamed over the old checkpoint, so a
+    crash leaves either the previous or the new offset, never a torn file.
+    Must only be called after conn.commit() succeeded. Compressed files have
+    end=None (read to EOF) and are marked `done` once fully imported.
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = checkpoint_path(file_path, shard_start)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'file': os.path.abspath(file_path), 'start': shard_start,
+                   'end': end, 'offset': offset, 'done': done,
+                   'size': os.path.getsize(file_path)}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_checkpoints():
+    """Return {abs file path: [checkpoint entries]} from CHECKPOINT_DIR."""
+    entries = {}
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return entries
+    for name in os.listdir(CHECKPOINT_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(CHECKPOINT_DIR, name), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", name, e)
+            continue
+        entries.setdefault(entry['file'], []).append(entry)
+    return entries
+
+def clear_checkpoints():
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return
+    for name in os.listdir(CHECKPOINT_DIR):
+        os.remove(os.path.join(CHECKPOINT_DIR, name))
+
+def plan_shards(ndjson_files, shard_bytes, resume=False):
+    """
+    Build the list of (file_path, shard_start, offset, end) tasks to import.
+    Every shard gets a checkpoint up front so a resumed run sees the same plan
+    regardless of its worker count. With resume, shards continue from their
+    committed offset, finished shards are dropped, and bytes appended to a
+    file since the last run become new shards.
+    """
+    done = load_checkpoints() if resume else {}
+    if not resume:
+        clear_checkpoints()
+    tasks = []
+    for file_path in ndjson_files:
+        if file_path.endswith(COMPRESSED_SUFFIXES):
+            # Not seekable by byte range: one shard, resumed by skipping
+            # decompressed bytes; rescanned from the offset if the file grew.
+            entries = done.get(os.path.abspath(file_path))
+            if not entries:
+                save_checkpoint(file_path, 0, None, 0)
+                tasks.append((file_path, 0, 0, None))
+            elif not entries[0]['done'] or os.path.getsize(file_path) > entries[0]['size']:
+                tasks.append((file_path, 0, entries[0]['offset'], None))
+            continue
+        covered = 0
+        for entry in sorted(done.get(os.path.abspath(file_path), []), key=lambda e: e['start']):
+            covered = max(covered, entry['end'])
+            if entry['offset'] < entry['end']:
+                tasks.append((file_path, entry['start'], entry['offset'], entry['end']))
+        for start, end in shard_boundaries(file_path, shard_bytes, start=covered):
+            save_checkpoint(file_path, start, end, start)
+            tasks.append((file_path, start, start, end))
+    return tasks
+
+def shard_boundaries(file_path, shard_bytes=SHARD_BYTES, start=0):
+    """
+    Split a file from `start` (a line start) to EOF into [start, end) byte
+    ranges of roughly shard_bytes each. Every cut is moved forward to the start
+    of the next line, so each line belongs to exactly one shard and no line is
+    ever split.
+    """
+    size = os.path.getsize(file_path)
+    if size <= start:
+        return []
+    cuts = [start]
+    # One newline search per cut on the mapping: O(shards), nothing else is read
+    with map_ndjson(file_path) as mapped:
+        target = start + shard_bytes
+        while target < size:
+            newline = mapped.find(b'\n', target - 1)
+            pos = newline + 1 if newline >= 0 else size
+            if pos >= size:
+                break
+            if pos > cuts[-1]:
+                cuts.append(pos)
+            target = max(pos, target) + shard_bytes
+    cuts.append(size)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+@contextlib.contextmanager
+def map_ndjson(file_path):
+    """
+    Map a plain file read-only. Yields the mmap (b'' for an empty file, which
+    cannot be mapped). Pages are shared through the page cache, so any number
+    of worker processes can map the same file without copying it.
+    """
+    with open(file_path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            yield b''
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        except (AttributeError, OSError):
+            pass
+        try:
+            yield mapped
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                # A caller still holds a line; the mapping goes when it does
+                pass
+
+def iter_mapped_lines(mapped, start, end=None):
+    """
+    Yield (offset, raw_line) for every line of a mapping that starts inside
+    [start, end), like iter_lines, but raw_line is a zero-copy memoryview of
+    the mapping. It is only valid while the mapping is open; bytes() it to
+    keep it.
+    """
+    view = memoryview(mapped)
+    size = len(view)
+    end = size if end is None else min(end, size)
+    find = mapped.find
+    offset = start
+    while offset < end:
+        newline = find(b'\n', offset)
+        stop = newline + 1 if newline >= 0 else size
+        yield offset, view[offset:stop]
+        offset = stop
+
+@contextlib.contextmanager
+def read_ndjson(file_path, start=0, end=None):
+    """
+    Yields (lines, raw): an iterator of (offset, raw_line) over the lines that
+    start inside [start, end), and the file object underneath. Plain files are
+    memory-mapped (iter_mapped_lines); .gz / .zst are decompressed on the fly
+    (open_ndjson, iter_lines) and raw.tell() tracks compressed bytes read.
+    """
+    if file_path.endswith(COMPRESSED_SUFFIXES):
+        with open_ndjson(file_path) as (f, raw):
+            yield iter_lines(f, start, end), raw
+        return
+    with open(file_path, 'rb') as raw, map_ndjson(file_path) as mapped:
+        yield iter_mapped_lines(mapped, start, end), raw
+
+def is_blank(raw):
+    """True for an empty or whitespace-only raw line (bytes or memoryview)."""
+    return raw[:1] != b'{' and not bytes(raw).strip()
+
+@contextlib.contextmanager
+def open_ndjson(file_path):
+    """
+    Open an NDJSON file for binary line reading, decompressing .gz / .zst on
+    the fly without writing anything to disk. Yields (reader, raw) where raw
+    is the underlying file, whose position tracks compressed bytes consumed.
+    """
+    with open(file_path, 'rb') as raw:
+        if file_path.endswith('.gz'):
+            with gzip.GzipFile(fileobj=raw, mode='rb') as reader:
+                yield reader, raw
+        elif file_path.endswith('.zst'):
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read %s (pip install zstandard)" % file_path)
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            with io.BufferedReader(stream) as reader:
+                yield reader, raw
+        else:
+            yield raw, raw
+
+def iter_lines(f, start, end=None):
+    """
+    Yield (offset, raw_line) for every line that starts inside [start, end);
+    end=None reads to EOF. Unseekable (zstd) streams skip forward by reading.
+    """
+    if f.seekable():
+        f.seek(start)
+    else:
+        remaining = start
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+    offset = start
+    if end is None:
+        end = float('inf')
+    while offset < end:
+        line = f.readline()
+        if not line:
+            break
+        yield offset, line
+        offset += len(line)
+
+def read_line_index(file_path):
+    """
+    Line count from the scraper's `<file>.lines` sidecar, or None when it is
+    missing or stale (its recorded byte size no longer matches the file).
+    """
+    index_path = file_path + '.lines'
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('bytes') != os.path.getsize(file_path):
+        return None
+    return index.get('lines')
+
+STAT_KEYS = ('inserted', 'updated', 'unchanged', 'skipped', 'duplicates', 'errors')
+
+def log_stats(stats):
+    logger.info("Completed: %d inserted, %d updated, %d unchanged, %d skipped, %d duplicates, %d errors",
+                *(stats[key] for key in STAT_KEYS))
+
+def import_ndjson_file(file_path, conn, mode='row', batch_size=COPY_BATCH,
+                       start=0, end=None, progress=True, shard_start=None, winners=None,
+                       facets=None):
+    """
+    Import the lines of file_path that start inside [start, end) (default: the
+    whole file). Returns a dict of STAT_KEYS counts; rows whose content_hash
+    matches the stored one count as unchanged and are not rewritten.
+    The byte offset of each line doubles as its sequence number, so later lines
+    win when a batch holds the same identifier twice; only that last row is
+    sent. With a WinnerIndex, rows overridden anywhere later in the input
+    files are not sent either.
+
+    With shard_start set, the offset of the first uncommitted line is saved to
+    that shard's checkpoint after every successful commit. A failed commit (or
+    an error that loses the open transaction) stops the import with a
+    RuntimeError instead of carrying on: a later commit would checkpoint past
+    the rows that were rolled back. --resume picks up after the last commit.
+    With a facets
+    Counter, every commit also writes the facet changes of its rows (see
+    write_facet_deltas), and they are added to the Counter.
+    """
+    stats = dict.fromkeys(STAT_KEYS, 0)
     if not os.path.exists(file_path):
         logger.error("File not found: %s", file_path)
-        return 0
+        return stats
 
-    logger.info("Importing %s", file_path)
-    inserted = 0
-    skipped = 0
-    errors = 0
+    compressed = file_path.endswith(COMPRESSED_SUFFIXES)
+    if end is None and not compressed:
+        end = os.path.getsize(file_path)
+    if progress:
+        logger.info("Importing %s", file_path)
+    counts = Counter()
+    rows_done = 0
     cursor = conn.cursor()
+    batch = []
+    seqs = []
+    if mode == 'copy':
+        cursor.execute(STAGING_SQL)
 
-    # Count lines for progress bar
-    with open(file_path, 'r', encoding='utf-8') as f:
-        total_lines = sum(1 for _ in f)
-
-    # Re-open and process
-    with open(file_path, 'r', encoding='utf-8') as f:
-        with tqdm(total=total_lines, desc="Processing", unit="items") as pbar:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:
-                    pbar.update(1)
-                    continue
-                try:
-                    item = json.loads(line)
-                except json.JSONDecodeError as e:
-                    logger.warning("JSON decode error in %s line %d: %s", file_path, line_num, e)
-                    errors += 1
-                    pbar.update(1)
-                    continue
+    # Single pass: progress is driven by bytes consumed, so rate and ETA are
+    # accurate without counting lines first. The scraper's line-count sidecar,
+    # when present and current, adds an item total to the bar.
+    total_items = read_line_index(file_path) if progress and start == 0 else None
+    processed = 0
+    next_offset = start
+    reached_end = False
 
-                try:
-                    ok = insert_item(conn, cursor, item)
-                    if ok:
-                        inserted += 1
-                    else:
-                        skipped += 1
-                except Exception as e:
-                    # Shouldn't normally reach here since insert_item handles db errors,
-                    # but catch anything unexpected:
-                    logger.exception("Unexpected error processing %s line %d: %s", file_path, line_num, e)
-                    errors += 1
-                    # ensure DB connection is usable
-                    try:
-                        conn.rollback()
-                        cursor = conn.cursor()
-                    except Exception:
-                        logger.error("Connection unusable after error; aborting file import.")
-                        break
-
-                # Commit periodically
-                if (inserted + skipped) % COMMIT_BATCH == 0:
+    last_commit = start
+
+    def committed(offset, done=False):
+        nonlocal last_commit
+        last_commit = offset
+        if shard_start is not None:
+            save_checkpoint(file_path, shard_start, end, offset, done)
+
+    # Facet changes of the row-mode rows written since the last commit
+    pending = Counter() if facets is not None else None
+
+    def commit_rows():
+        if pending:
+            write_facet_deltas(cursor, pending)
+        conn.commit()
+        if pending is not None:
+            facets.update(pending)
+            pending.clear()
+
+    def rollback_rows():
+        conn.rollback()
+        if pending is not None:
+            pending.clear()
+
+    def abort(e):
+        try:
+            rollback_rows()
+        except Exception:
+            pass
+        return RuntimeError(f"Import of {file_path} stopped: {e}; nothing after byte {last_commit} "
+                            "was committed (rerun with --resume to continue from there)")
+
+    # For compressed files the bar tracks compressed bytes read from disk
+    total_bytes = os.path.getsize(file_path) if compressed else end - start
+    with read_ndjson(file_path, start, end) as (lines, raw_file), tqdm(total=total_bytes, desc="Processing",
+                                                                      unit="B", unit_scale=True,
+                                                                      unit_divisor=1024,
+                                                                      disable=not progress) as pbar:
+        for offset, raw in lines:
+            next_offset = offset + len(raw)
+            pbar.update((raw_file.tell() if compressed else next_offset - start) - pbar.n)
+            processed += 1
+            if progress and processed % COMMIT_BATCH == 0:
+                pbar.set_postfix(items=f"{processed}/{total_items}" if total_items else processed)
+            if is_blank(raw):
+                continue
+            try:
+                # Plain files: decoded straight from the mapped bytes
+                item = jsoncodec.loads(raw)
+            except ValueError as e:
+                logger.warning("JSON decode error in %s at byte %d: %s", file_path, offset, e)
+                counts['errors'] += 1
+                continue
+            if not isinstance(item, dict):
+                logger.warning("Not a JSON object in %s at byte %d", file_path, offset)
+                counts['errors'] += 1
+                continue
+
+            if mode == 'copy':
+                # Decoded items are sanitized a whole batch at a time
+                batch.append(item)
+                seqs.append(offset)
+                if len(batch) >= batch_size:
                     try:
-                        conn.commit()
-                        logger.info("Committed %d rows (inserted + skipped)", inserted + skipped)
+                        counts.update(commit_copy_batch(conn, cursor, seqs, batch, winners, file_path,
+                                                        facets))
                     except Exception as e:
                         logger.error("Commit failed: %s", e)
-                        conn.rollback()
+                        raise abort(e) from e
+                    batch = []
+                    seqs = []
+                    committed(next_offset)
+                continue
 
-                pbar.update(1)
+            if winners is not None:
+                identifier = extract_identifier(item)
+                if identifier and not winners.is_last(file_path, identifier, offset):
+                    counts['duplicates'] += 1
+                    continue
+
+            try:
+                outcome = insert_item(conn, cursor, item, pending)
+                counts[outcome or 'skipped'] += 1
+                rows_done += 1
+            except Exception as e:
+                # Shouldn't normally reach here since insert_item handles db
+                # errors; anything else has cost the rows since the last commit
+                logger.exception("Unexpected error processing %s at byte %d: %s", file_path, offset, e)
+                raise abort(e) from e
+
+            # Commit periodically
+            if rows_done % COMMIT_BATCH == 0:
+                try:
+                    commit_rows()
+                except Exception as e:
+                    logger.error("Commit failed: %s", e)
+                    raise abort(e) from e
+                committed(next_offset)
+                logger.info("Committed %d rows (%d unchanged)", rows_done, counts['unchanged'])
+        else:
+            reached_end = True
 
     # Final commit
     try:
-        conn.commit()
+        if batch:
+            counts.update(commit_copy_batch(conn, cursor, seqs, batch, winners, file_path, facets))
+        commit_rows()
     except Exception as e:
         logger.error("Final commit failed: %s", e)
-        conn.rollback()
+        raise abort(e) from e
+    # Compressed files have no byte-range end; mark them done at EOF
+    committed(next_offset, done=compressed and reached_end)
 
     cursor.close()
-    logger.info("Completed: %d inserted/updated, %d skipped, %d errors", inserted, skipped, errors)
-    return inserted
+    stats.update((key, counts[key]) for key in STAT_KEYS)
+    if progress:
+        log_stats(stats)
+    return stats
 
-# ---------- Main ----------
-def main():
-    logger.info("Connecting to database...")
+def import_columnar(path, conn, batch_size=COPY_BATCH, facets=None):
+    """
+    Load a Parquet file or dataset written by columnar.py. Record batches are
+    COPYed column-wise into the staging table and merged like --mode=copy;
+    rows were sanitized when the dataset was written. With facets, each batch
+    is committed with its facet deltas, like commit_copy_batch. Returns a
+    stats dict. Like import_ndjson_file, a failed commit (or an error that
+    loses the open transaction) stops the load with a RuntimeError once the
+    batch is rolled back; rerunning it skips the rows already committed as
+    unchanged.
+    """
+    import columnar
+    counts = Counter()
+    cursor = conn.cursor()
+    cursor.execute(STAGING_SQL)
+    seq = 0
+    with tqdm(desc="Processing", unit="items") as pbar:
+        for batch in columnar.read_batches(path, batch_size):
+            delta = Counter() if facets is not None else None
+            try:
+                batch_counts = flush_arrow_batch(cursor, batch, seq, delta)
+                if delta:
+                    write_facet_deltas(cursor, delta)
+                conn.commit()
+            except Exception as e:
+                logger.error("Commit failed: %s", e)
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                raise RuntimeError(f"Load of {path} stopped: {e}; only the {seq} row(s) before this batch "
+                                   "were committed (rerun the load to continue)") from e
+            if facets is not None:
+                facets.update(delta)
+            seq += batch.num_rows
+            counts.update(batch_counts)
+            pbar.update(batch.num_rows)
+    cursor.close()
+    stats = {key: counts[key] for key in STAT_KEYS}
+    log_stats(stats)
+    return stats
+
+# ---------- Worker pool ----------
+# Each pool process owns one connection (and its own read handle on the
+# --dedupe-files index); nothing else is shared between workers. Both are
+# opened by the first shard rather than in the pool initializer: a failing
+# initializer makes the pool respawn the worker forever, while an exception
+# in a task reaches the parent and stops the run.
+_worker_conn = None
+_worker_winners = None
+_worker_winner_index = None
+
+def _worker_init(winner_index=None):
+    global _worker_winner_index
+    _worker_winner_index = winner_index
+
+def _import_shard(task):
+    global _worker_conn, _worker_winners
+    if _worker_conn is None or _worker_conn.closed:
+        # Not connect_db(): it exits the process on failure
+        _worker_conn = psycopg2.connect(**DB_CONFIG)
+    if _worker_winner_index and _worker_winners is None:
+        _worker_winners = WinnerIndex(_worker_winner_index)
+    file_path, shard_start, offset, end, batch_size = task
+    facets = Counter()
+    stats = import_ndjson_file(file_path, _worker_conn, mode='copy', batch_size=batch_size,
+                               start=offset, end=end, progress=False, shard_start=shard_start,
+                               winners=_worker_winners, facets=facets)
+    return file_path, shard_start, end, stats, facets
+
+def import_parallel(shards, workers, batch_size=COPY_BATCH, winner_index=None, facets=None):
+    """
+    Import (file_path, shard_start, offset, end) shards (see plan_shards) with
+    a pool of worker processes. Workers always use the COPY path: each merge
+    upserts its batch in identifier order, so concurrent upserts of the same
+    identifier lock rows in the same order and cannot deadlock on each other;
+    a residual deadlock just retries the batch (see flush_copy_batch).
+    Returns aggregated STAT_KEYS counts; the shards' facet counts are added
+    to facets when given.
+    """
+    tasks = [shard + (batch_size,) for shard in shards]
+    logger.info("Dispatching %d shard(s) to %d worker(s)", len(tasks), workers)
+
+    totals = dict.fromkeys(STAT_KEYS, 0)
+    with multiprocessing.Pool(workers, initializer=_worker_init, initargs=(winner_index,)) as pool:
+        with tqdm(total=len(tasks), desc="Shards", unit="shard") as pbar:
+            for file_path, start, end, stats, shard_facets in pool.imap_unordered(_import_shard, tasks):
+                for key in totals:
+                    totals[key] += stats[key]
+                if facets is not None:
+                    facets.update(shard_facets)
+                pbar.set_postfix(totals)
+                pbar.update(1)
+                logger.debug("Shard %s [%d, %s) done: %s", file_path, start, end, stats)
+    log_stats(totals)
+    return totals
+
+# ---------- Bulk rebuild ----------
+# Indexes that back a constraint (the primary key, UNIQUE (identifier) used by
+# ON CONFLICT) stay; every other index on archive_items is dropped for the load.
+# The last column tells whether an index leads with identifier.
+SECONDARY_INDEXES_SQL = """
+SELECT c.relname, pg_get_indexdef(x.indexrelid), am.amname, a.attname = 'identifier'
+FROM pg_index x
+JOIN pg_class c ON c.oid = x.indexrelid
+JOIN pg_am am ON am.oid = c.relam
+LEFT JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = x.indkey[0]
+WHERE x.indrelid = 'archive_items'::regclass
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = x.indexrelid)
+ORDER BY c.relname
+"""
+
+# Only the triggers that do per-row work the load makes up for set-based. The
+# rank triggers stay on: they record which ranks the load made stale
+# (rank_dirty, rank_gaps), which the site relies on until refresh_ranks runs.
+BULK_TRIGGERS = ('trg_archive_items_tsv', 'update_archive_items_updated_at')
+
+ENABLED_TRIGGERS_SQL = """
+SELECT tgname FROM pg_trigger
+WHERE tgrelid = 'archive_items'::regclass AND NOT tgisinternal AND tgenabled <> 'D'
+  AND tgname = ANY(%s)
+ORDER BY tgname
+"""
+
+# Same expression as archive_items_tsv_trigger(). Rows the load inserted have
+# no search_tsv yet and rows it updated have a fresh updated_at. Run over id
+# ranges, one per index job, so the pass uses as many backends as the builds.
+SEARCH_TSV_SQL = """
+UPDATE archive_items
+SET search_tsv = to_tsvector(search_tsv_config(), coalesce(title, '') || ' ' || coalesce(description, ''))
+WHERE id BETWEEN %(lo)s AND %(hi)s AND (search_tsv IS NULL OR updated_at >= %(started)s)
+"""
+
+def write_bulk_state(state):
+    tmp = f"{BULK_STATE}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, BULK_STATE)
+
+def read_bulk_state():
+    """The state of an unfinished --bulk-rebuild, or None."""
+    try:
+        with open(BULK_STATE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def bulk_prepare(conn):
+    """
+    Get archive_items ready for a bulk load: capture the definitions of its
+    secondary indexes and which of BULK_TRIGGERS are enabled from the catalog, save them to
+    BULK_STATE, then drop those indexes and disable the triggers in one
+    transaction. When BULK_STATE already exists an earlier rebuild was
+    interrupted; its saved state is reused so nothing captured then is lost.
+    Returns the state.
+    """
+    state = read_bulk_state()
+    if state is not None:
+        logger.info("Resuming the bulk rebuild started at %s (%d index(es) to restore)",
+                    state['started'], len(state['indexes']))
+    else:
+        cursor = conn.cursor()
+        cursor.execute("SELECT localtimestamp")
+        started = cursor.fetchone()[0]
+        # A partitioned table has no UNIQUE (identifier), and every merge looks
+        # rows up by identifier (see PARTITION_MERGE_SQL): keep that index
+        keep_identifier = bool(archive_partitions(cursor))
+        cursor.execute(SECONDARY_INDEXES_SQL)
+        indexes = [{'name': name, 'definition': definition, 'method': method}
+                   for name, definition, method, on_identifier in cursor.fetchall()
+                   if not (on_identifier and keep_identifier)]
+        cursor.execute(ENABLED_TRIGGERS_SQL, (list(BULK_TRIGGERS),))
+        triggers = [name for name, in cursor.fetchall()]
+        cursor.close()
+        conn.rollback()
+        state = {'started': started.isoformat(), 'indexes': indexes, 'triggers': triggers}
+        # Saved before anything is dropped
+        write_bulk_state(state)
+
+    cursor = conn.cursor()
+    try:
+        for trigger in state['triggers']:
+            cursor.execute(psycopg2.sql.SQL("ALTER TABLE archive_items DISABLE TRIGGER {}").format(
+                psycopg2.sql.Identifier(trigger)))
+        for index in state['indexes']:
+            cursor.execute(psycopg2.sql.SQL("DROP INDEX IF EXISTS {}").format(
+                psycopg2.sql.Identifier(index['name'])))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    logger.info("Bulk load: dropped %d index(es), disabled trigger(s) %s",
+                len(state['indexes']), ', '.join(state['triggers']) or '-')
+    return state
+
+def run_statement(sql, params=None, maintenance_work_mem=None):
+    """Run one statement on its own connection; returns (rowcount, seconds)."""
+    started = time.monotonic()
     conn = connect_db()
-    logger.info("Connected successfully.")
+    try:
+        cursor = conn.cursor()
+        if maintenance_work_mem:
+            cursor.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+        cursor.execute(sql, params)
+        rowcount = cursor.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return rowcount, time.monotonic() - started
 
-    base_dir = os.path.dirname(os.path.abspath(__file__))
+def bulk_finish(state, jobs=INDEX_JOBS, maintenance_work_mem=MAINTENANCE_WORK_MEM):
+    """
+    Undo bulk_prepare after the load: compute search_tsv for the loaded rows
+    set-based (one UPDATE per id range, `jobs` at a time), vacuum away the old
+    row versions, recreate the saved indexes `jobs` at a time (GIN first, they
+    take longest; one at a time on a partitioned table), re-enable the triggers, analyze, and remove BULK_STATE.
+    Safe to rerun after a failure: indexes that already exist are skipped.
+    """
+    jobs = max(1, jobs)
+    conn = connect_db()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+            started = time.monotonic()
+            cursor.execute("SELECT min(id), max(id) FROM archive_items")
+            lo, hi = cursor.fetchone()
+            updated = 0
+            if lo is not None:
+                step = (hi - lo) // jobs + 1
+                futures = [pool.submit(run_statement, SEARCH_TSV_SQL,
+                                       {'lo': start, 'hi': start + step - 1, 'started': state['started']})
+                           for start in range(lo, hi + 1, step)]
+                updated = sum(future.result()[0] for future in futures)
+            logger.info("Computed search_tsv for %d row(s) in %.1fs", updated, time.monotonic() - started)
+            cursor.execute("VACUUM archive_items")
+
+        indexes = sorted(state['indexes'], key=lambda index: index['method'] != 'gin')
+        # On a partitioned table each build also names the partitions' indexes,
+        # and concurrent builds over the same columns would pick the same names
+        index_jobs = 1 if archive_partitions(cursor) else jobs
+        logger.info("Recreating %d index(es), %d at a time, maintenance_work_mem=%s",
+                    len(indexes), index_jobs, maintenance_work_mem)
+        with concurrent.futures.ThreadPoolExecutor(index_jobs) as pool:
+            futures = {pool.submit(run_statement,
+                                   re.sub(r'^CREATE (UNIQUE )?INDEX ', r'CREATE \1INDEX IF NOT EXISTS ',
+                                          index['definition']),
+                                   maintenance_work_mem=maintenance_work_mem): index['name']
+                       for index in indexes}
+            for future in concurrent.futures.as_completed(futures):
+                logger.info("  %s: %.1fs", futures[future], future.result()[1])
+
+        for trigger in state['triggers']:
+            cursor.execute(psycopg2.sql.SQL("ALTER TABLE archive_items ENABLE TRIGGER {}").format(
+                psycopg2.sql.Identifier(trigger)))
+        cursor.execute("ANALYZE archive_items")
+    finally:
+        cursor.close()
+        conn.close()
+    os.remove(BULK_STATE)
+    logger.info("Bulk rebuild finished: indexes and triggers restored")
+
+# ---------- Facets ----------
+# Per-mediatype counts live in filter_counts; the languages/subjects/years
+# lookup tables the site reads get the cross-mediatype totals of every value
+# seen at least FACET_MIN_COUNT times, like filterByAttributes.js writes them.
+# Every commit of an import appends the facet changes of the rows it wrote
+# (see count_facets) to filter_count_deltas in the same transaction, so the
+# counts are exactly as durable as the rows: a crashed or resumed run neither
+# loses nor repeats any. Appending never waits on another worker, as updating
+# the shared filter_counts rows in every batch would. save_facets folds the
+# deltas into filter_counts at the end of a run.
+FACET_FOLD_SQL = """
+WITH folded AS (
+    DELETE FROM filter_count_deltas RETURNING kind, mediatype, value, delta
+)
+INSERT INTO filter_counts (kind, mediatype, value, item_count)
+SELECT kind, mediatype, value, sum(delta) FROM folded
+GROUP BY kind, mediatype, value
+HAVING sum(delta) <> 0
+ON CONFLICT (kind, mediatype, value) DO UPDATE SET
+    item_count = filter_counts.item_count + EXCLUDED.item_count,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+FILTER_TABLE_SQL = {
+    'language': """
+        INSERT INTO languages (name, item_count)
+        SELECT value, sum(item_count) FROM filter_counts
+        WHERE kind = 'language' AND length(value) <= 255
+        GROUP BY value HAVING sum(item_count) >= %(min_count)s
+    """,
+    'subject': """
+        INSERT INTO subjects (name, item_count)
+        SELECT value, sum(item_count) FROM filter_counts
+        WHERE kind = 'subject'
+        GROUP BY value HAVING sum(item_count) >= %(min_count)s
+    """,
+    'year': """
+        INSERT INTO years (year, item_count)
+        SELECT value::int, sum(item_count) FROM filter_counts
+        WHERE kind = 'year' AND value ~ '^[1-9][0-9]{3}$'
+        GROUP BY value HAVING sum(item_count) >= %(min_count)s
+    """,
+}
+
+def write_facet_deltas(cursor, facets):
+    """Append a Counter of facet changes to filter_count_deltas, in the caller's transaction."""
+    buf = io.StringIO()
+    for (kind, mediatype, value), delta in facets.items():
+        if delta:
+            buf.write('\t'.join((kind, copy_escape(mediatype), copy_escape(value), str(delta))) + '\n')
+    if buf.tell():
+        buf.seek(0)
+        cursor.copy_expert("COPY filter_count_deltas (kind, mediatype, value, delta) FROM STDIN", buf)
+
+def save_facets(conn, min_count=FACET_MIN_COUNT):
+    """
+    Fold every committed delta in filter_count_deltas (this run's and any a
+    crashed run left behind) into filter_counts, drop the values no item has
+    any more and rebuild the lookup tables from the new totals, in one
+    transaction. Returns the number of rows in each lookup table, i.e. the
+    values that reached min_count.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(FACET_FOLD_SQL)
+        cursor.execute("DELETE FROM filter_counts WHERE item_count <= 0")
+        cursor.execute("DELETE FROM languages; DELETE FROM subjects; DELETE FROM years")
+        saved = {}
+        for kind, sql in FILTER_TABLE_SQL.items():
+            cursor.execute(sql, {'min_count': min_count})
+            saved[kind] = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return saved
+
+# ---------- Page ranks ----------
+# archive_items.rank numbers the rows of each mediatype 1..n in page order
+# (ORDER BY downloads DESC, publicdate DESC, identifier), so a category page is
+# a range seek on (mediatype, rank). trg_archive_items_rank sets rank_dirty on
+# rows whose sort key changes (new rows start dirty) and records the old rank
+# of deleted rows, and of rows that changed mediatype, in rank_gaps. A refresh
+# renumbers only the part of each mediatype at and below the first position
+# that changed. Rows without a mediatype are never listed, so they are not ranked.
+RANK_MEDIATYPES_SQL = """
+SELECT mediatype FROM archive_items WHERE rank_dirty AND mediatype IS NOT NULL
+UNION
+SELECT mediatype FROM rank_gaps WHERE mediatype IS NOT NULL
+ORDER BY 1
+"""
+
+ALL_MEDIATYPES_SQL = """
+SELECT DISTINCT mediatype FROM archive_items WHERE mediatype IS NOT NULL
+UNION
+SELECT mediatype FROM rank_state
+ORDER BY 1
+"""
+
+# First rank of a mediatype that is no longer right. Ranks below the lowest
+# gap and the lowest old rank of a dirty row are still dense, and the rows
+# holding them keep their places unless the first dirty row in page order now
+# sorts above some of them: scanning down from the bound, the first row that
+# still sorts above it ends the part that stays.
+RANK_START_SQL = """
+WITH bound AS (
+    SELECT least(
+        (SELECT min(rank) FROM rank_gaps WHERE mediatype = %(mediatype)s),
+        (SELECT min(rank) FROM archive_items WHERE mediatype = %(mediatype)s AND rank_dirty),
+        (SELECT coalesce(max(rank), 0) + 1 FROM archive_items
+         WHERE mediatype = %(mediatype)s AND NOT rank_dirty)
+    ) AS rank
+), first_dirty AS (
+    SELECT downloads, publicdate, identifier FROM archive_items
+    WHERE mediatype = %(mediatype)s AND rank_dirty
+    ORDER BY downloads DESC, publicdate DESC, identifier
+    LIMIT 1
+)
+SELECT least(bound.rank, (
+    SELECT coalesce((
+        SELECT a.rank FROM archive_items a
+        WHERE a.mediatype = %(mediatype)s AND a.rank < bound.rank
+          AND ((a.downloads IS NULL AND d.downloads IS NOT NULL) OR a.downloads > d.downloads
+               OR (a.downloads IS NOT DISTINCT FROM d.downloads
+                   AND ((a.publicdate IS NULL AND d.publicdate IS NOT NULL) OR a.publicdate > d.publicdate
+                        OR (a.publicdate IS NOT DISTINCT FROM d.publicdate AND a.identifier < d.identifier))))
+        ORDER BY a.rank DESC
+        LIMIT 1
+    ), 0) + 1
+    FROM first_dirty d
+))
+FROM bound
+"""
+
+# Rows already holding their new rank are not rewritten
+RANK_RENUMBER_SQL = """
+WITH renumbered AS (
+    SELECT id, %(start)s - 1 + row_number() OVER (ORDER BY downloads DESC, publicdate DESC, identifier) AS rank
+    FROM archive_items
+    WHERE mediatype = %(mediatype)s AND (rank >= %(start)s OR rank_dirty)
+)
+UPDATE archive_items a SET rank = renumbered.rank, rank_dirty = false
+FROM renumbered
+WHERE a.mediatype = %(mediatype)s AND a.id = renumbered.id
+  AND (a.rank IS DISTINCT FROM renumbered.rank OR a.rank_dirty)
+"""
+
+RANK_STATE_SQL = """
+INSERT INTO rank_state (mediatype, ranked_rows, ranked_at)
+SELECT %(mediatype)s, coalesce(max(rank), 0), now() FROM archive_items WHERE mediatype = %(mediatype)s
+ON CONFLICT (mediatype) DO UPDATE SET
+    ranked_rows = EXCLUDED.ranked_rows,
+    ranked_at = EXCLUDED.ranked_at
+"""
+
+def refresh_ranks(conn, full=False):
+    """
+    Bring archive_items.rank up to date, one transaction per mediatype with
+    dirty rows or gaps: find the first rank that changed (RANK_START_SQL),
+    renumber from there down, clear the mediatype's gaps and record its row
+    count in rank_state. full=True renumbers every mediatype from 1. Returns
+    {mediatype: (first renumbered rank, rows rewritten)}.
+    """
+    cursor = conn.cursor()
+    refreshed = {}
+    try:
+        cursor.execute(ALL_MEDIATYPES_SQL if full else RANK_MEDIATYPES_SQL)
+        mediatypes = [mediatype for mediatype, in cursor.fetchall()]
+        conn.commit()
+        for mediatype in mediatypes:
+            # Only rank and rank_dirty are written, which fires neither
+            # trg_archive_items_tsv nor update_archive_items_updated_at
+            params = {'mediatype': mediatype}
+            if full:
+                params['start'] = 1
+            else:
+                cursor.execute(RANK_START_SQL, params)
+                params['start'] = cursor.fetchone()[0]
+            cursor.execute(RANK_RENUMBER_SQL, params)
+            refreshed[mediatype] = (params['start'], cursor.rowcount)
+            cursor.execute("DELETE FROM rank_gaps WHERE mediatype = %(mediatype)s", params)
+            cursor.execute(RANK_STATE_SQL, params)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return refreshed
+
+# ---------- Main ----------
+def find_ndjson_files(base_dir):
+    """
+    Every scraped NDJSON file (plain or compressed) below base_dir, skipping
+    backups, in a stable order (it decides which file wins a duplicate):
+    full-crawl files by path, then incremental deltas oldest first, so the
+    newest copy of an item is the one that sticks.
+    """
     ndjson_files = []
     for root, dirs, files in os.walk(base_dir):
         for file in files:
-            if file.endswith('.ndjson') and 'backup' not in file:
+            if file.endswith(NDJSON_SUFFIXES) and 'backup' not in file:
                 ndjson_files.append(os.path.join(root, file))
+    return sorted(ndjson_files, key=ndjson_order)
+
+def ndjson_order(file_path):
+    delta = DELTA_FILE.search(os.path.basename(file_path))
+    return (delta.group(0), file_path) if delta else ('', file_path)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import scraped NDJSON files into Postgres.")
+    parser.add_argument('--mode', choices=('row', 'copy'), default='row',
+                        help="row: per-row upsert with SAVEPOINTs; copy: COPY batches "
+                             "into a staging table and merge them set-based (default: row)")
+    parser.add_argument('--batch-size', type=int, default=COPY_BATCH,
+                        help="rows per COPY batch in --mode=copy (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes, each with its own connection; "
+                             "more than one implies --mode=copy (default: 1)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue from the byte offsets committed by a previous run "
+                             "instead of starting every file from the beginning")
+    parser.add_argument('--columnar', metavar='PATH',
+                        help="load a Parquet dataset written by columnar.py instead of the "
+                             "NDJSON files (Arrow batches, COPY path, no checkpoints)")
+    parser.add_argument('--delta', action='store_true',
+                        help="import only the incremental delta files (script.py --incremental) "
+                             "that earlier --delta or --resume runs have not applied yet")
+    parser.add_argument('--dedupe-files', action='store_true',
+                        help="index every identifier's last occurrence across all files first "
+                             "and write only that row, so each identifier is written once")
+    parser.add_argument('--skip-facets', action='store_true',
+                        help="do not count languages/subjects/years while importing or update "
+                             "filter_counts, the filter lookup tables and filter_cube at the end")
+    parser.add_argument('--skip-ranks', action='store_true',
+                        help="do not renumber the page ranks (archive_items.rank) after importing")
+    parser.add_argument('--ranks-only', action='store_true',
+                        help="only bring the page ranks up to date, e.g. after editing "
+                             "archive_items by hand, and exit")
+    parser.add_argument('--bulk-rebuild', action='store_true',
+                        help="for full reloads: drop the secondary indexes and disable the triggers "
+                             "of archive_items, load, compute search_tsv in one pass, then recreate "
+                             "the indexes in parallel and re-enable the triggers")
+    parser.add_argument('--index-jobs', type=int, default=INDEX_JOBS,
+                        help="indexes built at once by --bulk-rebuild (default: %(default)s)")
+    parser.add_argument('--maintenance-work-mem', default=MAINTENANCE_WORK_MEM,
+                        help="maintenance_work_mem of each --bulk-rebuild index build "
+                             "(default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and args.mode == 'row':
+        logger.info("--workers %d implies --mode=copy", args.workers)
+        args.mode = 'copy'
+    return args
+
+def finish_facets(facets):
+    """Fold the facet deltas of a run into filter_counts (see save_facets) unless --skip-facets disabled them."""
+    if facets is None:
+        return
+    conn = connect_db()
+    try:
+        saved = save_facets(conn)
+    except psycopg2.Error as e:
+        logger.error("Saving filter counts failed: %s (run refresh_filter_tables() to rebuild them)", e)
+        return
+    finally:
+        conn.close()
+    logger.info("Filter counts: %d values changed; %d languages, %d subjects, %d years with >= %d items",
+                sum(1 for delta in facets.values() if delta), saved['language'], saved['subject'], saved['year'], FACET_MIN_COUNT)
+
+def finish_ranks(full=False):
+    """Renumber the page ranks after a run (see refresh_ranks)."""
+    started = time.monotonic()
+    conn = connect_db()
+    try:
+        refreshed = refresh_ranks(conn, full=full)
+    except psycopg2.Error as e:
+        logger.error("Refreshing page ranks failed: %s (rerun with --ranks-only)", e)
+        return
+    finally:
+        conn.close()
+    for mediatype, (start, rewritten) in refreshed.items():
+        logger.info("  %s: renumbered from rank %d, %d row(s) rewritten", mediatype, start, rewritten)
+    logger.info("Page ranks: %d mediatype(s) refreshed in %.1fs", len(refreshed), time.monotonic() - started)
+
+def finish_cube():
+    """Rebuild filter_cube from the imported rows (see filter_cube.build_cube)."""
+    import filter_cube
+    started = time.monotonic()
+    conn = connect_db()
+    try:
+        rows = filter_cube.build_cube(conn)
+    except psycopg2.Error as e:
+        logger.error("Rebuilding filter_cube failed: %s (run filter_cube.py)", e)
+        return
+    finally:
+        conn.close()
+    logger.info("Filter cube: %d combination(s) counted in %.1fs", rows, time.monotonic() - started)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Held until the run ends, so a partition migration cannot start meanwhile
+    lock_conn = connect_db()
+    try:
+        lock_out_migration(lock_conn)
+        if args.ranks_only:
+            finish_ranks()
+            return
+
+        if args.bulk_rebuild:
+            conn = connect_db()
+            try:
+                state = bulk_prepare(conn)
+            finally:
+                conn.close()
+        elif read_bulk_state() is not None:
+            logger.warning("An earlier --bulk-rebuild did not finish: archive_items is missing indexes "
+                           "and its triggers are disabled. Rerun with --bulk-rebuild to restore them.")
+
+        run_import(args)
+
+        if args.bulk_rebuild:
+            bulk_finish(state, jobs=args.index_jobs, maintenance_work_mem=args.maintenance_work_mem)
+        if not args.skip_ranks:
+            finish_ranks()
+        if not args.skip_facets:
+            finish_cube()
+    finally:
+        lock_conn.close()
+
+def run_import(args):
+    facets = None if args.skip_facets else Counter()
+
+    if args.columnar:
+        conn = connect_db()
+        try:
+            stats = import_columnar(args.columnar, conn, batch_size=args.batch_size, facets=facets)
+        finally:
+            conn.close()
+        logger.info("Import completed! %d inserted, %d updated, %d unchanged",
+                    stats['inserted'], stats['updated'], stats['unchanged'])
+        finish_facets(facets)
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    ndjson_files = find_ndjson_files(base_dir)
+    if args.delta:
+        ndjson_files = [f for f in ndjson_files if DELTA_FILE.search(os.path.basename(f))]
 
     if not ndjson_files:
         logger.info("No NDJSON files found.")
-        conn.close()
         return
 
     logger.info("Found %d NDJSON file(s):", len(ndjson_files))
     for f in ndjson_files:
         logger.info("  - %s", f)
 
-    total_imported = 0
+    # Serial imports treat each file as a single shard
+    shard_bytes = SHARD_BYTES if args.workers > 1 else float('inf')
+    # Deltas keep the checkpoints of earlier runs: applied ones are skipped
+    resume = args.resume or args.delta
+    shards = plan_shards(ndjson_files, shard_bytes, resume=resume)
+    if resume:
+        logger.info("Resuming: %d shard(s) with uncommitted data", len(shards))
+
+    # Rebuilt on every run, resumed or not, so it always reflects the files as they are now
+    winners = WinnerIndex.build(ndjson_files) if args.dedupe_files else None
+
+    if args.workers > 1:
+        if winners is not None:
+            winners.close()
+        totals = import_parallel(shards, args.workers, batch_size=args.batch_size,
+                                 winner_index=WINNER_INDEX if args.dedupe_files else None,
+                                 facets=facets)
+        logger.info("=" * 50)
+        logger.info("Import completed! %d inserted, %d updated, %d unchanged",
+                    totals['inserted'], totals['updated'], totals['unchanged'])
+        logger.info("=" * 50)
+        finish_facets(facets)
+        return
+
+    logger.info("Connecting to database...")
+    conn = connect_db()
+    logger.info("Connected successfully.")
+
+    totals = Counter()
     try:
-        for file_path in ndjson_files:
-            imported = import_ndjson_file(file_path, conn)
-            total_imported += imported
+        for file_path, shard_start, offset, end in shards:
+            stats = import_ndjson_file(file_path, conn, mode=args.mode, batch_size=args.batch_size,
+                                       start=offset, end=end, shard_start=shard_start,
+                                       winners=winners, facets=facets)
+            totals.update(stats)
     finally:
         try:
             conn.close()
         except Exception:
             pass
+        if winners is not None:
+            winners.close()
 
     logger.info("=" * 50)
-    logger.info("Import completed! Total items imported: %d", total_imported)
+    logger.info("Import completed! %d inserted, %d updated, %d unchanged",
+                totals['inserted'], totals['updated'], totals['unchanged'])
     logger.info("=" * 50)
+    logger.info("publicdate formats: %s", publicdate_stats())
+    finish_facets(facets)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+"""
+Pluggable JSON codec for the NDJSON hot paths (scraper output, importer input).
+
+Backends, fastest first: orjson, ujson, stdlib json. The fastest installed one
+is used unless ECHONET_JSON=orjson|ujson|json picks another. Every backend
+
+ - decodes straight from the bytes read off disk, with no str round trip,
+   including memoryview slices of a memory-mapped file (zero-copy with
+   orjson; the other backends copy the one line to bytes first);
+ - encodes like json.dumps(obj, ensure_ascii=False): non-ASCII characters are
+   written as raw UTF-8, never as \\uXXXX escapes. Separators may differ
+   (orjson writes compact JSON), the decoded values never do.
+
+Values a fast backend refuses (NaN literals) are retried with the stdlib, and
+so are NaN/Infinity floats, which orjson would write as null: swapping
+backends never changes what is accepted or which values are written. The one
+exception would cost a scan of every line to catch: orjson decodes integers
+beyond 64 bits as floats, where the other backends keep them exact.
+"""
+
+import os
+import json
+import math
+from collections import namedtuple
+
+Codec = namedtuple('Codec', ['name', 'loads', 'dumps', 'dumps_line'])
+
+
+def _as_bytes(data):
+    return data.tobytes() if isinstance(data, memoryview) else data
+
+
+def _has_non_finite(obj):
+    """True if obj holds a NaN or infinite float anywhere."""
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_has_non_finite(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_non_finite(v) for v in obj)
+    return False
+
+
+def _stdlib_codec():
+    def loads(data):
+        return json.loads(_as_bytes(data))
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+    def dumps_line(obj):
+        return (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+
+    return Codec('json', loads, dumps, dumps_line)
+
+
+def _orjson_codec():
+    import orjson
+
+    def loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return json.loads(_as_bytes(data))
+
+    # orjson writes NaN and Infinity as null; only output that has a null
+    # can hide one, so only that is checked
+    def dumps(obj):
+        try:
+            out = orjson.dumps(obj)
+        except TypeError:
+            return json.dumps(obj, ensure_ascii=False)
+        if b'null' in out and _has_non_finite(obj):
+            return json.dumps(obj, ensure_ascii=False)
+        return out.decode('utf-8')
+
+    def dumps_line(obj):
+        try:
+            out = orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+        if b'null' in out and _has_non_finite(obj):
+            return (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+        return out
+
+    return Codec('orjson', loads, dumps, dumps_line)
+
+
+def _ujson_codec():
+    import ujson
+
+    def loads(data):
+        data = _as_bytes(data)
+        try:
+            return ujson.loads(data)
+        except ValueError:
+            return json.loads(data)
+
+    def dumps(obj):
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+        except OverflowError:
+            return json.dumps(obj, ensure_ascii=False)
+
+    def dumps_line(obj):
+        return (dumps(obj) + '\n').encode('utf-8')
+
+    return Codec('ujson', loads, dumps, dumps_line)
+
+
+BACKENDS = {
+    'orjson': _orjson_codec,
+    'ujson': _ujson_codec,
+    'json': _stdlib_codec,
+}
+
+
+def get_codec(name):
+    """
+    Build the named backend's codec; raises ValueError for an unknown name and
+    ImportError if the backend is not installed.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"unknown JSON backend {name!r} (ECHONET_JSON={'|'.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+
+def available_codecs():
+    """Every installed backend, fastest first."""
+    codecs = []
+    for name in BACKENDS:
+        try:
+            codecs.append(get_codec(name))
+        except ImportError:
+            continue
+    return codecs
+
+
+def default_codec():
+    name = os.environ.get('ECHONET_JSON')
+    if name:
+        return get_codec(name)
+    return available_codecs()[0]
+
+
+codec = default_codec()
+loads = codec.loads
+dumps = codec.dumps
+dumps_line = codec.dumps_line
@@ -0,0 +1,495 @@
+"""
+Migrate archive_items to a table LIST-partitioned by mediatype, online.
+
+Every content query filters on one mediatype, so with one partition per
+scraped mediatype (script.MEDIATYPES, plus a default partition for anything
+else) a query only reads that partition's heap and indexes. The migration:
+
+ 1. creates archive_items_part, partitioned by mediatype and unique on
+    (mediatype, identifier), with one archive_items_<mediatype> partition per
+    mediatype and archive_items_default;
+ 2. copies the rows over in id-range chunks, one short transaction each,
+    optionally throttled; the site and importer keep using archive_items;
+ 3. recreates every secondary index of archive_items (read from the catalog)
+    on the new table, several at a time;
+ 4. catches up with rows written meanwhile (by updated_at) and rows deleted
+    meanwhile (logged by a trigger on archive_items from step 1 on), then,
+    under a brief ACCESS EXCLUSIVE lock, applies the last changes and swaps
+    the tables: the old one stays as archive_items_unpartitioned until dropped.
+
+Needs PostgreSQL 15 or later, for the UNIQUE NULLS NOT DISTINCT constraint.
+
+Progress is saved after every step; rerun with --resume after an interruption.
+The site keeps reading archive_items throughout, but nothing else may write
+it: the migration holds an advisory lock (import_to_db.MIGRATION_LOCK) that
+import_to_db.py and search_tsv.py also take, so they refuse to start while it
+runs, and while an interrupted migration's new table exists; it refuses to
+start while one of them runs. The importer detects partitioning when it
+starts.
+
+Uniqueness changes with the swap. The plain table has UNIQUE (identifier);
+a unique constraint on a partitioned table must contain the partition key,
+so the new one has UNIQUE NULLS NOT DISTINCT (mediatype, identifier), which
+the importer's merges conflict on. An identifier stays in one partition only
+because the importer deletes a row from its old partition when its mediatype
+changes (see import_to_db.PARTITION_MERGE_SQL); other writers must do the
+same.
+
+Usage:
+    python partition_archive_items.py migrate [--chunk-size 20000] [--rows-per-sec 50000] [--resume]
+    python partition_archive_items.py bench [--repeat 20]   # per-mediatype query latency
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import argparse
+import statistics
+import concurrent.futures
+
+import psycopg2
+import psycopg2.sql
+from tqdm import tqdm
+
+from import_to_db import (connect_db, run_statement, read_bulk_state, INDEX_JOBS,
+                          MAINTENANCE_WORK_MEM, MIGRATION_LOCK, MIGRATION_TABLE, SECONDARY_INDEXES_SQL)
+from script import MEDIATYPES
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.partition_migration.json')
+CHUNK_SIZE = 20000
+NEW_TABLE = MIGRATION_TABLE
+OLD_TABLE = 'archive_items_unpartitioned'
+DEFAULT_PARTITION = 'archive_items_default'
+# New indexes are built as <name>_part and take over <name> at the swap
+BUILD_SUFFIX = '_part'
+OLD_SUFFIX = '_unpartitioned'
+# Lets the catch-up passes find rows written since the copy started
+UPDATED_AT_INDEX = 'archive_items_migrate_updated_at'
+# Catch up without the lock until a pass finds at most this many rows
+CATCHUP_ROWS = 1000
+CATCHUP_PASSES = 5
+# Identifiers deleted from archive_items since the copy started
+DELETE_LOG = 'archive_items_migrate_deletes'
+DELETE_LOG_TRIGGER = 'trg_archive_items_migrate_deletes'
+# UNIQUE NULLS NOT DISTINCT
+MIN_SERVER_VERSION = 150000
+LOCK_TIMEOUT = '30s'
+
+Identifier = psycopg2.sql.Identifier
+SQL = psycopg2.sql.SQL
+
+def partition_name(mediatype):
+    return 'archive_items_' + re.sub(r'\W', '_', mediatype.lower())
+
+def load_state():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_state(state):
+    """Atomically replace STATE_FILE, like the importer's checkpoints."""
+    tmp = f"{STATE_FILE}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATE_FILE)
+
+def is_partitioned(cursor, table='archive_items'):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row is not None and row[0]
+
+def catchup_point(cursor):
+    """
+    A timestamp no later than the updated_at of any write that is not
+    committed yet: the start of the oldest open transaction, or now. Rows
+    changed after this point are picked up by the next catch-up pass.
+    """
+    cursor.execute("""
+        SELECT least(localtimestamp, min(xact_start)::timestamp)
+        FROM pg_stat_activity WHERE xact_start IS NOT NULL AND pid <> pg_backend_pid()
+    """)
+    return cursor.fetchone()[0].isoformat()
+
+def prepare(conn):
+    """
+    Create the partitioned table and capture everything the swap needs from
+    the catalog: columns, secondary indexes, triggers and the id sequence.
+    Returns the new migration state.
+    """
+    cursor = conn.cursor()
+    if conn.server_version < MIN_SERVER_VERSION:
+        raise SystemExit(f"partitioning needs PostgreSQL 15 or later (UNIQUE NULLS NOT DISTINCT); "
+                         f"the server is version {conn.server_version}")
+    if is_partitioned(cursor):
+        raise SystemExit("archive_items is already partitioned")
+    if read_bulk_state() is not None:
+        raise SystemExit("an import --bulk-rebuild has not finished; finish it first")
+    if is_partitioned(cursor, NEW_TABLE):
+        raise SystemExit(f"{NEW_TABLE} exists from an earlier run: pass --resume, or drop it")
+
+    conn.rollback()
+    conn.autocommit = True
+    logger.info("Indexing archive_items.updated_at for the catch-up passes")
+    cursor.execute(SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON archive_items (updated_at)").format(
+        Identifier(UPDATED_AT_INDEX)))
+    conn.autocommit = False
+
+    since = catchup_point(cursor)
+    cursor.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = 'archive_items'::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """)
+    columns = [name for name, in cursor.fetchall()]
+    cursor.execute(SECONDARY_INDEXES_SQL)
+    indexes = []
+    for name, definition, *_ in cursor.fetchall():
+        if name == UPDATED_AT_INDEX:
+            continue
+        if definition.startswith('CREATE UNIQUE'):
+            # A unique index must contain the partition key; it cannot carry over as is
+            logger.warning("Not carrying over unique index %s: %s", name, definition)
+            continue
+        indexes.append({'name': name, 'definition': definition})
+    cursor.execute("""
+        SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger
+        WHERE tgrelid = 'archive_items'::regclass AND NOT tgisinternal AND tgenabled <> 'D'
+    """)
+    triggers = [{'name': name, 'definition': definition} for name, definition in cursor.fetchall()]
+    cursor.execute("SELECT pg_get_serial_sequence('archive_items', 'id'), min(id), max(id) FROM archive_items")
+    sequence, lo, hi = cursor.fetchone()
+
+    cursor.execute(SQL("""
+        CREATE TABLE {new} (LIKE archive_items INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS)
+        PARTITION BY LIST (mediatype)
+    """).format(new=Identifier(NEW_TABLE)))
+    # NULLS NOT DISTINCT: rows without a mediatype stay unique per identifier too
+    cursor.execute(SQL("ALTER TABLE {new} ADD CONSTRAINT {name} UNIQUE NULLS NOT DISTINCT (mediatype, identifier)").format(
+        new=Identifier(NEW_TABLE), name=Identifier(NEW_TABLE + '_mediatype_identifier_key')))
+    for mediatype in MEDIATYPES:
+        cursor.execute(SQL("CREATE TABLE {leaf} PARTITION OF {new} FOR VALUES IN ({value})").format(
+            leaf=Identifier(partition_name(mediatype)), new=Identifier(NEW_TABLE),
+            value=psycopg2.sql.Literal(mediatype)))
+    cursor.execute(SQL("CREATE TABLE {leaf} PARTITION OF {new} DEFAULT").format(
+        leaf=Identifier(DEFAULT_PARTITION), new=Identifier(NEW_TABLE)))
+    # updated_at cannot show deletes: log them from before the first chunk is
+    # copied (replacing the log of an abandoned run)
+    cursor.execute(SQL("""
+        DROP TRIGGER IF EXISTS {trigger} ON archive_items;
+        DROP TABLE IF EXISTS {log};
+        CREATE TABLE {log} (identifier TEXT NOT NULL);
+        CREATE OR REPLACE FUNCTION archive_items_migrate_log_delete() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {log} (identifier) VALUES (OLD.identifier);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE TRIGGER {trigger} AFTER DELETE ON archive_items
+            FOR EACH ROW EXECUTE FUNCTION archive_items_migrate_log_delete();
+    """).format(log=Identifier(DELETE_LOG), trigger=Identifier(DELETE_LOG_TRIGGER)))
+    conn.commit()
+    cursor.close()
+
+    state = {'phase': 'copy', 'since': since, 'next_id': lo or 0, 'max_id': hi if hi is not None else -1,
+             'copied': 0, 'columns': columns, 'indexes': indexes, 'triggers': triggers,
+             'sequence': sequence,
+             'partitions': [partition_name(m) for m in MEDIATYPES] + [DEFAULT_PARTITION]}
+    save_state(state)
+    logger.info("Created %s with %d partition(s); %d index(es) and %d trigger(s) to carry over",
+                NEW_TABLE, len(MEDIATYPES) + 1, len(indexes), len(triggers))
+    return state
+
+def copy_rows(conn, state, chunk_size=CHUNK_SIZE, rows_per_sec=0):
+    """Copy ids [next_id, max_id] into the new table in committed, throttled chunks."""
+    columns = SQL(', ').join(map(Identifier, state['columns']))
+    sql = SQL("""
+        INSERT INTO {new} ({cols}) SELECT {cols} FROM archive_items WHERE id BETWEEN %(lo)s AND %(hi)s
+        ON CONFLICT (mediatype, identifier) DO NOTHING
+    """).format(new=Identifier(NEW_TABLE), cols=columns)
+    cursor = conn.cursor()
+    started = time.monotonic()
+    copied = 0
+    with tqdm(total=max(state['max_id'] - state['next_id'] + 1, 0), desc="Copying", unit="ids") as pbar:
+        while state['next_id'] <= state['max_id']:
+            lo = state['next_id']
+            hi = min(lo + chunk_size - 1, state['max_id'])
+            cursor.execute(sql, {'lo': lo, 'hi': hi})
+            conn.commit()
+            copied += cursor.rowcount
+            state.update(next_id=hi + 1, copied=state['copied'] + cursor.rowcount)
+            save_state(state)
+            pbar.update(hi - lo + 1)
+            pbar.set_postfix(rows=state['copied'])
+            if rows_per_sec:
+                ahead = copied / rows_per_sec - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    cursor.close()
+    state['phase'] = 'index'
+    save_state(state)
+    logger.info("Copied %d row(s) in %.1fs", state['copied'], time.monotonic() - started)
+
+def leaf_index_name(leaf, index):
+    """Name of a partition's piece of a parent index, e.g. archive_items_texts_downloads_idx."""
+    base = index[:-len(BUILD_SUFFIX)]
+    for prefix in ('idx_archive_items_', NEW_TABLE + '_'):
+        if base.startswith(prefix):
+            base = base[len(prefix):]
+    return f"{leaf}_{base}_idx"[:63]
+
+def build_indexes(state, jobs=INDEX_JOBS, maintenance_work_mem=MAINTENANCE_WORK_MEM):
+    """
+    Create the captured indexes (and one on id, which lost its primary key) on
+    the new table. Each is created ON ONLY the parent, built on every
+    partition separately, `jobs` partition indexes at a time, and attached.
+    """
+    definitions = {NEW_TABLE + '_id' + BUILD_SUFFIX: f"CREATE INDEX {NEW_TABLE}_id ON archive_items (id)"}
+    for index in state['indexes']:
+        definitions[index['name'] + BUILD_SUFFIX] = index['definition']
+    pattern = re.compile(r'^CREATE INDEX \S+ ON (?:\S+\.)?archive_items ')
+
+    conn = connect_db()
+    cursor = conn.cursor()
+    builds = {}
+    for name, definition in definitions.items():
+        cursor.execute(pattern.sub(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {NEW_TABLE} ", definition))
+        for leaf in state['partitions']:
+            builds[name, leaf] = pattern.sub(
+                f"CREATE INDEX IF NOT EXISTS {leaf_index_name(leaf, name)} ON {leaf} ", definition)
+    conn.commit()
+
+    logger.info("Building %d index(es) on %d partition(s), %d at a time",
+                len(definitions), len(state['partitions']), jobs)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max(1, jobs)) as pool:
+            futures = {pool.submit(run_statement, sql, maintenance_work_mem=maintenance_work_mem): key
+                       for key, sql in builds.items()}
+            for future in concurrent.futures.as_completed(futures):
+                name, leaf = futures[future]
+                logger.info("  %s on %s: %.1fs", name, leaf, future.result()[1])
+        for name, leaf in builds:
+            cursor.execute(SQL("ALTER INDEX {} ATTACH PARTITION {}").format(
+                Identifier(name), Identifier(leaf_index_name(leaf, name))))
+        conn.commit()
+    finally:
+        conn.close()
+    state['phase'] = 'swap'
+    save_state(state)
+
+def catchup_sql(state):
+    """Upsert rows of archive_items changed since %(since)s into the new table."""
+    columns = state['columns']
+    cols = SQL(', ').join(map(Identifier, columns))
+    updates = SQL(', ').join(SQL("{0} = EXCLUDED.{0}").format(Identifier(c)) for c in columns
+                             if c not in ('mediatype', 'identifier'))
+    return SQL("""
+        WITH changed AS (
+            SELECT {cols} FROM archive_items WHERE updated_at >= %(since)s
+        ), moved AS (
+            DELETE FROM {new} p USING changed
+            WHERE p.identifier = changed.identifier AND p.mediatype IS DISTINCT FROM changed.mediatype
+        )
+        INSERT INTO {new} ({cols}) SELECT {cols} FROM changed
+        ON CONFLICT (mediatype, identifier) DO UPDATE SET {updates}
+    """).format(new=Identifier(NEW_TABLE), cols=cols, updates=updates)
+
+def catchup_deletes_sql():
+    """
+    Remove rows deleted from archive_items since the last pass from the new
+    table, consuming the delete log. An identifier that was inserted again is
+    left alone; the updated_at catch-up copies the new row.
+    """
+    return SQL("""
+        WITH deleted AS (
+            DELETE FROM {log} RETURNING identifier
+        )
+        DELETE FROM {new} p USING deleted
+        WHERE p.identifier = deleted.identifier
+          AND NOT EXISTS (SELECT 1 FROM archive_items a WHERE a.identifier = deleted.identifier)
+    """).format(log=Identifier(DELETE_LOG), new=Identifier(NEW_TABLE))
+
+def catchup(cursor, sql, deletes_sql, since):
+    """Apply one catch-up pass; returns the number of rows written or deleted."""
+    cursor.execute(sql, {'since': since})
+    rows = cursor.rowcount
+    cursor.execute(deletes_sql)
+    return rows + cursor.rowcount
+
+def swap(conn, state):
+    """Catch up, then swap the tables under a short ACCESS EXCLUSIVE lock."""
+    cursor = conn.cursor()
+    sql = catchup_sql(state)
+    deletes_sql = catchup_deletes_sql()
+    for _ in range(CATCHUP_PASSES):
+        since = catchup_point(cursor)
+        rows = catchup(cursor, sql, deletes_sql, state['since'])
+        conn.commit()
+        state['since'] = since
+        save_state(state)
+        logger.info("Catch-up pass: %d row(s)", rows)
+        if rows <= CATCHUP_ROWS:
+            break
+
+    started = time.monotonic()
+    cursor.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+    cursor.execute("LOCK TABLE archive_items IN ACCESS EXCLUSIVE MODE")
+    logger.info("Final catch-up under lock: %d row(s)", catchup(cursor, sql, deletes_sql, state['since']))
+    cursor.execute(SQL("DROP TRIGGER {} ON archive_items").format(Identifier(DELETE_LOG_TRIGGER)))
+    cursor.execute(SQL("DROP TABLE {}").format(Identifier(DELETE_LOG)))
+    cursor.execute("DROP FUNCTION archive_items_migrate_log_delete()")
+
+    def rename(kind, old, new):
+        cursor.execute(SQL("ALTER {} {} RENAME TO {}").format(SQL(kind), Identifier(old), Identifier(new)))
+
+    rename('TABLE', 'archive_items', OLD_TABLE)
+    for index in state['indexes']:
+        rename('INDEX', index['name'], index['name'] + OLD_SUFFIX)
+        rename('INDEX', index['name'] + BUILD_SUFFIX, index['name'])
+    rename('TABLE', NEW_TABLE, 'archive_items')
+    rename('INDEX', NEW_TABLE + '_id' + BUILD_SUFFIX, 'archive_items_id_idx')
+    cursor.execute(SQL("ALTER TABLE archive_items RENAME CONSTRAINT {} TO {}").format(
+        Identifier(NEW_TABLE + '_mediatype_identifier_key'), Identifier('archive_items_mediatype_identifier_key')))
+    if state['sequence']:
+        # Keep the sequence alive when the old table is dropped
+        cursor.execute(SQL("ALTER SEQUENCE {} OWNED BY archive_items.id").format(
+            SQL(state['sequence'])))
+    # pg_get_triggerdef names "archive_items", which is now the new table
+    for trigger in state['triggers']:
+        cursor.execute(trigger['definition'])
+    conn.commit()
+    logger.info("Swapped tables in %.2fs; the old table is kept as %s", time.monotonic() - started, OLD_TABLE)
+
+    conn.autocommit = True
+    cursor.execute("ANALYZE archive_items")
+    cursor.close()
+    os.remove(STATE_FILE)
+
+def migrate(args):
+    conn = connect_db()
+    try:
+        # Session-level: held until conn closes, across every phase
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (MIGRATION_LOCK,))
+        if not cursor.fetchone()[0]:
+            raise SystemExit("archive_items is being written by import_to_db.py or search_tsv.py; "
+                             "migrate once they have finished")
+        conn.commit()
+        cursor.close()
+        state = load_state() if args.resume else None
+        if state is None:
+            state = prepare(conn)
+        else:
+            logger.info("Resuming the migration at its %s phase", state['phase'])
+        if state['phase'] == 'copy':
+            copy_rows(conn, state, args.chunk_size, args.rows_per_sec)
+        if state['phase'] == 'index':
+            build_indexes(state, args.index_jobs, args.maintenance_work_mem)
+        if state['phase'] == 'swap':
+            swap(conn, state)
+    finally:
+        conn.close()
+    logger.info("archive_items is partitioned by mediatype. Drop %s once you no longer need it.", OLD_TABLE)
+
+# ---------- Benchmark ----------
+# The query shapes of lib/content-query.js getFilteredContent
+ITEM_COLUMNS = ('identifier, title, description, language, item_size, downloads, btih, '
+                'mediatype, subject, publicdate, url')
+BENCH_QUERIES = {
+    'first page': ("SELECT " + ITEM_COLUMNS + " FROM {table} WHERE mediatype = %(mediatype)s "
+                   "ORDER BY downloads DESC, publicdate DESC, identifier LIMIT 20"),
+    'page 50': ("SELECT " + ITEM_COLUMNS + " FROM {table} WHERE mediatype = %(mediatype)s "
+                "ORDER BY downloads DESC, publicdate DESC, identifier LIMIT 20 OFFSET 980"),
+    'count': "SELECT count(*) FROM {table} WHERE mediatype = %(mediatype)s",
+    'subject': ("SELECT " + ITEM_COLUMNS + " FROM {table} WHERE mediatype = %(mediatype)s "
+                "AND subject @> %(subject)s::jsonb "
+                "ORDER BY downloads DESC, publicdate DESC, identifier LIMIT 20"),
+    'search': ("SELECT " + ITEM_COLUMNS + " FROM {table} WHERE mediatype = %(mediatype)s "
+               "AND search_tsv @@ websearch_to_tsquery(search_tsv_config(), %(search)s) "
+               "ORDER BY downloads DESC, publicdate DESC, identifier LIMIT 20"),
+}
+
+def time_query(cursor, sql, params, repeat):
+    """Median wall time in ms of `repeat` runs, after one warm-up run."""
+    cursor.execute(sql, params)
+    cursor.fetchall()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        samples.append((time.perf_counter() - started) * 1e3)
+    return statistics.median(samples)
+
+def bench(args):
+    conn = connect_db()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    tables = []
+    for table in args.tables:
+        cursor.execute("SELECT to_regclass(%s)", (table,))
+        if cursor.fetchone()[0] is None:
+            logger.warning("Skipping %s: no such table", table)
+        else:
+            tables.append(table)
+    if not tables:
+        raise SystemExit("none of the tables exist: " + ', '.join(args.tables))
+    params = {'subject': json.dumps([args.subject]), 'search': args.search}
+    # Median ms per table; with several tables, the last one's time over the first's
+    print(f"{'mediatype':<10} {'query':<11} " + ' '.join(f"{t:>28}" for t in tables) +
+          (f"  {tables[-1]} / {tables[0]}" if len(tables) > 1 else ''))
+    for mediatype in MEDIATYPES:
+        params['mediatype'] = mediatype
+        for label, sql in BENCH_QUERIES.items():
+            timings = [time_query(cursor, sql.format(table=t), params, args.repeat) for t in tables]
+            line = f"{mediatype:<10} {label:<11} " + ' '.join(f"{ms:>25.2f} ms" for ms in timings)
+            if len(timings) > 1:
+                line += f"  x{timings[-1] / max(timings[0], 1e-9):.1f}"
+            print(line)
+    cursor.close()
+    conn.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Partition archive_items by mediatype, online.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('migrate', help="copy archive_items into a partitioned table and swap them; "
+                                         "imports and search_tsv.py are locked out until it finishes")
+    run.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                     help="ids copied per transaction (default: %(default)s)")
+    run.add_argument('--rows-per-sec', type=int, default=0,
+                     help="copy at most this many rows per second; 0 means no limit (default: 0)")
+    run.add_argument('--index-jobs', type=int, default=INDEX_JOBS,
+                     help="indexes built at once (default: %(default)s)")
+    run.add_argument('--maintenance-work-mem', default=MAINTENANCE_WORK_MEM,
+                     help="maintenance_work_mem of each index build (default: %(default)s)")
+    run.add_argument('--resume', action='store_true',
+                     help="continue an interrupted migration from its saved progress")
+    timing = sub.add_parser('bench', help="time the site's per-mediatype queries on each table")
+    timing.add_argument('--tables', nargs='+', default=['archive_items', OLD_TABLE],
+                        help="tables to compare (default: the partitioned table and the old one)")
+    timing.add_argument('--repeat', type=int, default=20,
+                        help="timed runs per query; the median is reported (default: %(default)s)")
+    timing.add_argument('--subject', default='History', help="subject for the subject query")
+    timing.add_argument('--search', default='music', help="terms for the full-text query")
+    args = parser.parse_args(argv)
+    if args.command == 'migrate' and args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'migrate':
+        migrate(args)
+    else:
+        bench(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,119 +1,1054 @@
 import requests as req
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+import argparse
+import asyncio
+import codecs
+import contextlib
+import gzip
+import re
+import threading
 import json
 import time
 import os
+import random
+from collections import Counter, deque
 from tqdm import tqdm
 
-# texts, movies, audio, software, image
-query_to_search = 'mediatype:(texts)'
+import jsoncodec
+
+try:
+    import zstandard
+except ImportError:  # only needed for --compress zstd
+    zstandard = None
+
+# One process crawls any subset of these mediatypes over a single pooled HTTP
+# session and a shared rate limit. Paths are relative to this directory.
+MEDIATYPES = {
+    'texts': {
+        'query': 'mediatype:(texts)',
+        'output': 'text/scrape_text_v1.ndjson',
+        'checkpoint': 'text/checkpoint_text_v1.json',
+        'incremental': 'text/incremental_text_v1.json',
+    },
+    'movies': {
+        'query': 'mediatype:(movies)',
+        'output': 'movies/scrape_movies_v1.ndjson',
+        'checkpoint': 'movies/checkpoint_movies_v1.json',
+        'incremental': 'movies/incremental_movies_v1.json',
+    },
+    'audio': {
+        'query': 'mediatype:(audio)',
+        'output': 'audio/scrape_audio_v1.ndjson',
+        'checkpoint': 'audio/checkpoint_audio_v1.json',
+        'incremental': 'audio/incremental_audio_v1.json',
+    },
+    'software': {
+        'query': 'mediatype:(software)',
+        'output': 'software/scrape_software_v1.ndjson',
+        'checkpoint': 'software/checkpoint_software_v1.json',
+        'incremental': 'software/incremental_software_v1.json',
+    },
+    'image': {
+        'query': 'mediatype:(image)',
+        'output': 'image/scrape_image_v1.ndjson',
+        'checkpoint': 'image/checkpoint_image_v1.json',
+        'incremental': 'image/incremental_image_v1.json',
+    },
+}
+base_dir = os.path.dirname(os.path.abspath(__file__))
 tuples_per_page = 10000
-json_output = os.path.expanduser('./scrape_v1.ndjson')
-checkpoint_file = os.path.expanduser('./checkpoint_v1.json')
 user_agent = 'echoNetScraper/1.0'
 home_url = 'https://archive.org/services/search/v1/scrape'
 
 Meta_Data = ['identifier','description','language','item_size','downloads','btih','mediatype','subject','title','publicdate']
 buffer_time = 0.5
 max_tries = 4
+report_interval = 30
+# --stream: bytes read from the socket per step while decoding a page incrementally
+stream_chunk_size = 64 * 1024
+# Compressed outputs are written one gzip member / zstd frame per page, so a
+# page boundary is always a valid end of stream and checkpoints stay byte-exact.
+compress_suffixes = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+gzip_level = 6
+zstd_level = 3
+
+# Each mediatype is split into publicdate ranges [y_i, y_i+1), each following its
+# own cursor chain and writing its own output file. All partitions of all
+# mediatypes share one rate limit of 1 / buffer_time requests per second.
+partition_years = [2000, 2005, 2010, 2013, 2016, 2019, 2021, 2023, 2025]
+max_in_flight = 4
+# Ceiling for the adaptive limiter, which starts at max_in_flight
+max_concurrency = 16
+
+# --incremental: publicdates in the API's canonical UTC form compare correctly
+# as strings; anything else is ignored when tracking the newest item.
+utc_timestamp = re.compile(r'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ')
+
+# HTTP transport: keep-alive connections reused across pages. The transport
+# retries connection errors only (with exponential backoff); 429/5xx statuses
+# go back to fetch(), whose own retries honor Retry-After.
+pool_size = max_concurrency
+transport_retries = 5
+transport_backoff = 1.0
+retry_statuses = (429, 500, 502, 503, 504)
+
+# Adaptive rate control (AIMD). The crawl starts at 1 / buffer_time requests per
+# second and max_in_flight concurrent requests. While the p95 latency of the
+# last latency_window pages stays under latency_target, every successful page
+# adds to both. An error (including ones the transport retried), a 429/5xx or
+# a p95 over target multiplies both by backoff_factor, at most once per
+# backoff_cooldown seconds so one burst of failures counts as one signal.
+min_rate = 0.2
+max_rate = 20.0
+rate_step = 0.5
+latency_target = 10.0
+latency_window = 50
+backoff_factor = 0.5
+backoff_cooldown = 2.0
+# fetch() retries: sleep half of min(backoff_cap, 2 ** tries) plus up to as much again
+backoff_cap = 60.0
+# The limiter's token bucket holds this many seconds of requests at its current rate
+burst_seconds = 1.0
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` requests per second with bursts of up to `burst`
+    seconds of requests (at least one). The capacity follows the rate: when
+    the rate drops, tokens above the new capacity are dropped, so a full bucket
+    cannot release a burst at the old rate after a backoff.
+    """
+
+    def __init__(self, rate, burst=burst_seconds):
+        self.burst = burst
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.rate = rate
+        self.tokens = self.capacity
+        self.lock = asyncio.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        if hasattr(self, '_rate'):
+            # Tokens earned so far were earned at the old rate
+            self._refill()
+        self._rate = rate
+        self.capacity = max(1.0, rate * self.burst)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self._rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD controller for the request rate and the number of requests in flight.
+    Use `async with limiter.request() as outcome:` around each request and set
+    outcome['status'] to the HTTP status; leaving it None counts as an error.
+    The session's response hook (response_hook) reports connection errors the
+    transport retried on its own. metrics() is a snapshot for reports.
+    """
+
+    def __init__(self, rate, concurrency):
+        self.bucket = TokenBucket(rate)
+        self.limit = concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.last_backoff = float('-inf')
+        self.counters = Counter()
+        self.cond = asyncio.Condition()
+        # observe() also runs on transport threads via response_hook
+        self.lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    @contextlib.asynccontextmanager
+    async def request(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        outcome = {'status': None}
+        try:
+            await self.bucket.acquire()
+            started = time.monotonic()
+            yield outcome
+            self.observe(outcome['status'], time.monotonic() - started)
+        except Exception:
+            self.observe(None, None)
+            raise
+        finally:
+            async with self.cond:
+                self.in_flight -= 1
+                self.cond.notify_all()
+
+    def response_hook(self, resp, *args, **kwargs):
+        """requests response hook: feed connection errors urllib3 retried before returning."""
+        retries = getattr(resp.raw, 'retries', None)
+        for attempt in (retries.history if retries else ()):
+            if attempt.error is not None:
+                with self.lock:
+                    self.counters['retried'] += 1
+                    self.back_off()
+
+    def observe(self, status, seconds):
+        with self.lock:
+            self.counters['requests'] += 1
+            if status is None or status in retry_statuses:
+                self.counters['errors'] += 1
+                self.back_off()
+            elif status == 200:
+                self.latencies.append(seconds)
+                if len(self.latencies) >= 10 and self.p95() > latency_target:
+                    self.counters['slow'] += 1
+                    self.back_off()
+                else:
+                    self.speed_up()
+
+    def p95(self):
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))] if ordered else 0.0
+
+    def speed_up(self):
+        # Additive: about +rate_step requests/s per second of successful pages,
+        # and one more slot per `limit` successes
+        self.bucket.rate = min(max_rate, self.bucket.rate + rate_step / max(self.bucket.rate, 1.0))
+        self.successes += 1
+        if self.successes >= self.limit:
+            self.successes = 0
+            self.limit = min(max_concurrency, self.limit + 1)
+
+    def back_off(self):
+        now = time.monotonic()
+        if now - self.last_backoff < backoff_cooldown:
+            return
+        self.last_backoff = now
+        self.bucket.rate = max(min_rate, self.bucket.rate * backoff_factor)
+        self.limit = max(1, int(self.limit * backoff_factor))
+        self.successes = 0
+        # Latencies seen at the old rate say nothing about the new one
+        self.latencies.clear()
+        self.counters['backoffs'] += 1
+
+    def metrics(self):
+        with self.lock:
+            return {'rate': round(self.bucket.rate, 3), 'concurrency': self.limit,
+                    'in_flight': self.in_flight, 'p95': round(self.p95(), 3), **self.counters}
+
+    def summary(self):
+        m = self.metrics()
+        return (f"rate={m['rate']:.2f}/s in_flight={m['in_flight']}/{m['concurrency']} "
+                f"p95={m['p95'] * 1000:.0f}ms backoffs={m.get('backoffs', 0)} "
+                f"errors={m.get('errors', 0)} retried={m.get('retried', 0)}")
+
+
+def retry_delay(tries, wait=0.0):
+    """
+    Jittered exponential backoff before fetch() attempt tries + 1, or the
+    server's Retry-After (wait) if that is longer.
+    """
+    delay = min(backoff_cap, 2 ** tries)
+    return max(delay / 2 + random.uniform(0, delay / 2), wait)
+
+
+def retry_after(resp):
+    """Seconds a response asks the client to wait (Retry-After in seconds), capped at backoff_cap."""
+    try:
+        return min(backoff_cap, max(0.0, float(resp.headers.get('Retry-After'))))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class MediatypeCrawl:
+    """
+    Configuration, per-partition cursor state and counters for one mediatype.
+
+    A full crawl covers every publicdate partition. An incremental crawl has a
+    single 'delta-<UTC time>' partition holding items published at or after
+    the high-water mark, the newest publicdate any earlier crawl wrote; its
+    state lives in a separate file so the full crawl's cursors are untouched.
+    """
+
+    def __init__(self, name, compress='none', incremental=False):
+        config = MEDIATYPES[name]
+        self.name = name
+        self.query = config['query']
+        self.output = os.path.join(base_dir, config['output'])
+        self.compress = compress
+        self.incremental = incremental
+        self.checkpoint_file = os.path.join(base_dir, config['incremental' if incremental else 'checkpoint'])
+        self.full_checkpoint_file = os.path.join(base_dir, config['checkpoint'])
+        self.docs = 0
+        self.highwater = None
+        self.since = None
+        self.state = self.incremental_load() if incremental else self.checkpoint_load()
+
+    def partitions(self):
+        """Return [(key, query)] for this crawl's partitions."""
+        if self.incremental:
+            return [(key, f"{self.query} AND publicdate:[{self.since} TO *]") for key in self.state]
+        return self.date_partitions()
+
+    def date_partitions(self):
+        """Return [(key, query)] covering every publicdate, plus items without one."""
+        edges = [None] + partition_years + [None]
+        parts = []
+        for lo, hi in zip(edges[:-1], edges[1:]):
+            key = f"{lo or 'min'}-{hi or 'max'}"
+            lo_date = f"{lo}-01-01T00:00:00Z" if lo else '*'
+            hi_date = f"{hi}-01-01T00:00:00Z" if hi else '*'
+            parts.append((key, f"{self.query} AND publicdate:[{lo_date} TO {hi_date}}}"))
+        parts.append(('nodate', f"{self.query} AND NOT publicdate:[* TO *]"))
+        return parts
+
+    def partition_output(self, key):
+        base, ext = os.path.splitext(self.output)
+        return f"{base}.{key}{ext}{compress_suffixes[self.compress]}"
+
+    def newest(self):
+        """Newest publicdate written by any partition, or None."""
+        return max((s['newest'] for s in self.state.values() if s.get('newest')), default=None)
+
+    def seen(self, key, newest):
+        if newest and newest > self.state[key].get('newest', ''):
+            self.state[key]['newest'] = newest
+
+    def checkpoint(self):
+        saved = {'partitions': self.state}
+        if self.incremental:
+            # The mark only moves once the whole delta is on disk
+            if all(s['done'] for s in self.state.values()):
+                self.highwater = max(filter(None, (self.highwater, self.newest())))
+            saved.update(highwater=self.highwater, since=self.since)
+        write_json_atomic(self.checkpoint_file, saved)
+
+    def recover(self, key):
+        """
+        Cut a partition's output back to the offset its checkpoint committed,
+        dropping whatever a crash left after the last checkpoint (a whole page
+        or a torn one), and return the committed line count. The checkpoint is
+        only written once the page it covers is fsynced, so the output is never
+        shorter than that offset unless it was touched by hand; then the
+        partition starts over.
+        """
+        output = self.partition_output(key)
+        state = self.state[key]
+        size = os.path.getsize(output) if os.path.exists(output) else 0
+        if 'offset' not in state:
+            # Checkpoint from before offsets were recorded
+            if size and self.compress == 'none':
+                keep = complete_lines_size(output)
+                if keep < size:
+                    print("Dropping torn last line of ", output)
+                    os.truncate(output, keep)
+            return line_index_load(output)
+        if size > state['offset']:
+            print("Truncating ", output, " from ", size, " to committed offset ", state['offset'])
+            os.truncate(output, state['offset'])
+        elif size < state['offset']:
+            print("Output ", output, " is shorter than its checkpoint; restarting partition ", key)
+            if size:
+                os.truncate(output, 0)
+            state.update(cursor='*', offset=0, lines=0)
+            state.pop('newest', None)
+        return state.get('lines', 0)
+
+    def checkpoint_load(self):
+        """
+        Per-partition {'cursor', 'done', 'offset', 'lines'} state, keyed like
+        partitions(); offset is the committed size of the partition's output.
+        """
+        state = {}
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, 'r') as c:
+                saved = json.load(c)
+            if 'partitions' in saved:
+                state = saved['partitions']
+            else:
+                print("Ignoring single-cursor checkpoint from the sequential scraper: ", self.checkpoint_file)
+        for key, _ in self.partitions():
+            state.setdefault(key, {'cursor': '*', 'done': False})
+        return state
+
+    def incremental_load(self):
+        """State of the delta to crawl: the interrupted one if any, else a new one."""
+        saved = {}
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, 'r') as c:
+                saved = json.load(c)
+        self.highwater = saved.get('highwater') or self.full_crawl_highwater()
+        partitions = saved.get('partitions', {})
+        if partitions and not all(s['done'] for s in partitions.values()):
+            self.since = saved['since']
+            return partitions
+        if self.highwater is None:
+            print("No high-water mark for ", self.name, "; run a full crawl first. Skipping.")
+            return {}
+        self.since = self.highwater
+        started = int(time.time())
+        while True:
+            key = time.strftime('delta-%Y%m%dT%H%M%SZ', time.gmtime(started))
+            if not os.path.exists(self.partition_output(key)):
+                return {key: {'cursor': '*', 'done': False}}
+            started += 1
+
+    def full_crawl_highwater(self):
+        """
+        Newest publicdate written by the full crawl, from its checkpoint or, for
+        checkpoints written before it was tracked, by scanning its output files.
+        """
+        state = {}
+        if os.path.exists(self.full_checkpoint_file):
+            with open(self.full_checkpoint_file, 'r') as c:
+                state = json.load(c).get('partitions', {})
+        newest = [s['newest'] for s in state.values() if s.get('newest')]
+        if newest:
+            return max(newest)
+        base, ext = os.path.splitext(self.output)
+        outputs = [f"{base}.{key}{ext}{suffix}" for key, _ in self.date_partitions()
+                   for suffix in compress_suffixes.values()]
+        return max(filter(None, (newest_publicdate(o) for o in outputs if os.path.exists(o))), default=None)
+
+
+class LatencyHistogram:
+    """Thread-safe histogram of durations in seconds over fixed log-spaced buckets."""
+
+    bounds = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(self.bounds) and seconds > self.bounds[i]:
+            i += 1
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (inf for the overflow bucket)."""
+        with self.lock:
+            target = q * self.count
+            seen = 0
+            for i, n in enumerate(self.counts):
+                seen += n
+                if n and seen >= target:
+                    return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return 0.0
+
+    def summary(self):
+        if not self.count:
+            return "n=0"
+        return (f"n={self.count} mean={self.total / self.count * 1000:.0f}ms "
+                f"p50<={self.percentile(0.5) * 1000:.0f}ms p95<={self.percentile(0.95) * 1000:.0f}ms "
+                f"p99<={self.percentile(0.99) * 1000:.0f}ms")
+
+
+# Where crawl time goes: TCP+TLS connect (only when a new connection is opened),
+# time to first byte after connecting, and body download.
+latency = {
+    'connect': LatencyHistogram(),
+    'ttfb': LatencyHistogram(),
+    'body': LatencyHistogram(),
+}
+
+# Start and connect time of the HTTP attempt running in the current thread
+# (see TimedPoolMixin): a transport retry starts the clock again
+_timing = threading.local()
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _timing.connect = getattr(_timing, 'connect', 0.0) + time.perf_counter() - started
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _timing.connect = getattr(_timing, 'connect', 0.0) + time.perf_counter() - started
+
+
+class TimedPoolMixin:
+    """Restarts the request clock for every attempt, transport retries included."""
+
+    def _make_request(self, *args, **kwargs):
+        _timing.connect = 0.0
+        _timing.started = time.perf_counter()
+        return super()._make_request(*args, **kwargs)
+
+
+class TimedHTTPConnectionPool(TimedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(TimedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
 
-def fetch(cursor='*'):
-    if cursor == '*':
-        params = {
-            'q': query_to_search,
-            'fields': ','.join(Meta_Data),
-            'size': tuples_per_page
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools time every new connection they open."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
         }
+
+
+def make_session(pool_size=pool_size):
+    """One keep-alive session shared by every partition of every mediatype."""
+    session = req.Session()
+    session.headers['User-Agent'] = user_agent
+    session.headers['Connection'] = 'keep-alive'
+    # Connection errors only: statuses are fetch()'s to retry, so a page never
+    # makes max_tries * transport_retries attempts
+    retry = Retry(
+        total=transport_retries,
+        status=0,
+        backoff_factor=transport_backoff,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def record_headers():
+    """Record connect and time-to-first-byte of the last attempt of a request."""
+    headers_at = time.perf_counter()
+    connect = _timing.connect
+    if connect:
+        latency['connect'].observe(connect)
+    latency['ttfb'].observe(headers_at - _timing.started - connect)
+    return headers_at
+
+
+def timed_get(session, url, params, timeout):
+    """session.get that records connect / time-to-first-byte / body latencies."""
+    resp = session.get(url, params=params, timeout=timeout, stream=True)
+    headers_at = record_headers()
+    resp.content  # download the body
+    latency['body'].observe(time.perf_counter() - headers_at)
+    return resp
+
+
+class PageStream:
+    """
+    Incrementally decode a scrape page {"items": [...], "cursor": ..., ...} from an
+    iterable of byte chunks. Iterating yields the items one at a time; the other
+    top-level keys are collected in .meta once iteration finishes. Only the
+    current chunk and the item being decoded are held in memory.
+    """
+
+    _ws = re.compile(r'\s*')
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.saw_items = False
+        self.meta = {}
+
+    def _fill(self):
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.buf += self.utf8.decode(chunk)
+                return
+        self.buf += self.utf8.decode(b'', final=True)
+        self.eof = True
+
+    def _peek(self):
+        while True:
+            self.pos = self._ws.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                raise ValueError("page ended early")
+            self._fill()
+
+    def _expect(self, allowed):
+        c = self._peek()
+        if c not in allowed:
+            raise ValueError(f"unexpected {c!r} in page")
+        self.pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self):
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == 'items':
+                self.saw_items = True
+                self._expect('[')
+                if self._peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(',]') == ']':
+                            break
+            else:
+                self.meta[key] = self._value()
+            if self._expect(',}') == '}':
+                return
+
+
+def page_params(query, cursor):
+    params = {
+        'q': query,
+        'fields': ','.join(Meta_Data),
+        'size': tuples_per_page
+    }
+    if cursor != '*':
+        params['cursor'] = cursor
+    return params
+
+
+@contextlib.contextmanager
+def page_writer(json_out, compress='none'):
+    """
+    Writable for one page of output. With compression every page becomes a
+    self-contained gzip member or zstd frame, finished when the block exits.
+    """
+    if compress == 'gzip':
+        with gzip.GzipFile(fileobj=json_out, mode='wb', compresslevel=gzip_level, mtime=0) as out:
+            yield out
+    elif compress == 'zstd':
+        with zstandard.ZstdCompressor(level=zstd_level).stream_writer(json_out, closefd=False) as out:
+            yield out
     else:
-        params = {
-            'q': query_to_search,
-            'fields': ','.join(Meta_Data),
-            'size': tuples_per_page,
-            'cursor': cursor
-        }
+        yield json_out
+
+
+def page_reader(f, output):
+    """Binary line reader over an output file, decompressing it if needed."""
+    if output.endswith('.gz'):
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    if output.endswith('.zst'):
+        return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+    return f
+
+
+def stream_page_once(session, params, json_out, compress='none', records=None):
+    """
+    GET one page and append each projected item to json_out as soon as it is
+    decoded, collecting the projected records in records when given. If the
+    request or the body fails part way, the partial page is truncated away
+    (and records emptied) before the error propagates. Returns (status,
+    Retry-After seconds, docs, lines, newest publicdate, next cursor).
+    """
+    if records is not None:
+        records.clear()
+    json_out.seek(0, os.SEEK_END)
+    page_start = json_out.tell()
+    try:
+        with session.get(home_url, params=params, timeout=60, stream=True) as resp:
+            headers_at = record_headers()
+            if resp.status_code != 200:
+                return resp.status_code, retry_after(resp), 0, 0, None, None
+            page = PageStream(resp.iter_content(chunk_size=stream_chunk_size))
+            with page_writer(json_out, compress) as out:
+                docs, lines, newest = write_items(page, out, records)
+            latency['body'].observe(time.perf_counter() - headers_at)
+            if not page.saw_items:
+                raise ValueError("response has no 'items'")
+            return 200, 0.0, docs, lines, newest, page.meta.get('cursor')
+    except Exception:
+        json_out.flush()
+        json_out.truncate(page_start)
+        if records is not None:
+            records.clear()
+        raise
+
+
+async def fetch(session, query, cursor='*', limiter=None):
+    params = page_params(query, cursor)
     for tries in range(max_tries):
+        wait = 0.0
         try:
-            resp = req.get(home_url, params=params, headers={'User-Agent': user_agent}, timeout=60)
-            print("Fetching cursor: ", cursor)
+            async with limiter.request() as outcome:
+                resp = await asyncio.to_thread(timed_get, session, home_url, params, 60)
+                outcome['status'] = resp.status_code
             if resp.status_code == 200:
-                data = resp.json()
+                data = jsoncodec.loads(resp.content)
                 if 'items' in data:
                     return data
                 else:
                     print("Invalid response for cursor: ", cursor, "Retrying...")
             else:
                 print("Status: ", resp.status_code, "Retrying...")
+                wait = retry_after(resp)
         except Exception as e:
             print("Exception on cursor: ", cursor, "Exception: ", e, "Retrying...")
-        time.sleep(2 ** tries)
+        await asyncio.sleep(retry_delay(tries, wait))
     print("Failed after ", max_tries, " tries for cursor: ", cursor)
     return None
 
 
-def checkpoint(cursor):
-    with open(checkpoint_file, 'w') as c:
-        json.dump({'last_cursor': cursor}, c)
+async def fetch_stream(session, query, cursor, limiter, json_out, compress='none', records=None):
+    """Streaming counterpart of fetch(): returns (docs, lines, newest, next cursor) or None."""
+    params = page_params(query, cursor)
+    for tries in range(max_tries):
+        wait = 0.0
+        try:
+            async with limiter.request() as outcome:
+                status, wait, docs, lines, newest, next_cursor = await asyncio.to_thread(
+                    stream_page_once, session, params, json_out, compress, records)
+                outcome['status'] = status
+            if status == 200:
+                return docs, lines, newest, next_cursor
+            print("Status: ", status, "Retrying...")
+        except Exception as e:
+            print("Exception on cursor: ", cursor, "Exception: ", e, "Retrying...")
+        await asyncio.sleep(retry_delay(tries, wait))
+    print("Failed after ", max_tries, " tries for cursor: ", cursor)
+    return None
+
+
+def line_index_load(output):
+    """Line count of output; the sidecar is trusted only if it matches the file size."""
+    if not os.path.exists(output):
+        return 0
+    size = os.path.getsize(output)
+    if os.path.exists(output + '.lines'):
+        with open(output + '.lines', 'r') as c:
+            index = json.load(c)
+        if index.get('bytes') == size:
+            return index.get('lines', 0)
+    with open(output, 'rb') as f:
+        return sum(1 for _ in page_reader(f, output))
+
+
+def newer_publicdate(value, newest):
+    """The later of a scraped publicdate and newest (None if neither is canonical)."""
+    if isinstance(value, str) and utc_timestamp.fullmatch(value) and (newest is None or value > newest):
+        return value
+    return newest
+
 
+def newest_publicdate(output):
+    """Newest canonical publicdate in an output file, or None."""
+    newest = None
+    with open(output, 'rb') as f:
+        for line in page_reader(f, output):
+            try:
+                value = jsoncodec.loads(line).get('publicdate')
+            except (ValueError, AttributeError):
+                continue
+            newest = newer_publicdate(value, newest)
+    return newest
 
-def checkpoint_load():
-    if os.path.exists(checkpoint_file):
-        with open(checkpoint_file, 'r') as c:
-            return json.load(c).get('last_cursor', '*')
-    return '*'
 
+def line_index_save(output, lines):
+    # Sidecar read by import_to_db.py so it can show item totals without a pre-scan
+    write_json_atomic(output + '.lines', {'lines': lines, 'bytes': os.path.getsize(output)})
 
-def main():
-    cursor = checkpoint_load()
-    total_docs = 0
-    print("Starting scrape from cursor: ", cursor)
 
-    with open(json_output, 'a', encoding='utf-8') as json_out:
-        pbar = tqdm(total=0)
+def project(d, identifier):
+    return {
+        'identifier': d.get('title', 'Unknown'),
+        'description': d.get('description', 'Unknown'),
+        'language': d.get('language', 'Unknown'),
+        'item_size': d.get('item_size', 0),
+        'downloads': d.get('downloads', 0),
+        'btih': d.get('btih', 'Unknown'),
+        'mediatype': d.get('mediatype', 'Unknown'),
+        'subject': d.get('subject', 'Unknown'),
+        'title': d.get('title', 'Unknown'),
+        'publicdate': d.get('publicdate', 'Unknown'),
+        'url': f"https://archive.org/details/{identifier}"
+    }
+
+
+def write_items(items, json_out, records=None):
+    """
+    Project items and append them to json_out as NDJSON; the projected records
+    are also appended to records when given. Returns (docs, lines written,
+    newest publicdate).
+    """
+    docs = 0
+    lines = 0
+    newest = None
+    for d in items:
+        docs += 1
+        identifier = d.get('identifier')
+        if not identifier:
+            continue
+        record = project(d, identifier)
+        json_out.write(jsoncodec.dumps_line(record))
+        if records is not None:
+            records.append(record)
+        lines += 1
+        newest = newer_publicdate(record['publicdate'], newest)
+    return docs, lines, newest
+
+
+async def crawl_partition(crawl, key, query, session, limiter, pbar, stream=False, sink=None):
+    output = crawl.partition_output(key)
+    total_lines = crawl.recover(key)
+    cursor = crawl.state[key]['cursor']
+    print("Starting ", crawl.name, " partition ", key, " from cursor: ", cursor)
+
+    # Commit protocol: append a page, fsync it, then atomically replace the
+    # checkpoint with the new cursor and the output's byte offset. Anything
+    # past that offset on restart was never committed (see recover()).
+    # The columnar sink only gets a page's records once it is committed, so
+    # a page that failed part way and was fetched again is not added twice.
+    records = [] if sink is not None else None
+    with open(output, 'ab') as json_out:
+        committed = json_out.tell()
         while True:
-            data = fetch(cursor)
-            if not data or 'items' not in data:
-                print("No data for cursor: ", cursor, "Stopping.")
-                break
+            if stream:
+                page = await fetch_stream(session, query, cursor, limiter, json_out,
+                                          crawl.compress, records)
+                if page is None:
+                    print("No data for ", crawl.name, " partition ", key, " cursor: ", cursor, "Stopping.")
+                    return
+                docs, lines, newest, next_cursor = page
+            else:
+                data = await fetch(session, query, cursor, limiter)
+                if not data or 'items' not in data:
+                    print("No data for ", crawl.name, " partition ", key, " cursor: ", cursor, "Stopping.")
+                    return
+                if records is not None:
+                    records.clear()
+                with page_writer(json_out, crawl.compress) as out:
+                    docs, lines, newest = write_items(data['items'], out, records)
+                next_cursor = data.get('cursor')
 
-            docs = data['items']
             if not docs:
-                print("No more items for cursor: ", cursor)
+                # An empty page still leaves a gzip member / zstd frame behind
+                json_out.truncate(committed)
+                print("No more items for ", crawl.name, " partition ", key, " cursor: ", cursor)
                 break
 
-            for d in docs:
-                identifier = d.get('identifier')
-                if not identifier:
-                    continue
-                book_data = {
-                    'identifier': d.get('title', 'Unknown'),
-                    'description': d.get('description', 'Unknown'),
-                    'language': d.get('language', 'Unknown'),
-                    'item_size': d.get('item_size', 0),
-                    'downloads': d.get('downloads', 0),
-                    'btih': d.get('btih', 'Unknown'),
-                    'mediatype': d.get('mediatype', 'Unknown'),
-                    'subject': d.get('subject', 'Unknown'),
-                    'title': d.get('title', 'Unknown'),
-                    'publicdate': d.get('publicdate', 'Unknown'),
-                    'url': f"https://archive.org/details/{identifier}"
-                }
-                json_out.write(json.dumps(book_data, ensure_ascii=False) + '\n')
-
             json_out.flush()
-            total_docs += len(docs)
-            pbar.total = total_docs
-            pbar.refresh()
+            os.fsync(json_out.fileno())
+            committed = json_out.tell()
+            total_lines += lines
+            crawl.docs += docs
+            pbar.update(docs)
+            crawl.seen(key, newest)
 
-            cursor = data.get('cursor')
-            checkpoint(cursor)
+            cursor = next_cursor
+            crawl.state[key].update(cursor=cursor or '*', done=not cursor, offset=committed,
+                                    lines=total_lines)
+            crawl.checkpoint()
+            line_index_save(output, total_lines)
+            if sink is not None:
+                for record in records:
+                    sink.add_item(record)
 
-            print("Saved: ", len(docs), "items, total: ", total_docs)
             if not cursor:
-                print("Reached end of dataset for cursor: ", cursor)
+                print("Reached end of ", crawl.name, " partition ", key)
                 break
 
-            time.sleep(buffer_time)
+    crawl.state[key]['done'] = True
+    crawl.checkpoint()
+
+
+def write_json_atomic(path, obj):
+    """Replace path with obj as JSON: temp file, fsync, rename, fsync the directory."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def complete_lines_size(output, chunk_size=64 * 1024):
+    """Size of a plain NDJSON file up to and including its last newline."""
+    with open(output, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - chunk_size)
+            f.seek(start)
+            i = f.read(end - start).rfind(b'\n')
+            if i >= 0:
+                return start + i + 1
+            end = start
+    return 0
+
+
+def report(crawls, started, limiter=None, metrics_file=None):
+    """Print documents and throughput per mediatype and combined."""
+    elapsed = max(time.monotonic() - started, 1e-9)
+    total = 0
+    for crawl in crawls:
+        total += crawl.docs
+        done = sum(1 for s in crawl.state.values() if s['done'])
+        print(f"  {crawl.name:<9} {crawl.docs:>10} docs  {crawl.docs / elapsed:8.1f} docs/s  "
+              f"{done}/{len(crawl.state)} partitions done")
+    print(f"  {'total':<9} {total:>10} docs  {total / elapsed:8.1f} docs/s  ({elapsed:.0f}s)")
+    for phase, hist in latency.items():
+        print(f"  {phase:<9} {hist.summary()}")
+    if limiter is not None:
+        print(f"  {'limiter':<9} {limiter.summary()}")
+    if metrics_file:
+        write_metrics(metrics_file, crawls, limiter, elapsed)
+
+
+def write_metrics(path, crawls, limiter, elapsed):
+    """Replace `path` with a JSON snapshot of throughput, latency and limiter state."""
+    def bound(hist, q):
+        # Overflow bucket (inf) is written as null
+        value = hist.percentile(q)
+        return value if value != float('inf') else None
+
+    snapshot = {
+        'time': time.time(),
+        'elapsed': elapsed,
+        'docs': {crawl.name: crawl.docs for crawl in crawls},
+        'latency': {phase: {'count': hist.count, 'p50': bound(hist, 0.5), 'p95': bound(hist, 0.95),
+                            'p99': bound(hist, 0.99)}
+                    for phase, hist in latency.items()},
+        'limiter': limiter.metrics() if limiter is not None else None,
+    }
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+async def report_loop(crawls, started, limiter=None, metrics_file=None):
+    while True:
+        await asyncio.sleep(report_interval)
+        report(crawls, started, limiter, metrics_file)
+
+
+async def crawl_all(names, pool_size=pool_size, stream=False, compress='none', parquet=None,
+                    incremental=False, metrics_file=None):
+    crawls = [MediatypeCrawl(name, compress, incremental) for name in names]
+    session = make_session(pool_size)
+    limiter = AdaptiveLimiter(1 / buffer_time, max_in_flight)
+    session.hooks['response'].append(limiter.response_hook)
+    pending = []
+    for crawl in crawls:
+        os.makedirs(os.path.dirname(crawl.output), exist_ok=True)
+        pending.extend((crawl, key, query) for key, query in crawl.partitions()
+                       if not crawl.state[key]['done'])
+        if crawl.incremental and crawl.since:
+            print("Incremental ", crawl.name, ": items published since ", crawl.since)
+    print("Crawling ", len(pending), " partition(s) of ", ', '.join(names),
+          " starting with ", max_in_flight, " requests in flight (adaptive, up to ", max_concurrency, ")")
+
+    sink = None
+    if parquet:
+        # Optional columnar copy of everything written this run (see columnar.py)
+        from columnar import ColumnarSink
+        sink = ColumnarSink(parquet)
+
+    started = time.monotonic()
+    reporter = asyncio.create_task(report_loop(crawls, started, limiter, metrics_file))
+    try:
+        with tqdm(unit='items') as pbar:
+            await asyncio.gather(*(crawl_partition(crawl, key, query, session, limiter, pbar,
+                                                   stream, sink)
+                                   for crawl, key, query in pending))
+    finally:
+        reporter.cancel()
+        session.close()
+        if sink is not None:
+            sink.close()
+
+    print("Scraping completed.")
+    report(crawls, started, limiter, metrics_file)
+
 
-    print("Scraping completed. Total documents: ", total_docs, ". Output: ", json_output)
+def main(argv=None):
+    global home_url
+    parser = argparse.ArgumentParser(description="Scrape archive.org metadata into NDJSON.")
+    parser.add_argument('mediatypes', nargs='*', choices=sorted(MEDIATYPES), metavar='mediatype',
+                        help="mediatypes to crawl (default: all of %s)" % ', '.join(MEDIATYPES))
+    parser.add_argument('--pool-size', type=int, default=pool_size,
+                        help="keep-alive connections kept open to the API (default: %(default)s)")
+    parser.add_argument('--stream', action='store_true',
+                        help="decode each page incrementally and write items as they arrive, "
+                             "keeping memory bounded by one item instead of one page")
+    parser.add_argument('--compress', choices=sorted(compress_suffixes), default='none',
+                        help="write <output>.ndjson.gz / .ndjson.zst instead of plain NDJSON, "
+                             "one compressed block per page (default: %(default)s)")
+    parser.add_argument('--parquet', metavar='DIR', nargs='?', const=os.path.join(base_dir, 'parquet'),
+                        help="also write every scraped item to a Parquet dataset partitioned by "
+                             "mediatype and publicdate year (default DIR: parquet/; needs pyarrow)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="fetch only items published since the newest one already scraped, "
+                             "into a <output>.delta-<time>.ndjson file per run")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write a JSON snapshot of throughput, latency and rate-limiter state "
+                             "to FILE every %d seconds" % report_interval)
+    parser.add_argument('--url', default=home_url,
+                        help="scrape API endpoint, e.g. a local fake server for testing "
+                             "(default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.compress == 'zstd' and zstandard is None:
+        parser.error("--compress zstd requires the zstandard package (pip install zstandard)")
+    home_url = args.url
+    asyncio.run(crawl_all(args.mediatypes or list(MEDIATYPES), args.pool_size, args.stream,
+                          args.compress, args.parquet, args.incremental, args.metrics))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,221 @@
+"""
+Backfill or rebuild archive_items.search_tsv in small, throttled transactions.
+
+The vectors are normally kept up to date by trg_archive_items_tsv. This tool
+fills them in for rows written while that trigger was missing or disabled,
+and switches the text search configuration: search_tsv_config() is the one
+setting the trigger, the importer and the site's queries all use, so --config
+changes it for all of them before the vectors are rewritten. It walks the
+table in id-range chunks. Each chunk is one short transaction, so autovacuum
+keeps up and no lock is held for long. Rows whose stored vector already
+equals the freshly computed one are not rewritten.
+
+Progress is saved after every committed chunk. An interrupted run continues
+where it stopped when rerun with --resume.
+
+Usage:
+    python search_tsv.py [--chunk-size 5000] [--rows-per-sec 20000] [--resume]
+    python search_tsv.py --config english --reindex   # switch configurations
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.sql
+from tqdm import tqdm
+
+from import_to_db import connect_db, lock_out_migration
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.search_tsv_backfill.json')
+CHUNK_SIZE = 5000
+SEARCH_INDEX = 'idx_archive_items_search_tsv'
+
+# One chunk: compute the vectors of ids [lo, hi] once, the way
+# archive_items_tsv_trigger() does, rewrite only the rows whose vector
+# differs, and report (rows scanned, rows rewritten).
+CHUNK_SQL = """
+WITH chunk AS (
+    SELECT id, to_tsvector(search_tsv_config(), coalesce(a.title, '') || ' ' || coalesce(a.description, '')) AS tsv
+    FROM archive_items a WHERE id BETWEEN %(lo)s AND %(hi)s
+), rewritten AS (
+    UPDATE archive_items a SET search_tsv = chunk.tsv
+    FROM chunk
+    WHERE a.id = chunk.id AND a.search_tsv IS DISTINCT FROM chunk.tsv
+    RETURNING 1
+)
+SELECT (SELECT count(*) FROM chunk), (SELECT count(*) FROM rewritten)
+"""
+
+# Inlined into every statement that calls it, so replacing it switches the
+# trigger, the importer and the site's queries at once
+CONFIG_SQL = """
+CREATE OR REPLACE FUNCTION search_tsv_config() RETURNS regconfig
+    LANGUAGE sql IMMUTABLE AS {body}
+"""
+
+def load_state():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.warning("Ignoring unreadable %s: %s", STATE_FILE, e)
+        return None
+
+def save_state(state):
+    """Atomically replace STATE_FILE, like the importer's checkpoints."""
+    tmp = f"{STATE_FILE}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATE_FILE)
+
+def current_config(conn):
+    """The configuration search_tsv_config() returns."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT search_tsv_config()::text")
+    config = cursor.fetchone()[0]
+    conn.commit()
+    cursor.close()
+    return config
+
+def set_config(conn, config):
+    """
+    Make search_tsv_config() return `config` (which must exist). New writes
+    and the site's searches use it from the next statement on; vectors stored
+    before are rewritten by backfill().
+    """
+    cursor = conn.cursor()
+    # Raises for an unknown configuration; its canonical name goes in the function
+    cursor.execute("SELECT %s::regconfig::text", (config,))
+    config = cursor.fetchone()[0]
+    body = psycopg2.sql.SQL("SELECT {}::regconfig").format(psycopg2.sql.Literal(config)).as_string(cursor)
+    cursor.execute(psycopg2.sql.SQL(CONFIG_SQL).format(body=psycopg2.sql.Literal(body)))
+    conn.commit()
+    cursor.close()
+    logger.info("search_tsv_config() now returns '%s'", config)
+
+def backfill(conn, chunk_size=CHUNK_SIZE, rows_per_sec=0, resume=False):
+    """
+    Recompute search_tsv with the current search_tsv_config() chunk by chunk,
+    from the lowest id up to the highest id present when the run started.
+    Rows inserted later get their vectors from the trigger. Sleeps between
+    chunks so no more than rows_per_sec rows are scanned per second (0: no
+    limit). The saved progress is removed once the last chunk is committed.
+    Returns {'scanned', 'rewritten'}.
+    """
+    config = current_config(conn)
+    cursor = conn.cursor()
+    # Writing only search_tsv fires neither trg_archive_items_tsv nor
+    # update_archive_items_updated_at (see database_schema.sql)
+    # Never queue behind (and so block) other writers for long
+    cursor.execute("SET lock_timeout = '5s'")
+    conn.commit()
+
+    state = load_state() if resume else None
+    if state is not None and state['config'] != config:
+        logger.info("Saved progress is for the '%s' configuration; starting over", state['config'])
+        state = None
+    if state is None:
+        cursor.execute("SELECT min(id), max(id) FROM archive_items")
+        lo, hi = cursor.fetchone()
+        if lo is None:
+            logger.info("archive_items is empty")
+            return {'scanned': 0, 'rewritten': 0}
+        state = {'config': config, 'next_id': lo, 'max_id': hi, 'scanned': 0, 'rewritten': 0}
+        save_state(state)
+    elif state['next_id'] > state['max_id']:
+        logger.info("Nothing left to backfill (ids up to %d already done)", state['max_id'])
+    else:
+        logger.info("Resuming at id %d of %d", state['next_id'], state['max_id'])
+
+    cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'archive_items'::regclass")
+    estimate = max(cursor.fetchone()[0], 0)
+    started = time.monotonic()
+    scanned = rewritten = 0
+    with tqdm(total=estimate or None, initial=state['scanned'], desc="search_tsv", unit="rows") as pbar:
+        while state['next_id'] <= state['max_id']:
+            lo = state['next_id']
+            hi = min(lo + chunk_size - 1, state['max_id'])
+            try:
+                cursor.execute(CHUNK_SQL, {'lo': lo, 'hi': hi})
+                chunk_scanned, chunk_rewritten = cursor.fetchone()
+                conn.commit()
+            except psycopg2.errors.LockNotAvailable:
+                conn.rollback()
+                logger.warning("Ids %d-%d are locked by another session; retrying", lo, hi)
+                time.sleep(1)
+                continue
+            state.update(next_id=hi + 1, scanned=state['scanned'] + chunk_scanned,
+                         rewritten=state['rewritten'] + chunk_rewritten)
+            save_state(state)
+            scanned += chunk_scanned
+            rewritten += chunk_rewritten
+            pbar.update(chunk_scanned)
+            pbar.set_postfix(rewritten=state['rewritten'], id=hi)
+            if rows_per_sec:
+                ahead = scanned / rows_per_sec - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    cursor.close()
+    os.remove(STATE_FILE)
+    elapsed = time.monotonic() - started
+    logger.info("search_tsv: %d rows scanned, %d rewritten in %.1fs (%.0f rows/s)",
+                state['scanned'], state['rewritten'], elapsed, scanned / max(elapsed, 1e-9))
+    return {'scanned': state['scanned'], 'rewritten': state['rewritten']}
+
+def reindex(conn):
+    """Rebuild the search_tsv GIN index without blocking reads or writes."""
+    conn.autocommit = True
+    cursor = conn.cursor()
+    started = time.monotonic()
+    cursor.execute(psycopg2.sql.SQL("REINDEX INDEX CONCURRENTLY {}").format(
+        psycopg2.sql.Identifier(SEARCH_INDEX)))
+    cursor.close()
+    logger.info("Reindexed %s in %.1fs", SEARCH_INDEX, time.monotonic() - started)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill or rebuild archive_items.search_tsv in throttled chunks.")
+    parser.add_argument('--config',
+                        help="first switch the text search configuration (search_tsv_config()) "
+                             "of the trigger, the importer and the site's searches to this one")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="ids per transaction (default: %(default)s)")
+    parser.add_argument('--rows-per-sec', type=int, default=0,
+                        help="scan at most this many rows per second; 0 means no limit (default: 0)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue after the last chunk a previous run committed")
+    parser.add_argument('--reindex', action='store_true',
+                        help=f"rebuild {SEARCH_INDEX} concurrently afterwards")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.rows_per_sec < 0:
+        parser.error("--rows-per-sec cannot be negative")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = connect_db()
+    try:
+        lock_out_migration(conn)
+        if args.config:
+            set_config(conn, args.config)
+        backfill(conn, args.chunk_size, args.rows_per_sec, args.resume)
+        if args.reindex:
+            reindex(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+A Parquet dataset written by columnar.py must load into exactly the rows and
+content hashes an NDJSON import of the same items writes, whatever the subject
+holds. The database test runs in a throwaway schema and is skipped when the
+database in import_to_db.DB_CONFIG cannot be reached.
+"""
+
+import json
+import os
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import columnar
+from import_to_db import DB_CONFIG, content_hashes, import_columnar, import_ndjson_file, sanitize_item
+
+SCHEMA_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'schema', 'database_schema.sql')
+
+SCHEMA_END = '\nSELECT count(*) from archive_items;'
+
+ITEMS = [
+    {'identifier': 'mixed-list', 'mediatype': 'texts', 'subject': ['x', 1]},
+    {'identifier': 'dict', 'mediatype': 'texts', 'subject': {'k': 1}},
+    {'identifier': 'json-text', 'mediatype': 'audio', 'subject': '["a", 2, {"b": null}, 1.5]'},
+    {'identifier': 'plain', 'mediatype': 'movies', 'subject': ' plain ', 'title': 'Ünïcode ✓',
+     'downloads': '12', 'publicdate': '2021-01-01T04:00:00+02:00'},
+    {'identifier': 'number', 'subject': 5, 'description': 'line\nbreak, "quoted"'},
+    {'identifier': 'no-subject', 'mediatype': 'texts', 'title': ''},
+]
+
+ROWS_SQL = """
+SELECT identifier, title, description, language, item_size, downloads, btih, mediatype,
+       subject, publicdate, url, content_hash
+FROM archive_items ORDER BY identifier
+"""
+
+
+@pytest.fixture
+def ndjson(tmp_path):
+    path = tmp_path / 'items.ndjson'
+    path.write_text(''.join(json.dumps(item) + '\n' for item in ITEMS), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def db():
+    psycopg2 = pytest.importorskip('psycopg2')
+    try:
+        conn = psycopg2.connect(connect_timeout=3, **DB_CONFIG)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"no database: {e}")
+    schema = f"test_columnar_{os.getpid()}"
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    cursor.execute(f"SET search_path TO {schema}")
+    with open(SCHEMA_SQL, encoding='utf-8') as f:
+        # The DDL; the file ends with ad hoc queries (and a TRUNCATE)
+        cursor.execute(f.read().split(SCHEMA_END)[0])
+    conn.commit()
+    yield conn
+    conn.rollback()
+    cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+    conn.commit()
+    conn.close()
+
+
+def test_parquet_keeps_the_sanitized_row_and_hash(ndjson, tmp_path):
+    out = str(tmp_path / 'parquet')
+    columnar.convert([ndjson], out)
+
+    rows = sorted(filter(None, map(sanitize_item, ITEMS)))
+    columns = [column for batch in columnar.read_batches(out, 100)
+               for column in [columnar.batch_columns(batch)]]
+    read = sorted(row for column in columns for row in zip(*column))
+    assert read == rows
+    assert sorted(content_hashes(list(zip(*read)))) == sorted(content_hashes(list(zip(*rows))))
+
+
+def test_columnar_load_matches_ndjson_import(db, ndjson, tmp_path):
+    cursor = db.cursor()
+    stats = import_ndjson_file(ndjson, db, mode='copy', progress=False)
+    assert stats['inserted'] == len(ITEMS)
+    cursor.execute(ROWS_SQL)
+    from_ndjson = cursor.fetchall()
+
+    cursor.execute("DELETE FROM archive_items")
+    db.commit()
+    out = str(tmp_path / 'parquet')
+    columnar.convert([ndjson], out)
+    stats = import_columnar(out, db)
+    assert stats['inserted'] == len(ITEMS) and stats['errors'] == 0
+    cursor.execute(ROWS_SQL)
+    assert cursor.fetchall() == from_ndjson
+
+    # Same hashes: importing the NDJSON again changes nothing
+    stats = import_ndjson_file(ndjson, db, mode='copy', progress=False)
+    assert stats['unchanged'] == len(ITEMS) and stats['updated'] == 0
+
+
+def test_columnar_load_stops_on_a_failed_commit(db, ndjson, tmp_path):
+    cursor = db.cursor()
+    # Passes every statement and fails the commit of the batch holding 'dict'
+    cursor.execute("""
+        CREATE FUNCTION reject_dict() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.identifier = 'dict' THEN
+                RAISE EXCEPTION 'rejected at commit';
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE CONSTRAINT TRIGGER reject_dict AFTER INSERT ON archive_items
+            DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION reject_dict();
+    """)
+    db.commit()
+    out = str(tmp_path / 'parquet')
+    columnar.convert([ndjson], out)
+
+    with pytest.raises(RuntimeError, match='rejected at commit'):
+        import_columnar(out, db, batch_size=1)
+    cursor.execute("SELECT count(*) FROM archive_items WHERE identifier = 'dict'")
+    assert cursor.fetchone()[0] == 0
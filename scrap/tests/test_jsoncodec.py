@@ -0,0 +1,60 @@
+"""Every installed jsoncodec backend accepts and writes the same values as the stdlib."""
+
+import json
+import math
+
+import pytest
+
+import jsoncodec
+
+CODECS = jsoncodec.available_codecs()
+
+VALUES = [
+    {'identifier': 'item', 'title': 'Ünïcode ✓', 'downloads': 12, 'subject': ['a', 'b']},
+    {'size': 2 ** 70, 'neg': -2 ** 65},
+    {'nan': float('nan'), 'inf': float('inf'), 'ninf': float('-inf')},
+    [None, {'nested': [1.5, float('nan')]}],
+    {'empty': [], 'null': None, 'text': 'null'},
+]
+
+LINES = [b'{"a": NaN}', b'{"a": Infinity, "b": -Infinity}', b'{"big": 123456789012345678901234567890}',
+         b'{"u": "\\u00e9\\ud83d\\ude00"}', b'[1, 2.5, "x", null, true]']
+
+
+def same(a, b):
+    """Equality that treats NaN as equal to NaN."""
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return type(a) is type(b) and a == b
+
+
+@pytest.mark.parametrize('codec', CODECS, ids=lambda c: c.name)
+@pytest.mark.parametrize('value', VALUES)
+def test_dumps_writes_stdlib_values(codec, value):
+    assert same(json.loads(codec.dumps(value)), value)
+    line = codec.dumps_line(value)
+    assert line.endswith(b'\n')
+    assert same(json.loads(line), value)
+
+
+@pytest.mark.parametrize('codec', CODECS, ids=lambda c: c.name)
+@pytest.mark.parametrize('line', LINES)
+def test_loads_accepts_stdlib_input(codec, line):
+    expected = json.loads(line)
+    if codec.name == 'orjson' and 'big' in expected:
+        # Documented: orjson reads integers beyond 64 bits as floats
+        expected['big'] = float(expected['big'])
+    assert same(codec.loads(line), expected)
+    assert same(codec.loads(memoryview(line)), expected)
+
+
+def test_unknown_backend_lists_the_choices(monkeypatch):
+    with pytest.raises(ValueError, match=r"'ojson'.*orjson\|ujson\|json"):
+        jsoncodec.get_codec('ojson')
+    monkeypatch.setenv('ECHONET_JSON', 'ojson')
+    with pytest.raises(ValueError, match=r'orjson\|ujson\|json'):
+        jsoncodec.default_codec()
@@ -0,0 +1,149 @@
+"""
+AdaptiveLimiter / TokenBucket against a local fake scrape API that can be
+switched between healthy, throttling (429), failing (503) and slow responses.
+The crawl has to back off on each kind of trouble and speed up again once the
+server is healthy.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import script
+
+PAGE = json.dumps({'items': [{'identifier': 'item'}], 'cursor': None}).encode()
+
+
+class FakeScrapeAPI(BaseHTTPRequestHandler):
+    # Shared by every handler thread: 'ok', 'throttle', 'error' or 'slow'
+    mode = 'ok'
+    slow_seconds = 0.15
+    hits = 0
+
+    def do_GET(self):
+        mode = type(self).mode
+        type(self).hits += 1
+        if mode == 'throttle':
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if mode == 'error':
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if mode == 'slow':
+            time.sleep(self.slow_seconds)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeScrapeAPI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    FakeScrapeAPI.mode = 'ok'
+    # Same control loop, on a test's time scale
+    monkeypatch.setattr(script, 'home_url', f"http://127.0.0.1:{server.server_port}/scrape")
+    monkeypatch.setattr(script, 'transport_retries', 1)
+    monkeypatch.setattr(script, 'transport_backoff', 0)
+    monkeypatch.setattr(script, 'max_tries', 2)
+    monkeypatch.setattr(script, 'retry_delay', lambda tries, wait=0.0: 0.01)
+    monkeypatch.setattr(script, 'backoff_cooldown', 0.05)
+    monkeypatch.setattr(script, 'latency_target', 0.1)
+    monkeypatch.setattr(script, 'min_rate', 25.0)
+    monkeypatch.setattr(script, 'max_rate', 500.0)
+    yield FakeScrapeAPI
+    server.shutdown()
+    server.server_close()
+
+
+async def crawl(session, limiter, pages, workers=4):
+    """Fetch pages with a few concurrent workers; returns how many succeeded."""
+    results = []
+
+    async def worker(n):
+        for _ in range(n):
+            results.append(await script.fetch(session, 'q', '*', limiter) is not None)
+
+    await asyncio.gather(*(worker(pages // workers) for _ in range(workers)))
+    return sum(results)
+
+
+def test_backs_off_on_trouble_and_recovers(api):
+    session = script.make_session()
+    limiter = script.AdaptiveLimiter(50.0, 4)
+    session.hooks['response'].append(limiter.response_hook)
+
+    async def run():
+        assert await crawl(session, limiter, 40) == 40
+        assert limiter.rate > 50.0 and limiter.limit > 4
+
+        for trouble in ('throttle', 'error'):
+            healthy_rate, healthy_limit = limiter.rate, limiter.limit
+            api.mode = trouble
+            hits = api.hits
+            assert await crawl(session, limiter, 4) == 0
+            assert limiter.rate < healthy_rate and limiter.limit < healthy_limit
+            # fetch() owns status retries: one HTTP request per try, none by the transport
+            assert api.hits - hits == 4 * script.max_tries
+
+            backed_off_rate, backed_off_limit = limiter.rate, limiter.limit
+            api.mode = 'ok'
+            assert await crawl(session, limiter, 20) == 20
+            assert limiter.rate > backed_off_rate and limiter.limit > backed_off_limit
+
+        # Latency over target backs off without a single failed page
+        api.mode = 'slow'
+        fast_rate, backoffs = limiter.rate, limiter.counters['backoffs']
+        assert await crawl(session, limiter, 16) == 16
+        assert limiter.counters['slow'] > 0
+        assert limiter.counters['backoffs'] > backoffs and limiter.rate < fast_rate
+
+    try:
+        asyncio.run(run())
+    finally:
+        session.close()
+
+
+def test_token_bucket_rate():
+    async def run():
+        bucket = script.TokenBucket(rate=50.0, burst=0.1)
+        started = time.monotonic()
+        for _ in range(30):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # The first 0.1s of tokens (5) are a burst; the other 25 come at 50/s
+    elapsed = asyncio.run(run())
+    assert 0.4 <= elapsed < 1.0
+
+
+def test_token_bucket_drains_when_the_rate_drops():
+    async def run():
+        bucket = script.TokenBucket(rate=100.0, burst=1.0)
+        assert bucket.tokens == 100.0
+        # A backoff: the full bucket must not still release 100 requests at once
+        bucket.rate = 10.0
+        assert bucket.capacity == 10.0 and bucket.tokens <= 10.0
+        started = time.monotonic()
+        for _ in range(15):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # 10 tokens left, the other 5 come at 10/s
+    elapsed = asyncio.run(run())
+    assert 0.4 <= elapsed < 0.8
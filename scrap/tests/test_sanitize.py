@@ -0,0 +1,94 @@
+"""
+sanitize_batch must return exactly what sanitize_item returns for every item,
+and parse_publicdate exactly what parse_publicdate_fallback returns. Items are
+generated at random from the awkward values the scraped files contain.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from import_to_db import (MAX_IDENTIFIER, MAX_LANGUAGE, parse_publicdate, parse_publicdate_fallback,
+                          sanitize_batch, sanitize_item)
+
+SEEDS = range(20)
+ITEMS_PER_SEED = 500
+
+PUBLICDATES = [
+    None, '', '   ', 'Unknown', 'unknown', '2021-12-06T02:06:08Z', '2021-12-06T02:06:08+02:00',
+    '2021-12-06T02:06:08.123456-05:30', '2021-12-06T02:06:08', '2021-12-06T02:06', '2021-12-06T',
+    '2021-12-06 02:06:08', '2021-12-06', ' 2021-12-06 ', '2021-13-06', '2021-02-30', '06-12-2021',
+    '6-1-2021', '12/06/2021', '2/30/2021', '2021/12/06', '2021/1/6', '06 Dec 2021', '6 December 2021',
+    '6 Decembre 2021', '2021', '0000', '9999-12-31T23:59:59-01:00', '0001-01-01T00:00:00+01:00',
+    '20211206', 'not a date', 2021, 2021.5, True, [], {},
+    datetime(2021, 12, 6, 2, 6, 8), datetime(2021, 12, 6, 2, 6, 8, tzinfo=timezone(timedelta(hours=-3))),
+]
+
+SUBJECTS = [
+    None, 'Unknown', '', '  ', 'plain', ' spaced ', '["a", "b"]', '"quoted"', '{"k": "v"}', '5', 'null',
+    '[1, {"x": 2}]', '[not json', [], ['a', 'b'], ['a', None, 3, {'x': 1}], {'k': 'v'}, 5, 3.5,
+    float('nan'), True,
+]
+
+TEXTS = [None, 'Unknown', '', ' x ', 'title\twith\ttabs\n', 'é' * 300, 0, 1.5, True, ['a'], {'a': 1}]
+NUMBERS = [None, 0, 7, -1, '12', ' 12 ', '1e3', '3.5', 'abc', '', 2.9, float('nan'), float('inf'), True, [1]]
+IDENTIFIERS = [None, '', 'Unknown', 'item', 'x' * (MAX_IDENTIFIER + 10), 0, 42, 'a b', True]
+URLS = [None, 'Unknown', 'https://archive.org/details/from-url', 'https://archive.org/details/from-url/file',
+        'https://archive.org/details/', 'https://example.org/', 5]
+NON_OBJECTS = [None, [1, 2], 'x', 5, 1.5, True, []]
+
+
+def random_item(rng):
+    if rng.random() < 0.05:
+        return rng.choice(NON_OBJECTS)
+    item = {}
+    fields = {
+        'identifier': IDENTIFIERS,
+        'url': URLS,
+        'title': TEXTS,
+        'description': TEXTS,
+        'language': TEXTS + ['eng', ' English ', 'x' * (MAX_LANGUAGE + 5)],
+        'item_size': NUMBERS,
+        'downloads': NUMBERS,
+        'btih': TEXTS,
+        'mediatype': TEXTS + ['texts', 'movies'],
+        'subject': SUBJECTS,
+        'publicdate': PUBLICDATES,
+    }
+    for name, values in fields.items():
+        # Leave some fields out altogether
+        if rng.random() < 0.85:
+            item[name] = rng.choice(values)
+    return item
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_sanitize_batch_matches_sanitize_item(seed):
+    rng = random.Random(seed)
+    items = [random_item(rng) for _ in range(ITEMS_PER_SEED)]
+
+    keep, columns = sanitize_batch(items)
+
+    rows = [sanitize_item(item) for item in items]
+    assert keep == [i for i, row in enumerate(rows) if row is not None]
+    assert list(zip(*columns)) == [row for row in rows if row is not None]
+
+
+def test_sanitize_skips_non_objects():
+    items = NON_OBJECTS + [{'identifier': 'kept'}]
+    keep, columns = sanitize_batch(items)
+    assert keep == [len(NON_OBJECTS)]
+    assert columns[0] == ['kept']
+    assert all(sanitize_item(item) is None for item in NON_OBJECTS)
+
+
+@pytest.mark.parametrize('value', PUBLICDATES)
+def test_parse_publicdate_matches_fallback(value):
+    assert parse_publicdate(value) == parse_publicdate_fallback(value)
+
+
+def test_publicdate_is_naive_utc():
+    rows = [sanitize_item({'identifier': 'a', 'publicdate': s})
+            for s in ('2020-12-31T23:00:00-05:00', '2021-01-01T04:00:00Z', '2021-01-01 04:00:00')]
+    assert {row[-2] for row in rows} == {datetime(2021, 1, 1, 4)}